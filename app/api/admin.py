@@ -0,0 +1,59 @@
+import os
+import secrets
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from pydantic import BaseModel, Field
+from app.services import etl_jobs
+
+# Disabled unless ADMIN_TOKEN is set; requests then need "Authorization: Bearer <ADMIN_TOKEN>"
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def require_admin(authorization: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not secrets.compare_digest(token.strip(), ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+class LoadRequest(BaseModel):
+    paths: List[str] = Field(..., min_length=1, description="Files or glob patterns under ETL_DATA_DIR")
+    incremental: bool = False
+    year: Optional[int] = Field(None, description="CMS data year for every file (defaults to the DYxx in each name)")
+
+
+@router.post("/loads", status_code=202)
+async def start_load(request: LoadRequest):
+    # Full loads are built in a shadow schema and swapped in; poll GET /admin/jobs/{id} for progress
+    try:
+        return etl_jobs.start_load(request.paths, request.incremental, request.year)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+
+@router.post("/rollback", status_code=202)
+async def start_rollback():
+    # Swaps back the tables replaced by the last full load
+    try:
+        return etl_jobs.start_rollback()
+    except RuntimeError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+
+
+@router.get("/jobs")
+async def list_jobs():
+    return etl_jobs.list_jobs()
+
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = etl_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job
@@ -1,51 +1,166 @@
-from fastapi import APIRouter, Request
-from pydantic import BaseModel
+import asyncio
+import os
+from typing import List, Optional
+from fastapi import APIRouter, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
 from app.services.openai_service import nl_to_sql, is_in_scope
-from app.db.models import Provider, Procedure
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
-from dotenv import load_dotenv
+from app.services.single_flight import SingleFlight
+from app.services.drg_search import set_similarity_threshold, drg_vocabulary
+from app.services import intent_parser
+from app.services.sql_cache import sql_cache
+from app.services.llm_client import LLMUnavailableError
+from app.services.sql_guard import validate_sql, prepare_session, check_plan_cost, UnsafeSQLError, SQL_MAX_ROWS, SQL_STREAM_MAX_ROWS
+from app.services import dataset, metrics, streaming
 from sqlalchemy import text
-import os
 import logging
 
 router = APIRouter(prefix="/ask", tags=["ask"])
 
-load_dotenv()
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_async_engine(DATABASE_URL, echo=False)
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+ask_flight = SingleFlight()
+sql_flight = SingleFlight()
+
+ASK_BATCH_MAX_QUESTIONS = int(os.getenv("ASK_BATCH_MAX_QUESTIONS", "10000"))
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "16"))
 
 class AskRequest(BaseModel):
     question: str
 
+class AskBatchRequest(BaseModel):
+    questions: List[str] = Field(..., min_length=1, max_length=ASK_BATCH_MAX_QUESTIONS)
+
 @router.post("")
-async def ask(request: AskRequest):
+async def ask(request: AskRequest, accept: Optional[str] = Header(None)):
+    stream_format = streaming.requested_format(accept)
+    if stream_format is not None:
+        # Rows go out as they are fetched; errors and refusals are still plain JSON
+        result = await answer_question(request.question, stream_format)
+        return result if isinstance(result, dict) else streaming.response(result, stream_format)
+    # Identical questions asked concurrently share one LLM call and one query execution
+    key = " ".join(request.question.lower().split())
+    result = await ask_flight.do(key, lambda: answer_question(request.question))
+    with metrics.stage("serialize"):
+        return JSONResponse(jsonable_encoder(result))
+
+@router.post("/batch")
+async def ask_batch(request: AskBatchRequest):
+    # NDJSON, one line per question in completion order: {"index", "question", "answer"/"error", ...}
+    return streaming.response(batch_answers(request.questions), streaming.NDJSON)
+
+async def batch_answers(questions: list):
+    # Each distinct question is answered once; at most ASK_BATCH_CONCURRENCY are planned and run at a time
+    positions = {}
+    for i, question in enumerate(questions):
+        positions.setdefault(" ".join(question.lower().split()), []).append(i)
+    semaphore = asyncio.Semaphore(ASK_BATCH_CONCURRENCY)
+
+    async def answer_one(key: str, question: str):
+        async with semaphore:
+            return key, await ask_flight.do(key, lambda: answer_question(question))
+
+    tasks = [asyncio.ensure_future(answer_one(key, questions[indexes[0]])) for key, indexes in positions.items()]
     try:
-        logging.info(f"Received question: {request.question}")
-        if not is_in_scope(request.question):
-            return {"answer": "I can only help with hospital pricing and quality information. Please ask about medical procedures, costs, or hospital ratings."}
-        sql_query = await nl_to_sql(request.question)
-        logging.info(f"Generated SQL: {sql_query}")
-        logging.info(f"SQL type: {type(sql_query)}")
-        if not isinstance(sql_query, str):
-            logging.error(f"nl_to_sql did not return a string. Got: {type(sql_query)} - {sql_query}")
-            return {"error": f"nl_to_sql did not return a string. Got: {type(sql_query)} - {sql_query}"}
-        if not sql_query.strip():
-            logging.error(f"OpenAI returned an empty SQL string.")
-            return {"error": "OpenAI returned an empty SQL string."}
+        for next_done in asyncio.as_completed(tasks):
+            key, result = await next_done
+            for i in positions[key]:
+                yield {"index": i, "question": questions[i], **result}
+    finally:
+        # Client went away: stop what has not started (shielded in-flight work finishes for its other waiters)
+        for task in tasks:
+            task.cancel()
+
+async def iterate(items):
+    for item in items:
+        yield item
+
+async def stream_rows(question: str, sql_query: str, cache: bool):
+    # Runs the already validated and cost-checked SQL again on its own session, through a server-side cursor
+    async with dataset.read_sessionmaker()() as session:
+        await prepare_session(session)
+        await set_similarity_threshold(session)
+        result = await session.stream(text(sql_query))
+        async for row in result:
+            yield dict(row._mapping)
+    if cache:
+        await sql_cache.set(question, sql_query)
+
+async def check_sql(session, sql_query: str):
+    await prepare_session(session)
+    # Generated fuzzy queries use the `%` operator, which reads this setting
+    await set_similarity_threshold(session)
+    await check_plan_cost(session, sql_query)
+
+async def run_sql(sql_query: str) -> list:
+    # Own session, so concurrent questions run on separate pool connections
+    async with dataset.read_sessionmaker()() as session:
+        await check_sql(session, sql_query)
+        rows = (await session.execute(text(sql_query))).fetchall()
+        logging.debug("SQL result rows: %s", rows)
+        return [dict(row._mapping) for row in rows]
+
+async def answer_question(question: str, stream_format: Optional[str] = None):
+    # Returns the JSON answer, or for streamed requests an async iterator of rows (errors stay dicts)
+    async with dataset.read_sessionmaker()() as session:
         try:
-            stmt = text(sql_query)
-            logging.info(f"Executing SQL statement: {stmt}")
-            async with async_session() as session:
-                result = await session.execute(stmt)
-                rows = result.fetchall()
-                logging.info(f"SQL result rows: {rows}")
-                answer = [dict(row._mapping) for row in rows]
-                return {"answer": answer}
-        except Exception as db_exc:
-            logging.error(f"DB error: {db_exc}", exc_info=True)
-            return {"error": "There was a problem processing your request. Please try again or contact support if the issue persists."}
-    except Exception as exc:
-        logging.error(f"OpenAI or other error: {exc}", exc_info=True)
-        return {"error": f"Internal error: {exc}"}
+            logging.info(f"Received question: {question}")
+            with metrics.stage("scope"):
+                in_scope = is_in_scope(question)
+            if not in_scope:
+                return {"answer": "I can only help with hospital pricing and quality information. Please ask about medical procedures, costs, or hospital ratings."}
+            # Common question shapes are answered by a local parser, without the LLM
+            with metrics.stage("parse"):
+                intent = intent_parser.parse(question, drg_vocabulary)
+            if intent is not None:
+                logging.info(f"Fast path intent: {intent}")
+                with metrics.stage("db"):
+                    answer = await intent_parser.answer(session, intent)
+                if stream_format is not None:
+                    return iterate(answer)
+                return {"answer": answer, "path": "fast_path"}
+            # Reuse the SQL template of an equivalent earlier question and skip the LLM
+            with metrics.stage("cache"):
+                cached_sql = await sql_cache.get(question)
+            sql_query = cached_sql
+            if sql_query is None:
+                with metrics.stage("llm"):
+                    sql_query = await nl_to_sql(question)
+            # SQL text and result rows are only formatted when DEBUG is on
+            logging.debug("Generated SQL: %s", sql_query)
+            if not isinstance(sql_query, str):
+                logging.error(f"nl_to_sql did not return a string. Got: {type(sql_query)} - {sql_query}")
+                return {"error": f"nl_to_sql did not return a string. Got: {type(sql_query)} - {sql_query}"}
+            if not sql_query.strip():
+                logging.error(f"OpenAI returned an empty SQL string.")
+                return {"error": "OpenAI returned an empty SQL string."}
+            try:
+                # Single read-only SELECT over the whitelisted tables, with a row cap
+                with metrics.stage("guard"):
+                    sql_query = validate_sql(sql_query, SQL_STREAM_MAX_ROWS if stream_format else SQL_MAX_ROWS)
+                logging.debug("Executing SQL statement: %s", sql_query)
+                with metrics.stage("db"):
+                    if stream_format is not None:
+                        await check_sql(session, sql_query)
+                        return stream_rows(question, sql_query, cache=cached_sql is None)
+                    # Different questions that turn into the same SQL (typical for /ask/batch) share one execution
+                    answer = await sql_flight.do(sql_query, lambda: run_sql(sql_query))
+                # Only SQL that executed successfully is worth caching
+                if cached_sql is None:
+                    await sql_cache.set(question, sql_query)
+                return {"answer": answer, "path": "cache" if cached_sql is not None else "llm"}
+            except UnsafeSQLError as unsafe_exc:
+                logging.warning(f"Rejected generated SQL: {unsafe_exc}")
+                return {"error": f"The generated query was rejected: {unsafe_exc}"}
+            except Exception as db_exc:
+                logging.error(f"DB error: {db_exc}", exc_info=True)
+                return {"error": "There was a problem processing your request. Please try again or contact support if the issue persists."}
+        except LLMUnavailableError as exc:
+            logging.warning(f"LLM unavailable: {exc}")
+            return {"error": "The AI assistant is temporarily unavailable. Please try again shortly."}
+        except Exception as exc:
+            logging.error(f"OpenAI or other error: {exc}", exc_info=True)
+            return {"error": f"Internal error: {exc}"}
+
+@router.get("/cache")
+async def cache_stats():
+    return sql_cache.stats()
@@ -0,0 +1,17 @@
+from fastapi import APIRouter, Query, Request
+from app.services import drg_suggest, http_cache
+
+router = APIRouter(prefix="/drgs", tags=["drgs"])
+
+@router.get("/suggest")
+async def suggest_drgs(
+    request: Request,
+    q: str = Query(..., min_length=1, description="Partial DRG code or description, typos allowed"),
+    limit: int = Query(drg_suggest.DEFAULT_SUGGESTIONS, ge=1, le=drg_suggest.MAX_SUGGESTIONS, description="Maximum suggestions")
+):
+    # Served from memory, no DB round trip per keystroke
+    async def suggestions():
+        index = await drg_suggest.get_index()
+        return index.suggest(q, limit), {}
+
+    return await http_cache.cached_response(request, {"q": " ".join(q.lower().split()), "limit": limit}, suggestions)
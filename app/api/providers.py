@@ -1,69 +1,382 @@
-from fastapi import APIRouter, Query
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker, selectinload
-from sqlalchemy import select, func
-from app.db.models import Provider, Procedure
+import math
 import os
-from dotenv import load_dotenv
-
-load_dotenv()
+from typing import List, Optional
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from pydantic import BaseModel, Field
+from sqlalchemy import select, func, literal, tuple_, column, case, and_, or_, any_, Boolean, Float, Integer, String
+from sqlalchemy.dialects.postgresql import ARRAY
+from app.db.models import Provider, Procedure, Drg, ZipCentroid
+from app.services.geo import bounding_box, haversine_km_expr
+from app.services.drg_search import drg_match, set_similarity_threshold
+from app.services.single_flight import SingleFlight
+from app.services import columnar, dataset, http_cache, streaming
+from app.services.pagination import (
+    PROVIDERS_PAGE_SIZE, PROVIDERS_MAX_PAGE_SIZE, InvalidCursorError, query_fingerprint, encode_cursor, decode_cursor,
+)
 
 router = APIRouter(prefix="/providers", tags=["providers"])
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-engine = create_async_engine(DATABASE_URL, echo=False)
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+# Identical concurrent searches share one DB round trip
+provider_flight = SingleFlight()
+STREAM_BATCH_SIZE = 1000
+PROVIDERS_BATCH_MAX_ITEMS = int(os.getenv("PROVIDERS_BATCH_MAX_ITEMS", "500"))
+
+class BatchItem(BaseModel):
+    drg: str
+    zip: str
+    radius_km: int = Field(40, ge=0)
+    match_type: str = "substring"
+    sort: str = "price"
+    limit: Optional[int] = Field(None, ge=1)
+    year: Optional[int] = None
+
+class BatchRequest(BaseModel):
+    items: List[BatchItem] = Field(..., min_length=1, max_length=PROVIDERS_BATCH_MAX_ITEMS)
 
 @router.get("")
 async def get_providers(
+    request: Request,
     drg: str = Query(..., description="DRG code or description (substring/fuzzy/fulltext match supported)"),
     zip: str = Query(..., description="ZIP code for search"),
-    radius_km: int = Query(40, description="Search radius in km"),
-    match_type: str = Query("substring", description="Match type: substring, fuzzy, or fulltext")
+    radius_km: int = Query(40, ge=0, description="Search radius in km"),
+    match_type: str = Query("substring", description="Match type: substring, fuzzy, or fulltext"),
+    sort: str = Query("price", description="Sort order: price or distance"),
+    limit: Optional[int] = Query(None, ge=1, description=f"Procedures per page (default {PROVIDERS_PAGE_SIZE}, at most {PROVIDERS_MAX_PAGE_SIZE})"),
+    cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+    year: Optional[int] = Query(None, description="CMS data year (default: the latest loaded year)"),
+    accept: Optional[str] = Header(None, description="application/x-ndjson or text/csv streams every row")
 ):
-    SIMILARITY_THRESHOLD = 0.1
-    async with async_session() as session:
-        if match_type == "fuzzy":
-            drg_filter = func.similarity(Procedure.ms_drg_definition, drg) > SIMILARITY_THRESHOLD
-            order_by = [func.similarity(Procedure.ms_drg_definition, drg).desc(), Procedure.average_covered_charges]
-        elif match_type == "fulltext":
-            # Full-text search (optional, fallback to substring if not implemented)
-            drg_filter = func.to_tsvector('english', Procedure.ms_drg_definition).match(drg)
-            order_by = [Procedure.average_covered_charges]
-        else:  # substring
-            drg_filter = Procedure.ms_drg_definition.ilike(f"%{drg}%")
-            order_by = [Procedure.average_covered_charges]
-        stmt = (
-            select(Provider, Procedure)
-            .join(Procedure)
-            .where(
-                Provider.zip_code == zip,
-                drg_filter
-            )
-            .order_by(*order_by)
+    params = dict(
+        drg=drg.strip(), zip=zip.strip(), radius_km=radius_km, match_type=match_type, sort=sort,
+        year=resolve_year(year),
+    )
+    stream_format = streaming.requested_format(accept)
+    if stream_format is not None:
+        # Extracts: every row from the cursor on (or `limit` rows), no page cap, straight from a DB cursor
+        if cursor is not None:
+            try:
+                decode_cursor(cursor, search_fingerprint(**params))
+            except InvalidCursorError as exc:
+                raise HTTPException(status_code=400, detail=str(exc))
+        rows = stream_search(**params, limit=limit, cursor=cursor)
+        if stream_format == streaming.NDJSON:
+            return streaming.response(group_rows(rows), stream_format)
+        return streaming.response(rows, stream_format, columns=ROW_COLUMNS)
+    params.update(limit=min(limit or PROVIDERS_PAGE_SIZE, PROVIDERS_MAX_PAGE_SIZE), cursor=cursor)
+
+    async def page():
+        try:
+            store = columnar.store
+            result = store.search(**params) if store is not None else None  # None means this query needs SQL
+            if result is None:
+                # DRG matching is case-insensitive in every mode, so the key can be too
+                key = (
+                    params["drg"].lower(), params["zip"], radius_km, match_type, sort, params["year"], params["limit"], cursor
+                )
+                result = await provider_flight.do(key, lambda: run_search(**params))
+        except InvalidCursorError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        providers, next_cursor = result
+        return providers, {"X-Next-Cursor": next_cursor} if next_cursor else {}
+
+    # Same search, same dataset version: same ETag, served by the client, a CDN or the response cache
+    return await http_cache.cached_response(request, {**params, "drg": params["drg"].lower()}, page, vary="Accept")
+
+@router.post("/batch")
+async def get_providers_batch(request: BatchRequest):
+    # One {"providers", "next_cursor"} per item, in input order; each is the page GET /providers would return
+    searches = {}
+    keys = []
+    for item in request.items:
+        params = dict(
+            drg=item.drg.strip(), zip=item.zip.strip(), radius_km=item.radius_km, match_type=item.match_type,
+            sort=item.sort, year=resolve_year(item.year),
+            limit=min(item.limit or PROVIDERS_PAGE_SIZE, PROVIDERS_MAX_PAGE_SIZE),
+        )
+        key = (
+            params["drg"].lower(), params["zip"], item.radius_km, item.match_type, item.sort, params["year"], params["limit"]
+        )
+        searches.setdefault(key, params)
+        keys.append(key)
+    results = {}
+    store = columnar.store
+    if store is not None:
+        for key, params in searches.items():
+            result = store.search(**params)
+            if result is not None:
+                results[key] = result
+    # Everything the columnar store could not answer goes to Postgres as one statement
+    pending = [key for key in searches if key not in results]
+    if pending:
+        async with dataset.read_sessionmaker()() as session:
+            pages = await search_batch(session, [searches[key] for key in pending])
+        results.update(zip(pending, pages))
+    return [{"providers": results[key][0], "next_cursor": results[key][1]} for key in keys]
+
+def resolve_year(year: Optional[int]) -> Optional[int]:
+    # One year at a time, so a search only reads that year's procedures partitions; None before any load
+    return year if year is not None else dataset.latest_data_year
+
+async def run_search(**params):
+    # Own session rather than a request-scoped one: the result may outlive the request that started it
+    async with dataset.read_sessionmaker()() as session:
+        return await search_providers(session, **params)
+
+async def stream_search(limit: Optional[int] = None, cursor: Optional[str] = None, **params):
+    # Server-side cursor: rows are fetched in batches as the client reads them
+    async with dataset.read_sessionmaker()() as session:
+        stmt, _, _ = await build_search(session, **params, cursor=cursor)
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        result = await session.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for row in result:
+            yield flat_row(row)
+
+def search_fingerprint(drg: str, zip: str, radius_km: int, match_type: str, sort: str,
+                       year: Optional[int] = None) -> str:
+    return query_fingerprint(drg=drg.lower(), zip=zip, radius_km=radius_km, match_type=match_type, sort=sort, year=year)
+
+async def build_search(session, drg: str, zip: str, radius_km: int, match_type: str, sort: str,
+                       year: Optional[int] = None, cursor: Optional[str] = None):
+    # Returns (ordered statement, key column names, fingerprint). Rows come grouped by provider, providers
+    # ordered by their first row, so a provider cut by a page boundary continues on the next page.
+    fingerprint = search_fingerprint(drg, zip, radius_km, match_type, sort, year)
+    drg_filter, order_by = drg_match(match_type, drg)
+    year_filter = [Procedure.data_year == year] if year is not None else []
+    if match_type == "fuzzy":
+        await set_similarity_threshold(session)
+    center = (await session.execute(
+        select(ZipCentroid.latitude, ZipCentroid.longitude).where(ZipCentroid.zip_code == zip)
+    )).first()
+    if center is not None:
+        # Bounding-box prefilter on the indexed lat/lon columns, exact haversine on what is left
+        lat, lon = center
+        min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+        distance = haversine_km_expr(lat, lon, Provider.latitude, Provider.longitude)
+        location_filter = [
+            Provider.latitude.between(min_lat, max_lat),
+            Provider.longitude.between(min_lon, max_lon),
+            distance <= radius_km,
+        ]
+    else:
+        # Unknown ZIP: no centroid to measure from, fall back to an exact ZIP match
+        distance = literal(None, Float)
+        location_filter = [Provider.zip_code == zip]
+    # Keyset: (provider's first-row key, provider, row key, procedure); every term ascending
+    first_row = dict(partition_by=Provider.id, order_by=[*order_by, Procedure.id])
+    provider_keys = [func.first_value(key).over(**first_row) for key in order_by]
+    if sort == "distance" and center is not None:
+        provider_keys.insert(0, distance)
+    keys = [*provider_keys, Provider.id, *order_by, Procedure.id]
+    key_names = [f"key_{i}" for i in range(len(keys))]
+    matches = (
+        select(
+            Provider.provider_id, Provider.name, Provider.city, Provider.state, Provider.zip_code,
+            Provider.star_rating, distance.label("distance_km"), Drg.description.label("ms_drg_definition"),
+            Procedure.total_discharges, Procedure.average_covered_charges,
+            Procedure.average_total_payments, Procedure.average_medicare_payments,
+            *(key.label(key_names[i]) for i, key in enumerate(keys)),
         )
-        result = await session.execute(stmt)
-        rows = result.all()
-        # Group only matching procedures by provider
-        providers_dict = {}
-        for provider, procedure in rows:
-            if provider.provider_id not in providers_dict:
-                providers_dict[provider.provider_id] = {
-                    "provider_id": provider.provider_id,
-                    "name": provider.name,
-                    "city": provider.city,
-                    "state": provider.state,
-                    "zip_code": provider.zip_code,
-                    "star_rating": round(provider.star_rating, 1),
-                    "procedures": []
-                }
-            # Only append the procedure from the filtered SQL result
-            providers_dict[provider.provider_id]["procedures"].append({
-                "ms_drg_definition": procedure.ms_drg_definition,
-                "total_discharges": procedure.total_discharges,
-                "average_covered_charges": procedure.average_covered_charges,
-                "average_total_payments": procedure.average_total_payments,
-                "average_medicare_payments": procedure.average_medicare_payments
-            })
-        # Remove providers with no matching procedures (shouldn't happen, but for safety)
-        return [p for p in providers_dict.values() if p["procedures"]]
+        .select_from(Provider)
+        .join(Provider.procedures)
+        .join(Procedure.drg)
+        .where(
+            *location_filter,
+            *year_filter,
+            drg_filter
+        )
+        .subquery()
+    )
+    key_columns = [matches.c[name] for name in key_names]
+    stmt = select(matches).order_by(*key_columns)
+    if cursor is not None:
+        after = decode_cursor(cursor, fingerprint)
+        if len(after) != len(key_columns):
+            raise InvalidCursorError("cursor does not belong to this search")
+        stmt = stmt.where(tuple_(*key_columns) > tuple_(*(literal(value) for value in after)))
+    return stmt, key_names, fingerprint
+
+async def search_providers(session, drg: str, zip: str, radius_km: int, match_type: str, sort: str,
+                           year: Optional[int] = None, limit: int = PROVIDERS_PAGE_SIZE, cursor: Optional[str] = None):
+    # Returns (providers, next_cursor)
+    stmt, key_names, fingerprint = await build_search(session, drg, zip, radius_km, match_type, sort, year, cursor)
+    rows = (await session.execute(stmt.limit(limit + 1))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], name) for name in key_names], fingerprint)
+    # Group only matching procedures by provider
+    providers_dict = {}
+    for row in rows:
+        if row.provider_id not in providers_dict:
+            providers_dict[row.provider_id] = provider_entry(row)
+        providers_dict[row.provider_id]["procedures"].append(procedure_entry(row))
+    return list(providers_dict.values()), next_cursor
+
+async def search_batch(session, searches: list) -> list:
+    # All searches in one statement: the items go in as arrays and each one is its own window
+    # partition. Returns (providers, next_cursor) per search, exactly as search_providers would.
+    centers = {
+        zip_code: (lat, lon)
+        for zip_code, lat, lon in await session.execute(
+            select(ZipCentroid.zip_code, ZipCentroid.latitude, ZipCentroid.longitude)
+            .where(ZipCentroid.zip_code.in_({params["zip"] for params in searches}))
+        )
+    }
+    rows = []
+    for i, params in enumerate(searches):
+        match_type = params["match_type"] if params["match_type"] in ("fuzzy", "fulltext") else "substring"
+        center = centers.get(params["zip"])
+        if center is not None:
+            lat, lon = center
+            geometry = (lat, lon, math.cos(math.radians(lat)), *bounding_box(lat, lon, params["radius_km"]))
+        else:
+            geometry = (None,) * 7
+        by_distance = params["sort"] == "distance" and center is not None
+        year = resolve_year(params["year"])
+        rows.append((
+            i, params["drg"], match_type, params["zip"], year, *geometry, params["radius_km"], by_distance,
+            params["limit"],
+        ))
+    # unnest() of one array per column keeps the statement text (and its prepared plan) the same for any batch size
+    item_columns = [
+        column("item", Integer), column("drg", String), column("match_type", String), column("zip", String),
+        column("data_year", Integer), column("lat", Float), column("lon", Float), column("cos_lat", Float),
+        column("min_lat", Float), column("max_lat", Float), column("min_lon", Float), column("max_lon", Float),
+        column("radius_km", Integer), column("by_distance", Boolean), column("page_limit", Integer),
+    ]
+    items = func.unnest(*(
+        literal(list(values), ARRAY(item_column.type)) for item_column, values in zip(item_columns, zip(*rows))
+    )).table_valued(*item_columns).render_derived(name="items")
+    if any(row[2] == "fuzzy" for row in rows):
+        await set_similarity_threshold(session)
+    # Every item normally names its year: a plain equality per item, plus the batch's years as one array
+    # the planner prunes procedures partitions with. Before any load there is no latest year, and an item
+    # without one searches every year, as GET /providers does.
+    years = {row[4] for row in rows}
+    if None not in years:
+        year_filter = [
+            Procedure.data_year == items.c.data_year,
+            Procedure.data_year == any_(literal(sorted(years), ARRAY(Integer))),
+        ]
+    elif years != {None}:
+        year_filter = [or_(items.c.data_year.is_(None), Procedure.data_year == items.c.data_year)]
+    else:
+        year_filter = []
+
+    # Per-item versions of the location filter and drg_match(); an unknown ZIP falls back to an exact match
+    distance = haversine_km_expr(items.c.lat, items.c.lon, Provider.latitude, Provider.longitude, items.c.cos_lat)
+    location_filter = or_(
+        and_(
+            items.c.lat.is_not(None),
+            Provider.latitude.between(items.c.min_lat, items.c.max_lat),
+            Provider.longitude.between(items.c.min_lon, items.c.max_lon),
+            distance <= items.c.radius_km,
+        ),
+        and_(items.c.lat.is_(None), Provider.zip_code == items.c.zip),
+    )
+    drg_filter = or_(
+        and_(items.c.match_type == "fuzzy", Drg.description.op('%')(items.c.drg)),
+        and_(items.c.match_type == "fulltext",
+             Drg.description_tsv.op('@@')(func.plainto_tsquery('english', items.c.drg))),
+        and_(items.c.match_type == "substring", Drg.description.ilike('%' + items.c.drg + '%')),
+    )
+    # build_search's keys; the similarity and distance terms are constant for items that do not use them
+    rank = case((items.c.match_type == "fuzzy", -func.similarity(Drg.description, items.c.drg)), else_=0.0)
+    order_by = [rank, Procedure.average_covered_charges]
+    first_row = dict(partition_by=[items.c.item, Provider.id], order_by=[*order_by, Procedure.id])
+    keys = [
+        case((items.c.by_distance, distance), else_=0.0),
+        *(func.first_value(key).over(**first_row) for key in order_by),
+        Provider.id, *order_by, Procedure.id,
+    ]
+    key_names = [f"key_{i}" for i in range(len(keys))]
+    matches = (
+        select(
+            items.c.item, items.c.page_limit,
+            Provider.provider_id, Provider.name, Provider.city, Provider.state, Provider.zip_code,
+            Provider.star_rating, distance.label("distance_km"), Drg.description.label("ms_drg_definition"),
+            Procedure.total_discharges, Procedure.average_covered_charges,
+            Procedure.average_total_payments, Procedure.average_medicare_payments,
+            *(key.label(key_names[i]) for i, key in enumerate(keys)),
+        )
+        .select_from(items)
+        .join(Provider, location_filter)
+        .join(Procedure, and_(Procedure.provider_id == Provider.id, *year_filter))
+        .join(Drg, and_(Drg.id == Procedure.drg_id, drg_filter))
+        .subquery()
+    )
+    ranked = select(
+        matches,
+        func.row_number().over(partition_by=matches.c.item, order_by=[matches.c[name] for name in key_names]).label("n"),
+    ).subquery()
+    stmt = select(ranked).where(ranked.c.n <= ranked.c.page_limit + 1).order_by(ranked.c.item, ranked.c.n)
+
+    pages = [({}, None) for _ in searches]
+    for row in await session.execute(stmt):
+        params = searches[row.item]
+        providers_dict, _ = pages[row.item]
+        if row.n <= row.page_limit:
+            if row.provider_id not in providers_dict:
+                providers_dict[row.provider_id] = provider_entry(row)
+            providers_dict[row.provider_id]["procedures"].append(procedure_entry(row))
+            last = row
+            continue
+        # One row past the page: the cursor holds the last row's keys, as GET /providers encodes them
+        match_type, by_distance = rows[row.item][2], rows[row.item][-2]
+        cursor_keys = [getattr(last, name) for name in key_names]
+        if match_type != "fuzzy":
+            del cursor_keys[4], cursor_keys[1]
+        if not by_distance:
+            del cursor_keys[0]
+        fingerprint = search_fingerprint(
+            params["drg"], params["zip"], params["radius_km"], params["match_type"], params["sort"], rows[row.item][4]
+        )
+        pages[row.item] = (providers_dict, encode_cursor(cursor_keys, fingerprint))
+    return [(list(providers_dict.values()), next_cursor) for providers_dict, next_cursor in pages]
+
+def provider_entry(row) -> dict:
+    return {
+        "provider_id": row.provider_id,
+        "name": row.name,
+        "city": row.city,
+        "state": row.state,
+        "zip_code": row.zip_code,
+        "star_rating": round(row.star_rating, 1),
+        "distance_km": round(row.distance_km, 1) if row.distance_km is not None else None,
+        "procedures": []
+    }
+
+def procedure_entry(row) -> dict:
+    return {
+        "ms_drg_definition": row.ms_drg_definition,
+        "total_discharges": row.total_discharges,
+        "average_covered_charges": row.average_covered_charges,
+        "average_total_payments": row.average_total_payments,
+        "average_medicare_payments": row.average_medicare_payments
+    }
+
+# CSV extracts: one line per procedure with its provider's columns
+ROW_COLUMNS = [
+    "provider_id", "name", "city", "state", "zip_code", "star_rating", "distance_km",
+    "ms_drg_definition", "total_discharges", "average_covered_charges",
+    "average_total_payments", "average_medicare_payments",
+]
+
+def flat_row(row) -> dict:
+    provider = provider_entry(row)
+    del provider["procedures"]
+    return {**provider, **procedure_entry(row)}
+
+async def group_rows(rows):
+    # Rows arrive grouped by provider, so one provider object can be emitted as soon as the next starts
+    current = None
+    async for row in rows:
+        if current is None or current["provider_id"] != row["provider_id"]:
+            if current is not None:
+                yield current
+            current = {key: row[key] for key in ROW_COLUMNS[:7]}
+            current["procedures"] = []
+        current["procedures"].append({key: row[key] for key in ROW_COLUMNS[7:]})
+    if current is not None:
+        yield current
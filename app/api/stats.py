@@ -0,0 +1,30 @@
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from app.db.session import get_sessionmaker
+from app.services import http_cache
+from app.services.stats import price_stats
+
+router = APIRouter(prefix="/stats", tags=["stats"])
+
+@router.get("")
+async def get_stats(
+    request: Request,
+    drg: str = Query(..., description="DRG code or description (substring/fuzzy/fulltext match supported)"),
+    match_type: str = Query("substring", description="Match type: substring, fuzzy, or fulltext"),
+    state: Optional[str] = Query(None, description="Two-letter state; per-state rows for every state if omitted"),
+    zip: Optional[str] = Query(None, description="ZIP code or 3-digit ZIP prefix; returns per-ZIP3 rows"),
+    year: Optional[int] = Query(None, description="CMS data year; every loaded year if omitted")
+):
+    zip3 = None
+    if zip is not None:
+        zip3 = zip.strip()[:3]
+        if len(zip3) != 3 or not zip3.isdigit():
+            raise HTTPException(status_code=400, detail="zip must start with three digits")
+    params = dict(drg=drg.strip(), match_type=match_type, state=state.strip().upper() if state else None, zip3=zip3, year=year)
+
+    async def rows():
+        # Reads the precomputed views, refreshed at the end of every ETL run
+        async with get_sessionmaker()() as session:
+            return await price_stats(session, **params), {}
+
+    return await http_cache.cached_response(request, {**params, "drg": params["drg"].lower()}, rows)
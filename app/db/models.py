@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, Computed, UniqueConstraint, func
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -12,15 +13,59 @@ class Provider(Base):
     state = Column(String)
     zip_code = Column(String, index=True)
     star_rating = Column(Float)  # Mock rating 1-10
+    latitude = Column(Float)  # ZIP centroid, see zip_centroids
+    longitude = Column(Float)
     procedures = relationship("Procedure", back_populates="provider")
+    __table_args__ = (
+        Index("ix_providers_lat_lon", "latitude", "longitude"),
+    )
+
+class Drg(Base):
+    # One row per MS-DRG; text search runs here instead of over every procedure row
+    __tablename__ = "drgs"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    code = Column(String)  # DRG_Cd, e.g. "039"; NULL for rows migrated without one
+    description = Column(String, nullable=False)  # DRG_Desc, served as ms_drg_definition
+    description_tsv = Column(TSVECTOR, Computed("to_tsvector('english', coalesce(description, ''))", persisted=True))
+    procedures = relationship("Procedure", back_populates="drg")
+    __table_args__ = (
+        Index("ix_drgs_description_trgm", "description",
+              postgresql_using="gin", postgresql_ops={"description": "gin_trgm_ops"}),
+        Index("ix_drgs_description_tsv", "description_tsv", postgresql_using="gin"),
+        UniqueConstraint("code", name="uq_drgs_code"),
+    )
 
 class Procedure(Base):
+    # Partitioned by data_year, each year by state (app/services/partitions.py); Postgres wants both
+    # partition columns in every primary and unique key
     __tablename__ = "procedures"
     id = Column(Integer, primary_key=True, autoincrement=True)
-    provider_id = Column(String, ForeignKey("providers.provider_id"))  # FK to provider_id as String
-    ms_drg_definition = Column(String, index=True)
+    provider_id = Column(Integer, ForeignKey("providers.id"), nullable=False, index=True)  # providers.id, not the CCN
+    drg_id = Column(Integer, ForeignKey("drgs.id"), nullable=False, index=True)
     total_discharges = Column(Integer)
     average_covered_charges = Column(Float)
     average_total_payments = Column(Float)
     average_medicare_payments = Column(Float)
+    data_year = Column(Integer, primary_key=True)  # CMS data year (DY), e.g. 2022
+    state = Column(String, primary_key=True)  # Provider state as reported for this data year
+    zip_code = Column(String)  # Provider ZIP as reported for this data year
+    row_hash = Column(String)  # Fingerprint of key + values, used by incremental ETL
     provider = relationship("Provider", back_populates="procedures")
+    drg = relationship("Drg", back_populates="procedures")
+    __table_args__ = (
+        UniqueConstraint("provider_id", "drg_id", "data_year", "state", name="uq_procedures_provider_drg_year"),
+        {"postgresql_partition_by": "LIST (data_year)"},
+    )
+
+class ZipCentroid(Base):
+    __tablename__ = "zip_centroids"
+    zip_code = Column(String, primary_key=True)
+    latitude = Column(Float, nullable=False)
+    longitude = Column(Float, nullable=False)
+
+class DatasetVersion(Base):
+    # One row per ETL load that changed data; max(id) is the version served caches key on
+    __tablename__ = "dataset_versions"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source = Column(String)
+    loaded_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
@@ -0,0 +1,211 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from sqlalchemy import event, make_url, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from dotenv import load_dotenv
+from app.services import metrics
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "5"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Per-connection asyncpg prepared statement LRU; set to 0 behind pgbouncer in transaction mode
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "500"))
+
+# Read-only searches and /ask queries go to these streaming replicas when they are healthy and caught up,
+# to the primary otherwise. Each replica gets a pool sized like the primary's.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+DB_REPLICA_SELECTION = os.getenv("DB_REPLICA_SELECTION", "round_robin")  # or least_connections
+DB_REPLICA_MAX_LAG_SECONDS = float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "30"))
+DB_REPLICA_CHECK_SECONDS = float(os.getenv("DB_REPLICA_CHECK_SECONDS", "5"))
+DB_REPLICA_CHECK_TIMEOUT = float(os.getenv("DB_REPLICA_CHECK_TIMEOUT", "2"))
+
+# An idle primary sends no commits to replay, so lag only counts while WAL is received but not yet replayed.
+# A server that is not in recovery (e.g. a logically replicated copy) reports no lag.
+REPLICA_STATUS_SQL = text("""
+SELECT
+    CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() <= pg_last_wal_replay_lsn() THEN 0
+        ELSE extract(epoch FROM now() - pg_last_xact_replay_timestamp())
+    END AS lag_seconds,
+    (SELECT max(id) FROM dataset_versions) AS version
+""")
+
+engine = None
+async_session = None
+replicas = []
+_round_robin = itertools.count()
+_replica_checker = None
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    # _do_get is where a checkout waits for a free connection (or opens a new one)
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            metrics.POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    metrics.DB_EXECUTE_DURATION.observe(time.perf_counter() - context._metrics_start)
+    # Buffered SELECTs only; server-side cursors (streams) do not know their row count yet
+    if cursor.description is not None and cursor.rowcount >= 0:
+        metrics.DB_ROWS.observe(cursor.rowcount)
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.name = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_engine(url)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False, class_=AsyncSession)
+        # Until the first health check, and whenever it fails, reads go elsewhere
+        self.available = False
+        self.lag_seconds = None
+        self.version = None
+        event.listen(self.engine.sync_engine, "handle_error", self._on_error)
+
+    def _on_error(self, context):
+        # A dropped connection ejects the replica right away instead of at the next check
+        if context.is_disconnect and self.available:
+            logging.warning(f"Replica {self.name} disconnected, reading from the primary")
+            self.available = False
+
+    async def status(self):
+        async with self.engine.connect() as conn:
+            return (await conn.execute(REPLICA_STATUS_SQL)).one()
+
+    async def check(self):
+        try:
+            lag, version = await asyncio.wait_for(self.status(), DB_REPLICA_CHECK_TIMEOUT)
+            problem = None
+            if lag is None or lag > DB_REPLICA_MAX_LAG_SECONDS:
+                problem = f"replication lag {'unknown' if lag is None else f'{lag:.1f}s'}"
+        except Exception as exc:
+            lag, version, problem = None, None, f"health check failed: {exc!r}"
+        if problem and self.available:
+            logging.warning(f"Replica {self.name} ejected: {problem}")
+        elif not problem and not self.available:
+            logging.info(f"Replica {self.name} available (lag {lag:.1f}s, dataset version {version})")
+        self.available, self.lag_seconds, self.version = problem is None, lag, version
+
+
+def create_engine(database_url: str):
+    engine = create_async_engine(
+        database_url,
+        echo=False,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        connect_args={"prepared_statement_cache_size": DB_STATEMENT_CACHE_SIZE},
+        poolclass=TimedQueuePool,
+    )
+    event.listen(engine.sync_engine, "before_cursor_execute", _before_execute)
+    event.listen(engine.sync_engine, "after_cursor_execute", _after_execute)
+    return engine
+
+
+def init_engine(database_url: str = DATABASE_URL, replica_urls: list = DATABASE_REPLICA_URLS):
+    # One pool per process and database, created on app startup: size it so that
+    # workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) stays under Postgres max_connections
+    global engine, async_session, replicas
+    engine = create_engine(database_url)
+    async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    replicas = [Replica(url) for url in replica_urls]
+    return engine
+
+
+async def check_replicas():
+    await asyncio.gather(*(replica.check() for replica in replicas))
+
+
+async def _watch_replicas():
+    while True:
+        await asyncio.sleep(DB_REPLICA_CHECK_SECONDS)
+        await check_replicas()
+
+
+async def start_replica_checks():
+    # The first round runs before serving, so healthy replicas take reads from the first request
+    global _replica_checker
+    if replicas and _replica_checker is None:
+        await check_replicas()
+        _replica_checker = asyncio.create_task(_watch_replicas())
+
+
+async def dispose_engine():
+    global engine, async_session, replicas, _replica_checker
+    if _replica_checker is not None:
+        _replica_checker.cancel()
+        try:
+            await _replica_checker
+        except asyncio.CancelledError:
+            pass
+    for replica in replicas:
+        await replica.engine.dispose()
+    if engine is not None:
+        await engine.dispose()
+    engine = None
+    async_session = None
+    replicas = []
+    _replica_checker = None
+
+
+metrics.gauge(
+    "db_pool_connections_in_use", "Connections currently checked out of the pool",
+    lambda: engine.pool.checkedout() if engine is not None else None,
+)
+
+
+metrics.gauge(
+    "db_replicas_available", "Read replicas currently taking reads",
+    lambda: sum(replica.available for replica in replicas) if replicas else None,
+)
+
+
+def get_sessionmaker():
+    if async_session is None:
+        raise RuntimeError("Database engine is not initialized; call init_engine() on startup")
+    return async_session
+
+
+def get_read_sessionmaker(min_version=None):
+    # Session factory for read-only work: a replica that is available and has loaded at least dataset
+    # version min_version (so version-keyed caches never label older rows), else the primary
+    candidates = [
+        replica for replica in replicas
+        if replica.available and (min_version is None or (replica.version or 0) >= min_version)
+    ]
+    if not candidates:
+        metrics.DB_READ_ROUTES.inc(target="primary")
+        return get_sessionmaker()
+    # Rotating the candidates also spreads ties between equally loaded replicas
+    start = next(_round_robin) % len(candidates)
+    candidates = candidates[start:] + candidates[:start]
+    if DB_REPLICA_SELECTION == "least_connections":
+        replica = min(candidates, key=lambda replica: replica.engine.pool.checkedout())
+    else:
+        replica = candidates[0]
+    metrics.DB_READ_ROUTES.inc(target=replica.name)
+    return replica.sessionmaker
+
+
+async def get_session():
+    # FastAPI dependency: one session per request, connection checked out on first use
+    async with get_sessionmaker()() as session:
+        yield session
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from itertools import zip_longest
+from typing import Optional
+import numpy as np
+from sqlalchemy import select, text
+from app.db.models import Provider, Procedure, Drg, ZipCentroid
+from app.db.session import get_sessionmaker
+from app.services.drg_search import SIMILARITY_THRESHOLD, trigrams, similarity
+from app.services.geo import EARTH_RADIUS_KM, bounding_box
+from app.services.pagination import (
+    PROVIDERS_PAGE_SIZE, InvalidCursorError, query_fingerprint, encode_cursor, decode_cursor,
+)
+
+# "columnar" serves /providers from in-process NumPy arrays, "sql" always queries Postgres
+SERVING_MODE = os.getenv("SERVING_MODE", "sql")
+
+
+def haversine_km(lat: float, lon: float, lats, lons):
+    # Vectorized twin of geo.haversine_km_expr
+    dlat = np.radians(lats - lat)
+    dlon = np.radians(lons - lon)
+    a = np.sin(dlat * 0.5) ** 2 + math.cos(math.radians(lat)) * np.cos(np.radians(lats)) * np.sin(dlon * 0.5) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(1.0, a)))
+
+
+class ColumnarStore:
+    """Read-only snapshot of providers/procedures as NumPy columns, for one dataset version."""
+
+    def __init__(self, version, providers, drgs, procedures, centroids):
+        self.version = version
+        self.centroids = centroids
+        # Provider attributes, one array slot per provider; procedures point at them by position
+        columns = list(zip(*providers)) if providers else [()] * 9
+        (keys, provider_ids, names, cities, states, zip_codes, star_ratings, lats, lons) = columns
+        self.provider_ids = list(provider_ids)
+        self.names = list(names)
+        self.cities = list(cities)
+        self.states = list(states)
+        self.zip_codes = np.array(zip_codes, dtype=object)
+        self.star_ratings = [round(rating, 1) if rating is not None else None for rating in star_ratings]
+        self.latitudes = np.array([np.nan if v is None else v for v in lats], dtype=np.float64)
+        self.longitudes = np.array([np.nan if v is None else v for v in lons], dtype=np.float64)
+        self.provider_keys = np.array(keys, dtype=np.int64)  # providers.id
+        position = {key: i for i, key in enumerate(keys)}
+
+        # DRG descriptions are dictionary-encoded from the drgs table: one int32 code per row
+        self.drg_definitions = [description for _, description in drgs]
+        drg_codes = {drg_id: i for i, (drg_id, _) in enumerate(drgs)}
+        procedure_keys, provider_index, drg_index, data_years = [], [], [], []
+        discharges, covered, total, medicare = [], [], [], []
+        for procedure_id, provider_id, drg_id, data_year, *values in procedures:
+            procedure_keys.append(procedure_id)
+            provider_index.append(position[provider_id])
+            drg_index.append(drg_codes[drg_id])
+            data_years.append(data_year)
+            discharges.append(values[0])
+            covered.append(values[1])
+            total.append(values[2])
+            medicare.append(values[3])
+        self.drg_lower = [definition.lower() if definition else "" for definition in self.drg_definitions]
+        self.drg_trigrams = [trigrams(definition or "") for definition in self.drg_definitions]
+        self.procedure_keys = np.array(procedure_keys, dtype=np.int64)  # procedures.id
+        self.provider_index = np.array(provider_index, dtype=np.int32)
+        self.drg_index = np.array(drg_index, dtype=np.int32)
+        self.data_years = np.array(data_years, dtype=np.int32)
+        self.total_discharges = np.array(discharges, dtype=np.int64)
+        self.average_covered_charges = np.array(covered, dtype=np.float64)
+        self.average_total_payments = np.array(total, dtype=np.float64)
+        self.average_medicare_payments = np.array(medicare, dtype=np.float64)
+        # Row ids per DRG code (an inverted index), so a search only touches rows of matching DRGs
+        order = np.argsort(self.drg_index, kind="stable").astype(np.int32)
+        counts = np.bincount(self.drg_index, minlength=len(self.drg_definitions))
+        self.drg_rows = np.split(order, np.cumsum(counts)[:-1])
+
+    def __len__(self):
+        return len(self.provider_index)
+
+    def match_drgs(self, match_type: str, drg: str):
+        # Returns (mask, rank) over DRG codes, or None when only SQL can answer
+        if match_type == "fulltext":
+            return None  # english stemming and stop words live in Postgres
+        if match_type == "fuzzy":
+            query = trigrams(drg)
+            rank = np.array([similarity(query, grams) for grams in self.drg_trigrams], dtype=np.float64)
+            return rank >= SIMILARITY_THRESHOLD, rank
+        if any(char in drg for char in "%_\\"):
+            return None  # LIKE wildcards/escapes
+        needle = drg.lower()
+        return np.array([needle in definition for definition in self.drg_lower], dtype=bool), None
+
+    def search(self, drg: str, zip: str, radius_km: int, match_type: str, sort: str, year: Optional[int] = None,
+               limit: int = PROVIDERS_PAGE_SIZE, cursor: Optional[str] = None):
+        # Same rows, order, page keys and shape as providers.search_providers, or None to fall back to SQL
+        matched = self.match_drgs(match_type, drg)
+        if matched is None:
+            return None
+        fingerprint = query_fingerprint(
+            drg=drg.lower(), zip=zip, radius_km=radius_km, match_type=match_type, sort=sort, year=year
+        )
+        after = decode_cursor(cursor, fingerprint) if cursor is not None else None
+        drg_mask, rank = matched
+        if not drg_mask.any():
+            return [], None
+        center = self.centroids.get(zip)
+        distance = None
+        if center is not None:
+            lat, lon = center
+            min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+            provider_mask = (
+                (self.latitudes >= min_lat) & (self.latitudes <= max_lat)
+                & (self.longitudes >= min_lon) & (self.longitudes <= max_lon)
+            )
+            distance = np.full(len(self.provider_ids), np.inf)
+            distance[provider_mask] = haversine_km(
+                lat, lon, self.latitudes[provider_mask], self.longitudes[provider_mask]
+            )
+            provider_mask &= distance <= radius_km
+        else:
+            provider_mask = self.zip_codes == zip
+        rows = np.concatenate([self.drg_rows[code] for code in np.flatnonzero(drg_mask)])
+        rows = rows[provider_mask[self.provider_index[rows]]]
+        if year is not None:
+            rows = rows[self.data_years[rows] == year]
+        if not len(rows):
+            return [], None
+
+        # Row key as in drg_match (similarity is a float4 in Postgres), then procedure id
+        row_keys = [self.average_covered_charges[rows]]
+        if rank is not None:
+            row_keys.insert(0, -rank.astype(np.float32).astype(np.float64)[self.drg_index[rows]])
+        row_keys.append(self.procedure_keys[rows])
+        # np.lexsort: last key is the primary one
+        order = np.lexsort(row_keys[::-1])
+        rows, row_keys = rows[order], [key[order] for key in row_keys]
+        providers = self.provider_index[rows]
+        # Each provider is keyed by its first row, as first_value() does in SQL
+        _, first = np.unique(providers, return_index=True)
+        first_row = np.empty(len(self.provider_ids), dtype=np.int64)
+        first_row[providers[first]] = first
+        provider_keys = [key[first_row[providers]] for key in row_keys[:-1]]
+        if sort == "distance" and distance is not None:
+            provider_keys.insert(0, distance[providers])
+        keys = [*provider_keys, self.provider_keys[providers], *row_keys]
+        order = np.lexsort(keys[::-1])
+        rows, keys = rows[order], [key[order] for key in keys]
+        if after is not None:
+            if len(after) != len(keys):
+                raise InvalidCursorError("cursor does not belong to this search")
+            # Row-wise (keys) > (after), like the SQL tuple comparison
+            greater = np.zeros(len(rows), dtype=bool)
+            equal = np.ones(len(rows), dtype=bool)
+            for key, value in zip_longest(keys, after):  # `zip` is shadowed by the ZIP parameter
+                greater |= equal & (key > value)
+                equal &= key == value
+            rows, keys = rows[greater], [key[greater] for key in keys]
+        next_cursor = None
+        if len(rows) > limit:
+            rows, keys = rows[:limit], [key[:limit] for key in keys]
+            next_cursor = encode_cursor([key[-1].item() for key in keys], fingerprint)
+
+        # `zip` is the ZIP code here, so walk the columns by position
+        providers = self.provider_index[rows].tolist()
+        drgs = self.drg_index[rows].tolist()
+        discharges = self.total_discharges[rows].tolist()
+        covered = self.average_covered_charges[rows].tolist()
+        total = self.average_total_payments[rows].tolist()
+        medicare = self.average_medicare_payments[rows].tolist()
+        providers_dict = {}
+        for i, p in enumerate(providers):
+            entry = providers_dict.get(p)
+            if entry is None:
+                entry = providers_dict[p] = {
+                    "provider_id": self.provider_ids[p],
+                    "name": self.names[p],
+                    "city": self.cities[p],
+                    "state": self.states[p],
+                    "zip_code": self.zip_codes[p],
+                    "star_rating": self.star_ratings[p],
+                    "distance_km": round(distance[p].item(), 1) if distance is not None else None,
+                    "procedures": []
+                }
+            entry["procedures"].append({
+                "ms_drg_definition": self.drg_definitions[drgs[i]],
+                "total_discharges": discharges[i],
+                "average_covered_charges": covered[i],
+                "average_total_payments": total[i],
+                "average_medicare_payments": medicare[i]
+            })
+        return list(providers_dict.values()), next_cursor
+
+
+async def load_store(session) -> ColumnarStore:
+    # One snapshot, so the version always matches the rows read with it
+    await session.execute(text("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"))
+    version = (await session.execute(text("SELECT max(id) FROM dataset_versions"))).scalar()
+    providers = (await session.execute(select(
+        Provider.id, Provider.provider_id, Provider.name, Provider.city, Provider.state, Provider.zip_code,
+        Provider.star_rating, Provider.latitude, Provider.longitude,
+    ))).all()
+    procedures = (await session.execute(select(
+        Procedure.id, Procedure.provider_id, Procedure.drg_id, Procedure.data_year, Procedure.total_discharges,
+        Procedure.average_covered_charges, Procedure.average_total_payments, Procedure.average_medicare_payments,
+    ).order_by(Procedure.id))).all()
+    drgs = (await session.execute(select(Drg.id, Drg.description).order_by(Drg.id))).all()
+    centroids = {
+        zip_code: (lat, lon)
+        for zip_code, lat, lon in await session.execute(
+            select(ZipCentroid.zip_code, ZipCentroid.latitude, ZipCentroid.longitude)
+        )
+    }
+    # Building the arrays is CPU work; keep it off the event loop that is still serving the old store
+    return await asyncio.to_thread(ColumnarStore, version, providers, drgs, procedures, centroids)
+
+
+# The store being served; replaced wholesale on reload, so readers never see a half-built one
+store = None
+
+
+async def reload(version=None):
+    global store
+    if store is not None and version is not None and store.version == version:
+        return
+    start = time.perf_counter()
+    async with get_sessionmaker()() as session:
+        new_store = await load_store(session)
+    store = new_store
+    logging.info(
+        f"Columnar store v{store.version}: {len(store):,} procedures, {len(store.provider_ids):,} providers, "
+        f"{len(store.drg_definitions):,} DRGs in {time.perf_counter() - start:.2f}s"
+    )
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import os
+from sqlalchemy import select, func, exists, text
+from app.db.models import DatasetVersion, Procedure
+from app.db.session import get_read_sessionmaker, get_sessionmaker
+from app.services.partitions import PARTITION_YEARS_SQL
+
+DATASET_POLL_SECONDS = float(os.getenv("DATASET_POLL_SECONDS", "30"))
+
+# Latest dataset_versions.id seen by this process; None until the first poll or when nothing is loaded
+current_version = None
+# Whether the listeners have run at all: the first poll loads them even when there is no version yet
+_polled = False
+# Newest procedures.data_year at current_version: what GET /providers and generated SQL default to
+latest_data_year = None
+_listeners = []
+_watcher = None
+
+
+def read_sessionmaker():
+    # Read-only queries behind version-keyed caches: a replica only once it has the served version
+    return get_read_sessionmaker(current_version)
+
+
+def on_version_change(callback):
+    # callback(version) is awaited whenever the ETL records a new load
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+async def fetch_version(session):
+    return await session.scalar(select(func.max(DatasetVersion.id)))
+
+
+async def fetch_latest_year(session):
+    # max(data_year) would read every partition: the newest year partition holding a row answers the same
+    for year in (await session.execute(text(PARTITION_YEARS_SQL))).scalars():
+        if await session.scalar(select(exists().where(Procedure.data_year == year))):
+            return year
+    return None
+
+
+async def refresh_version():
+    global current_version, latest_data_year, _polled
+    async with get_sessionmaker()() as session:
+        version = await fetch_version(session)
+        if _polled and version == current_version:
+            return False
+        year = await fetch_latest_year(session)
+    logging.info(f"Dataset version {current_version} -> {version}")
+    for callback in _listeners:
+        try:
+            await callback(version)
+        except Exception as exc:
+            logging.warning(f"Dataset version listener {callback.__qualname__} failed: {exc}")
+    # Published only after the listeners reloaded, so version-keyed ETags never label old in-memory data
+    current_version, latest_data_year, _polled = version, year, True
+    return True
+
+
+async def _watch(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await refresh_version()
+        except Exception as exc:
+            logging.warning(f"Could not poll the dataset version: {exc}")
+
+
+def start_watcher(interval: float = DATASET_POLL_SECONDS):
+    global _watcher
+    if _watcher is None and interval > 0:
+        _watcher = asyncio.create_task(_watch(interval))
+
+
+async def stop_watcher():
+    global _watcher
+    if _watcher is not None:
+        _watcher.cancel()
+        try:
+            await _watcher
+        except asyncio.CancelledError:
+            pass
+    _watcher = None
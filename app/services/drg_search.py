@@ -0,0 +1,79 @@
+import logging
+import os
+import re
+from sqlalchemy import func, select, text
+from app.db.models import Drg, Procedure
+from app.db.session import get_sessionmaker
+
+# pg_trgm.similarity_threshold used by the indexable `%` operator in fuzzy mode
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", "0.1"))
+
+WORD_RE = re.compile(r'\b[a-z]+\b')
+TRGM_WORD_RE = re.compile(r'[^\W_]+')
+# Words that appear in DRG descriptions but also in ordinary questions
+DRG_STOPWORDS = {
+    "with", "without", "and", "or", "of", "the", "for", "other", "except", "procedure", "procedures",
+    "mcc", "hours", "age", "non",
+}
+# Lowercase words that occur in DRG descriptions; filled at startup and on every dataset version change,
+# updated in place so modules that imported it see the new terms
+drg_vocabulary = set()
+
+
+async def load_drg_vocabulary(session):
+    result = await session.execute(select(Drg.description))
+    words = {
+        word for (definition,) in result if definition
+        for word in WORD_RE.findall(definition.lower())
+        if len(word) > 2 and word not in DRG_STOPWORDS
+    }
+    drg_vocabulary.clear()
+    drg_vocabulary.update(words)
+    logging.info(f"DRG vocabulary: {len(drg_vocabulary)} terms")
+
+
+async def reload_drg_vocabulary(version=None):
+    async with get_sessionmaker()() as session:
+        await load_drg_vocabulary(session)
+
+
+def trigrams(value: str) -> set:
+    # Same trigram set as pg_trgm: lowercased alphanumeric words padded with two leading and one trailing blank
+    grams = set()
+    for word in TRGM_WORD_RE.findall(value.lower()):
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a: set, b: set) -> float:
+    # pg_trgm similarity() over two trigram sets
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+async def set_similarity_threshold(session, threshold: float = SIMILARITY_THRESHOLD):
+    # Transaction-local so pooled connections keep the server default
+    await session.execute(
+        text("SELECT set_config('pg_trgm.similarity_threshold', :threshold, true)"),
+        {"threshold": str(threshold)}
+    )
+
+
+def drg_match(match_type: str, drg: str):
+    # Returns (filter, order_by); the filter is on drgs (a few hundred rows, GIN indexed), so callers join Drg.
+    # order_by terms are all ascending so they can double as keyset pagination keys.
+    if match_type == "fuzzy":
+        # `%` uses ix_drgs_description_trgm, similarity() alone cannot
+        drg_filter = Drg.description.op('%')(drg)
+        order_by = [-func.similarity(Drg.description, drg), Procedure.average_covered_charges]
+    elif match_type == "fulltext":
+        # Stored tsvector column, indexed by ix_drgs_description_tsv
+        drg_filter = Drg.description_tsv.op('@@')(func.plainto_tsquery('english', drg))
+        order_by = [Procedure.average_covered_charges]
+    else:  # substring, ILIKE '%x%' is served by the trigram index as well
+        drg_filter = Drg.description.ilike(f"%{drg}%")
+        order_by = [Procedure.average_covered_charges]
+    return drg_filter, order_by
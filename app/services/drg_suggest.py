@@ -0,0 +1,86 @@
+import heapq
+import logging
+import time
+from collections import defaultdict
+from sqlalchemy import select
+from app.db.models import Drg
+from app.db.session import get_sessionmaker
+from app.services.drg_search import SIMILARITY_THRESHOLD, TRGM_WORD_RE, trigrams, similarity
+
+DEFAULT_SUGGESTIONS = 10
+MAX_SUGGESTIONS = 50
+
+
+class DrgSuggestIndex:
+    """Prefix trie over DRG codes/words plus a trigram inverted index, for autocomplete."""
+
+    def __init__(self, drgs, version=None):
+        self.version = version
+        self.drgs = [{"drg_id": drg_id, "code": code, "description": description} for drg_id, code, description in drgs]
+        self.trie = {}
+        self.postings = defaultdict(set)
+        self.grams = []
+        for position, entry in enumerate(self.drgs):
+            words = set(TRGM_WORD_RE.findall(entry["description"].lower()))
+            if entry["code"]:
+                words.add(entry["code"].lower())
+            for word in words:
+                self._insert(word, position)
+            grams = trigrams(entry["description"])
+            self.grams.append(grams)
+            for gram in grams:
+                self.postings[gram].add(position)
+
+    def _insert(self, word: str, position: int):
+        # Every node keeps the DRGs below it, so a prefix lookup is one walk with no subtree scan
+        node = self.trie
+        for char in word:
+            node = node.setdefault(char, {})
+            node.setdefault(None, set()).add(position)
+
+    def prefix_matches(self, word: str) -> set:
+        node = self.trie
+        for char in word:
+            node = node.get(char)
+            if node is None:
+                return set()
+        return node.get(None, set())
+
+    def suggest(self, q: str, limit: int = DEFAULT_SUGGESTIONS) -> list:
+        words = TRGM_WORD_RE.findall(q.lower())
+        if not words:
+            return []
+        # Every typed word must be a prefix of some word of the DRG ("hea fail" -> HEART FAILURE ...)
+        prefixed = set.intersection(*(self.prefix_matches(word) for word in words))
+        query_grams = trigrams(q)
+        candidates = set(prefixed)
+        for gram in query_grams:
+            candidates |= self.postings.get(gram, set())
+        scored = []
+        for position in candidates:
+            score = similarity(query_grams, self.grams[position])
+            if position in prefixed or score >= SIMILARITY_THRESHOLD:
+                scored.append((position in prefixed, score, -len(self.drgs[position]["description"]), -position))
+        return [
+            {**self.drgs[-position], "score": round(score, 3)}
+            for _, score, _, position in heapq.nlargest(limit, scored)
+        ]
+
+
+index = None
+
+
+async def rebuild(version=None):
+    global index
+    start = time.perf_counter()
+    async with get_sessionmaker()() as session:
+        drgs = (await session.execute(select(Drg.id, Drg.code, Drg.description).order_by(Drg.id))).all()
+    index = DrgSuggestIndex(drgs, version)
+    logging.info(f"DRG suggest index: {len(drgs)} DRGs in {(time.perf_counter() - start) * 1000:.0f}ms")
+
+
+async def get_index() -> DrgSuggestIndex:
+    # Normally built at startup and on dataset version changes; this covers a failed startup load
+    if index is None:
+        await rebuild()
+    return index
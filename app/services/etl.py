@@ -0,0 +1,547 @@
+import asyncio
+import csv
+import glob
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import asyncpg
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateIndex, CreateTable
+from app.db.models import Drg, Procedure, Provider
+from app.services.geo import load_zip_centroids
+from app.services.partitions import create_procedure_partitions, procedure_partitions
+from app.services.sql_guard import grant_ask_role
+from app.services.stats import STATS_VIEWS, create_stats_views, refresh_stats_views
+
+# Files are split into byte ranges parsed by ETL_WORKERS processes and copied by ETL_WRITERS connections
+ETL_WORKERS = int(os.getenv("ETL_WORKERS") or os.cpu_count() or 1)
+ETL_WRITERS = int(os.getenv("ETL_WRITERS", "4"))
+ETL_CHUNK_BYTES = int(os.getenv("ETL_CHUNK_BYTES", str(4 * 1024 * 1024)))
+STAGING_TABLE = "etl_staging_rows"
+
+# Full loads are built in SHADOW_SCHEMA and swapped into public; the tables they replace are kept in
+# PREVIOUS_SCHEMA until the next full load, for rollback_load()
+SHADOW_SCHEMA = "etl_shadow"
+PREVIOUS_SCHEMA = "etl_previous"
+SWAPPED_TABLES = [Provider.__table__, Drg.__table__, Procedure.__table__]
+# The swap waits at most this long for running readers, then retries, so readers queue behind it briefly
+ETL_SWAP_LOCK_TIMEOUT_MS = int(os.getenv("ETL_SWAP_LOCK_TIMEOUT_MS", "500"))
+ETL_SWAP_ATTEMPTS = int(os.getenv("ETL_SWAP_ATTEMPTS", "20"))
+# pg_try_advisory_lock key held for the whole load, so two loaders never share the shadow schema
+LOAD_LOCK_KEY = 72_310_422
+
+# CSV column -> staging column; order matches the tuples built by parse_rows()
+CSV_COLUMNS = [
+    ('Rndrng_Prvdr_CCN', 'provider_id'),
+    ('Rndrng_Prvdr_Org_Name', 'name'),
+    ('Rndrng_Prvdr_City', 'city'),
+    ('Rndrng_Prvdr_State_Abrvtn', 'state'),
+    ('Rndrng_Prvdr_Zip5', 'zip_code'),
+    ('DRG_Cd', 'drg_code'),
+    ('DRG_Desc', 'ms_drg_definition'),
+    ('Tot_Dschrgs', 'total_discharges'),
+    ('Avg_Submtd_Cvrd_Chrg', 'average_covered_charges'),
+    ('Avg_Tot_Pymt_Amt', 'average_total_payments'),
+    ('Avg_Mdcr_Pymt_Amt', 'average_medicare_payments'),
+]
+
+# Columns each kind of CMS file fills, recognized by its header: by provider and service (one row per
+# provider and DRG), by provider (hospital attributes only) and by geography and service (DRG codes).
+FILE_KINDS = {
+    "service": CSV_COLUMNS,
+    "provider": CSV_COLUMNS[:5],
+    "drg": CSV_COLUMNS[5:7],
+}
+
+CREATE_STAGING_SQL = f"""
+CREATE UNLOGGED TABLE {STAGING_TABLE} (
+    provider_id varchar,
+    name varchar,
+    city varchar,
+    state varchar,
+    zip_code varchar,
+    drg_code varchar,
+    ms_drg_definition varchar,
+    total_discharges integer,
+    average_covered_charges double precision,
+    average_total_payments double precision,
+    average_medicare_payments double precision,
+    data_year integer,
+    row_hash varchar
+)
+"""
+
+PROCEDURE_COLUMNS = """
+    provider_id, drg_id, total_discharges, average_covered_charges,
+    average_total_payments, average_medicare_payments, data_year, state, zip_code, row_hash
+"""
+
+# Providers are deduplicated here rather than in Python, so memory does not grow with the files.
+# The latest data year wins; the rest of the ORDER BY makes the pick independent of which worker
+# staged a row first. Attribute corrections are applied, the mock star_rating is kept.
+UPSERT_PROVIDERS_SQL = f"""
+INSERT INTO providers (provider_id, name, city, state, zip_code, star_rating, latitude, longitude)
+SELECT DISTINCT ON (s.provider_id)
+    s.provider_id, s.name, s.city, s.state, s.zip_code,
+    1 + random() * 9, z.latitude, z.longitude
+FROM {STAGING_TABLE} s
+LEFT JOIN zip_centroids z ON z.zip_code = s.zip_code
+WHERE s.provider_id IS NOT NULL
+ORDER BY s.provider_id, s.data_year DESC, s.name, s.city, s.state, s.zip_code
+ON CONFLICT (provider_id) DO UPDATE SET
+    name = EXCLUDED.name, city = EXCLUDED.city, state = EXCLUDED.state, zip_code = EXCLUDED.zip_code,
+    latitude = EXCLUDED.latitude, longitude = EXCLUDED.longitude
+WHERE (providers.name, providers.city, providers.state, providers.zip_code)
+    IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.city, EXCLUDED.state, EXCLUDED.zip_code)
+"""
+
+# DRGs migrated from the old text column have no code yet; claim them before inserting new ones
+ADOPT_DRG_CODES_SQL = f"""
+UPDATE drgs d SET code = s.drg_code
+FROM (SELECT DISTINCT drg_code, ms_drg_definition FROM {STAGING_TABLE} WHERE drg_code IS NOT NULL) s
+WHERE d.code IS NULL AND d.description = s.ms_drg_definition
+  AND NOT EXISTS (SELECT 1 FROM drgs taken WHERE taken.code = s.drg_code)
+"""
+
+UPSERT_DRGS_SQL = f"""
+INSERT INTO drgs (code, description)
+SELECT DISTINCT ON (drg_code) drg_code, ms_drg_definition
+FROM {STAGING_TABLE}
+WHERE drg_code IS NOT NULL
+ORDER BY drg_code, data_year DESC, ms_drg_definition
+ON CONFLICT (code) DO UPDATE SET description = EXCLUDED.description
+WHERE drgs.description IS DISTINCT FROM EXCLUDED.description
+"""
+
+# Staging rows with their integer provider/DRG keys, once providers and drgs are upserted.
+# Companion file rows lack a provider or a DRG code and drop out of the joins. The state and ZIP are
+# the ones in the row's own file, so they stay put when a later year moves the provider.
+RESOLVED_STAGING_SQL = f"""
+SELECT DISTINCT ON (p.id, d.id, s.data_year)
+    p.id AS provider_id, d.id AS drg_id, s.total_discharges, s.average_covered_charges,
+    s.average_total_payments, s.average_medicare_payments, s.data_year, coalesce(s.state, '') AS state, s.zip_code,
+    s.row_hash
+FROM {STAGING_TABLE} s
+JOIN providers p ON p.provider_id = s.provider_id
+JOIN drgs d ON d.code = s.drg_code
+"""
+
+MERGE_SQL = f"""
+INSERT INTO procedures ({PROCEDURE_COLUMNS})
+{RESOLVED_STAGING_SQL}
+"""
+
+# Incremental mode only writes rows whose fingerprint is new or different. Partitioned tables have
+# no xmax to tell inserts from updates in RETURNING, so the counts come from the join instead.
+UPSERT_CHANGED_PROCEDURES_SQL = f"""
+WITH changed AS (
+    SELECT r.*, p.id IS NULL AS is_new FROM ({RESOLVED_STAGING_SQL}) r
+    LEFT JOIN procedures p
+        ON p.provider_id = r.provider_id AND p.drg_id = r.drg_id AND p.data_year = r.data_year AND p.state = r.state
+    WHERE p.row_hash IS DISTINCT FROM r.row_hash
+), upserted AS (
+    INSERT INTO procedures ({PROCEDURE_COLUMNS})
+    SELECT {PROCEDURE_COLUMNS} FROM changed
+    ON CONFLICT ON CONSTRAINT uq_procedures_provider_drg_year DO UPDATE SET
+        total_discharges = EXCLUDED.total_discharges,
+        average_covered_charges = EXCLUDED.average_covered_charges,
+        average_total_payments = EXCLUDED.average_total_payments,
+        average_medicare_payments = EXCLUDED.average_medicare_payments,
+        zip_code = EXCLUDED.zip_code,
+        row_hash = EXCLUDED.row_hash
+)
+SELECT count(*) FILTER (WHERE is_new) AS inserted, count(*) FILTER (WHERE NOT is_new) AS updated FROM changed
+"""
+
+DELETE_REMOVED_PROCEDURES_SQL = f"""
+DELETE FROM procedures p
+WHERE p.data_year = ANY($1::int[])
+  AND NOT EXISTS (
+    SELECT 1 FROM {STAGING_TABLE} s
+    JOIN providers pr ON pr.provider_id = s.provider_id
+    JOIN drgs d ON d.code = s.drg_code
+    WHERE pr.id = p.provider_id AND d.id = p.drg_id AND s.data_year = p.data_year
+      AND coalesce(s.state, '') = p.state
+  )
+"""
+
+# (data year, state) of every staged procedure row, each needing a partition before the merge
+STAGED_PARTITIONS_SQL = f"""
+SELECT DISTINCT data_year, coalesce(state, '') FROM {STAGING_TABLE}
+WHERE provider_id IS NOT NULL AND drg_code IS NOT NULL
+"""
+
+def asyncpg_dsn(database_url: str) -> str:
+    # asyncpg takes a plain libpq URL, without SQLAlchemy's driver suffix
+    return database_url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+def data_year_from_path(path: str):
+    # CMS file names carry the data year, e.g. MUP_INP_RY24_P03_V10_DY22_PrvSvc.csv -> 2022
+    match = re.search(r'DY(\d{2})', os.path.basename(path))
+    return 2000 + int(match.group(1)) if match else None
+
+
+def resolve_sources(patterns: list, data_year=None) -> list:
+    # Paths or glob patterns -> sorted (path, data year) pairs; data_year overrides the DYxx in each name
+    sources = []
+    for pattern in patterns:
+        paths = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        if not paths:
+            raise ValueError(f"No files match {pattern}")
+        for path in paths:
+            year = data_year or data_year_from_path(path)
+            if year is None:
+                raise ValueError(f"Could not infer the data year from {path}, pass --year")
+            sources.append((path, year))
+    return sources
+
+
+def row_fingerprint(values) -> str:
+    # Business key (CCN, DRG, year) plus every loaded value (ZIP and numbers); changes when CMS corrects a row
+    return hashlib.md5('\x1f'.join(map(str, values)).encode()).hexdigest()
+
+
+def file_kind(header: list) -> str:
+    for kind, columns in FILE_KINDS.items():
+        if all(col in header for col, _ in columns):
+            return kind
+    missing = [col for col, _ in CSV_COLUMNS if col not in header]
+    raise ValueError(f"Missing columns in CSV: {missing}")
+
+
+def staging_columns(kind: str) -> list:
+    columns = [column for _, column in FILE_KINDS[kind]] + ['data_year']
+    return columns + ['row_hash'] if kind == "service" else columns
+
+
+def read_header(f) -> list:
+    return next(csv.reader([f.readline().decode('latin1')]))
+
+
+def split_file(path: str, chunk_bytes: int):
+    # Header plus byte ranges that each end on a line break. CMS files are latin1 (one byte per
+    # character) and have no line breaks inside quoted fields, so every b"\n" ends a row.
+    with open(path, 'rb') as f:
+        header = read_header(f)
+        size = os.fstat(f.fileno()).st_size
+        ranges = []
+        start = f.tell()
+        while start < size:
+            end = start + chunk_bytes
+            if end >= size:
+                end = size
+            else:
+                f.seek(end - 1)
+                f.readline()
+                end = f.tell()
+            ranges.append((start, end))
+            start = end
+    return header, ranges
+
+
+def parse_rows(reader, kind: str, indexes: list, data_year: int):
+    if kind != "service":
+        for row in reader:
+            if row:
+                yield tuple(row[i] for i in indexes) + (data_year,)
+        return
+    ccn, zip_code, drg, discharges, covered, total, medicare = (indexes[i] for i in (0, 4, 6, 7, 8, 9, 10))
+    for row in reader:
+        if not row:
+            continue
+        # Converted for validation and the fingerprint only; COPY gets the original text, which
+        # Postgres parses to the same values without Python formatting every float again
+        numbers = (int(row[discharges]), float(row[covered]), float(row[total]), float(row[medicare]))
+        fingerprint = row_fingerprint((row[ccn], row[drg], data_year, row[zip_code]) + numbers)
+        yield tuple(row[i] for i in indexes) + (data_year, fingerprint)
+
+
+def parse_chunk(path: str, start: int, end: int, kind: str, indexes: list, data_year: int):
+    # Runs in a worker process: one byte range -> (row count, CSV payload for COPY). Text is quoted,
+    # so empty values stay empty strings rather than NULLs.
+    with open(path, 'rb') as f:
+        f.seek(start)
+        text = f.read(end - start).decode('latin1')
+    out = io.StringIO()
+    writer = csv.writer(out, quoting=csv.QUOTE_NONNUMERIC, lineterminator='\n')
+    rows = list(parse_rows(csv.reader(io.StringIO(text, newline='')), kind, indexes, data_year))
+    writer.writerows(rows)
+    return len(rows), out.getvalue().encode('utf-8')
+
+
+async def seed_zip_centroids(conn: asyncpg.Connection):
+    if await conn.fetchval("SELECT count(*) FROM zip_centroids"):
+        return
+    await conn.copy_records_to_table(
+        "zip_centroids",
+        records=[(zip_code, lat, lon) for zip_code, (lat, lon) in load_zip_centroids().items()],
+        columns=["zip_code", "latitude", "longitude"]
+    )
+
+
+async def acquire_load_lock(conn: asyncpg.Connection):
+    # Session level: released when the connection closes, whatever happens
+    if not await conn.fetchval("SELECT pg_try_advisory_lock($1)", LOAD_LOCK_KEY):
+        raise RuntimeError("Another dataset load is running")
+
+
+def copied_columns(table) -> str:
+    return ", ".join(column.name for column in table.columns if column.computed is None)
+
+
+async def create_shadow_tables(conn: asyncpg.Connection, replaced_years: list):
+    # Same DDL as the models, without the non-unique indexes (built once the rows are in). Provider and
+    # DRG ids, and the procedures of every year not being replaced (with their partitions), are carried
+    # over from public.
+    dialect = postgresql.dialect()
+    await conn.execute(f"DROP SCHEMA IF EXISTS {SHADOW_SCHEMA} CASCADE")
+    await conn.execute(f"CREATE SCHEMA {SHADOW_SCHEMA}")
+    for table in SWAPPED_TABLES:
+        await conn.execute(str(CreateTable(table).compile(dialect=dialect)))
+        for index in table.indexes:
+            if index.unique:
+                await conn.execute(str(CreateIndex(index).compile(dialect=dialect)))
+        columns = copied_columns(table)
+        carried = f"INSERT INTO {SHADOW_SCHEMA}.{table.name} ({columns}) SELECT {columns} FROM public.{table.name}"
+        if table is Procedure.__table__:
+            await create_procedure_partitions(conn, [tuple(row) for row in await conn.fetch(
+                "SELECT DISTINCT data_year, state FROM public.procedures WHERE NOT data_year = ANY($1::int[])",
+                replaced_years
+            )])
+            await conn.execute(carried + " WHERE NOT data_year = ANY($1::int[])", replaced_years)
+        else:
+            await conn.execute(carried)
+        await conn.execute(
+            f"SELECT setval(pg_get_serial_sequence('{SHADOW_SCHEMA}.{table.name}', 'id'), "
+            f"coalesce(max(id), 0) + 1, false) FROM {SHADOW_SCHEMA}.{table.name}"
+        )
+
+
+async def finish_shadow_tables(conn: asyncpg.Connection):
+    # Indexes, planner statistics and price statistics, all before any reader can see the tables.
+    # An index on procedures is created on every partition; ANALYZE of the parent covers them too.
+    dialect = postgresql.dialect()
+    for table in SWAPPED_TABLES:
+        for index in table.indexes:
+            if not index.unique:
+                await conn.execute(str(CreateIndex(index).compile(dialect=dialect)))
+        await conn.execute(f"ANALYZE {SHADOW_SCHEMA}.{table.name}")
+    # Created in the first schema on the search_path, over the shadow tables
+    await create_stats_views(conn)
+
+
+async def swap_schemas(conn: asyncpg.Connection, moves: list, source: str, replace_previous: bool = False) -> int:
+    # moves: (from schema, to schema) pairs, applied in order in one short transaction. replace_previous
+    # empties PREVIOUS_SCHEMA first, in the same transaction, so a failed swap keeps it. Every statement
+    # takes an ACCESS EXCLUSIVE lock; lock_timeout keeps readers from piling up behind a swap that has to
+    # wait for a long query, and the whole swap is retried instead. Partitions do not follow their
+    # parent to another schema, so each one is moved as well.
+    relations = [("MATERIALIZED VIEW", name) for name in STATS_VIEWS] + [("TABLE", t.name) for t in SWAPPED_TABLES]
+    for attempt in range(1, ETL_SWAP_ATTEMPTS + 1):
+        try:
+            async with conn.transaction():
+                await conn.execute(f"SET LOCAL lock_timeout = {ETL_SWAP_LOCK_TIMEOUT_MS}")
+                if replace_previous:
+                    await conn.execute(f"DROP SCHEMA IF EXISTS {PREVIOUS_SCHEMA} CASCADE")
+                    await conn.execute(f"CREATE SCHEMA {PREVIOUS_SCHEMA}")
+                for from_schema, to_schema in moves:
+                    partitions = await procedure_partitions(conn, from_schema)
+                    for kind, name in relations:
+                        await conn.execute(f"ALTER {kind} IF EXISTS {from_schema}.{name} SET SCHEMA {to_schema}")
+                    for name in partitions:
+                        await conn.execute(f"ALTER TABLE {from_schema}.{name} SET SCHEMA {to_schema}")
+                await grant_ask_role(conn)
+                # Serving caches (columnar engine, ...) reload when this changes
+                return await conn.fetchval(
+                    "INSERT INTO public.dataset_versions (source) VALUES ($1) RETURNING id", source
+                )
+        except asyncpg.LockNotAvailableError:
+            logging.warning(f"Swap attempt {attempt}/{ETL_SWAP_ATTEMPTS} timed out waiting for readers")
+            await asyncio.sleep(min(attempt, 5) * 0.2)
+    raise RuntimeError(f"Could not swap in the new dataset after {ETL_SWAP_ATTEMPTS} attempts")
+
+
+async def rollback_load(database_url: str) -> int:
+    # Swaps the tables replaced by the last full load back in; the current ones become the previous
+    # version, so a second rollback rolls forward again. Returns the new dataset version.
+    conn = await asyncpg.connect(asyncpg_dsn(database_url))
+    try:
+        await acquire_load_lock(conn)
+        previous = await conn.fetchval(
+            "SELECT count(*) FROM pg_tables WHERE schemaname = $1 AND tablename = ANY($2::text[])",
+            PREVIOUS_SCHEMA, [table.name for table in SWAPPED_TABLES]
+        )
+        if previous != len(SWAPPED_TABLES):
+            raise ValueError("No previous dataset to roll back to")
+        await conn.execute(f"DROP SCHEMA IF EXISTS {SHADOW_SCHEMA} CASCADE")
+        await conn.execute(f"CREATE SCHEMA {SHADOW_SCHEMA}")
+        version = await swap_schemas(
+            conn, [("public", SHADOW_SCHEMA), (PREVIOUS_SCHEMA, "public"), (SHADOW_SCHEMA, PREVIOUS_SCHEMA)],
+            "rollback"
+        )
+        await conn.execute(f"DROP SCHEMA {SHADOW_SCHEMA}")
+        logging.info(f"Rolled back to the previous dataset as version {version}")
+        return version
+    finally:
+        await conn.close()
+
+
+async def upsert_dimensions(conn: asyncpg.Connection) -> int:
+    # Number of provider and DRG rows written
+    changed = 0
+    for sql in (UPSERT_PROVIDERS_SQL, ADOPT_DRG_CODES_SQL, UPSERT_DRGS_SQL):
+        changed += int((await conn.execute(sql)).split()[-1])
+    return changed
+
+
+async def stage_files(dsn: str, sources: list, start: float, search_path: str, progress: dict) -> int:
+    # Parsing runs in a process pool and COPY on several connections, so neither is bound to one core.
+    # At most ETL_WORKERS + ETL_WRITERS parsed chunks are held at once, whatever the input size.
+    chunks = []
+    for path, data_year in sources:
+        header, ranges = split_file(path, ETL_CHUNK_BYTES)
+        kind = file_kind(header)
+        indexes = [header.index(col) for col, _ in FILE_KINDS[kind]]
+        chunks += [(path, chunk_start, chunk_end, kind, indexes, data_year) for chunk_start, chunk_end in ranges]
+        logging.info(f"{os.path.basename(path)}: {kind} file, data year {data_year}, {len(ranges)} chunks")
+    progress.update(chunks_total=len(chunks), chunks_done=0, rows_staged=0)
+    total_rows = 0
+    loop = asyncio.get_running_loop()
+    pending = asyncio.Semaphore(ETL_WORKERS + ETL_WRITERS)
+    workers = max(1, min(ETL_WORKERS, len(chunks)))
+    # spawn, not fork: the parent may be a server process with threads and open connections
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        async with asyncpg.create_pool(
+            dsn, min_size=ETL_WRITERS, max_size=ETL_WRITERS, server_settings={"search_path": search_path}
+        ) as writers:
+
+            async def load(chunk):
+                nonlocal total_rows
+                async with pending:
+                    rows, payload = await loop.run_in_executor(executor, parse_chunk, *chunk)
+                    async with writers.acquire() as conn:
+                        await conn.copy_to_table(
+                            STAGING_TABLE, source=io.BytesIO(payload), columns=staging_columns(chunk[3]), format='csv'
+                        )
+                total_rows += rows
+                progress.update(chunks_done=progress["chunks_done"] + 1, rows_staged=total_rows)
+                elapsed = time.perf_counter() - start
+                logging.info(f"Staged {total_rows} rows ({total_rows / elapsed:,.0f} rows/sec)")
+
+            tasks = [asyncio.create_task(load(chunk)) for chunk in chunks]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                # First failure: stop the other chunks before their connections go away
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+    return total_rows
+
+
+async def copy_load(database_url: str, sources: list, incremental: bool = False,
+                    progress: Optional[dict] = None) -> dict:
+    # sources: (path, data year) pairs from resolve_sources(). A full load replaces the data years of
+    # the service files: it is built in SHADOW_SCHEMA, off the hot path, and swapped in atomically.
+    # An incremental load patches the live tables in one transaction, writing only the changed rows.
+    # progress, if given, is updated in place (phase, chunks and rows staged).
+    progress = {} if progress is None else progress
+    start = time.perf_counter()
+    changes = {}
+    data_years = set()
+    for path, year in sources:
+        with open(path, 'rb') as f:
+            if file_kind(read_header(f)) == "service":
+                data_years.add(year)
+    data_years = sorted(data_years)
+    source = ", ".join(os.path.basename(path) for path, _ in sources)
+    dsn = asyncpg_dsn(database_url)
+    # Unqualified names (staging, providers, procedures, ...) resolve to the schema being written
+    search_path = "public" if incremental else f"{SHADOW_SCHEMA}, public"
+    conn = await asyncpg.connect(dsn, server_settings={"search_path": search_path})
+    try:
+        await acquire_load_lock(conn)
+        await seed_zip_centroids(conn)
+        if not incremental:
+            progress.update(phase="copying unchanged rows")
+            await create_shadow_tables(conn, data_years)
+        await conn.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+        await conn.execute(CREATE_STAGING_SQL)
+        progress.update(phase="staging")
+        total_rows = await stage_files(dsn, sources, start, search_path, progress)
+        await conn.execute(f"ANALYZE {STAGING_TABLE}")
+        copied = time.perf_counter()
+        progress.update(phase="merging")
+        # Outside the merge transaction: in place, a new partition briefly locks procedures against readers
+        staged = [tuple(row) for row in await conn.fetch(STAGED_PARTITIONS_SQL)]
+        created = await create_procedure_partitions(conn, staged)
+        if created:
+            logging.info(f"Created {created} procedures partitions")
+        if incremental:
+            # Delta only: indexes stay in place since few rows are written
+            async with conn.transaction():
+                dimensions = await upsert_dimensions(conn)
+                upserted = await conn.fetchrow(UPSERT_CHANGED_PROCEDURES_SQL)
+                deleted = await conn.execute(DELETE_REMOVED_PROCEDURES_SQL, data_years)
+                changes = {
+                    "inserted": upserted["inserted"],
+                    "updated": upserted["updated"],
+                    "deleted": int(deleted.split()[-1]),
+                }
+                version = None
+                if dimensions or any(changes.values()):
+                    # Serving caches (columnar engine, ...) reload when this changes
+                    version = await conn.fetchval(
+                        "INSERT INTO dataset_versions (source) VALUES ($1) RETURNING id", source
+                    )
+                    # Same transaction, so the price statistics never lag behind the rows they summarize
+                    await refresh_stats_views(conn)
+            merged = time.perf_counter()
+            await conn.execute("ANALYZE providers")
+            await conn.execute("ANALYZE drgs")
+            await conn.execute("ANALYZE procedures")
+            indexed = time.perf_counter()
+        else:
+            await upsert_dimensions(conn)
+            await conn.execute(MERGE_SQL)
+            merged = time.perf_counter()
+            progress.update(phase="indexing")
+            await finish_shadow_tables(conn)
+            indexed = time.perf_counter()
+            progress.update(phase="swapping")
+            # Only one previous version is kept
+            version = await swap_schemas(
+                conn, [("public", PREVIOUS_SCHEMA), (SHADOW_SCHEMA, "public")], source, replace_previous=True
+            )
+        providers = await conn.fetchval("SELECT count(*) FROM public.providers")
+    finally:
+        try:
+            # After a swap the shadow schema only holds the staging table; after a failure, the partial build
+            await conn.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+            if not incremental:
+                await conn.execute(f"DROP SCHEMA IF EXISTS {SHADOW_SCHEMA} CASCADE")
+        finally:
+            await conn.close()
+    finished = time.perf_counter()
+    progress.update(phase="done")
+    return {
+        "rows": total_rows,
+        "files": len(sources),
+        "providers": providers,
+        "data_years": data_years,
+        "dataset_version": version,
+        **changes,
+        "copy_seconds": copied - start,
+        "merge_seconds": merged - copied,
+        "index_seconds": indexed - merged,
+        "swap_seconds": finished - indexed,
+        "total_seconds": finished - start,
+        "rows_per_sec": total_rows / (finished - start) if finished > start else 0.0,
+    }
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from app.db.session import DATABASE_URL
+from app.services import dataset
+from app.services.etl import copy_load, resolve_sources, rollback_load
+
+# Dataset loads started from the admin API run as tasks in the worker that received the request;
+# only that worker knows about them. Paths are relative to ETL_DATA_DIR and may not leave it.
+ETL_DATA_DIR = os.path.abspath(os.getenv("ETL_DATA_DIR") or os.path.join(os.path.dirname(__file__), '../../resources'))
+MAX_FINISHED_JOBS = 20
+
+_jobs = OrderedDict()
+_tasks = {}
+
+
+def data_sources(patterns: list, data_year=None) -> list:
+    root = os.path.realpath(ETL_DATA_DIR)
+    sources = resolve_sources([os.path.join(root, pattern) for pattern in patterns], data_year)
+    for path, _ in sources:
+        if os.path.commonpath([root, os.path.realpath(path)]) != root:
+            raise ValueError(f"{path} is outside ETL_DATA_DIR")
+        if not os.path.isfile(path):
+            raise ValueError(f"No such file: {os.path.relpath(path, root)}")
+    return sources
+
+
+def running_job():
+    return next((job for job in _jobs.values() if job["status"] == "running"), None)
+
+
+def public_job(job: dict) -> dict:
+    finished = job["finished_at"] or time.time()
+    return {
+        **job,
+        "started_at": datetime.fromtimestamp(job["started_at"], timezone.utc).isoformat(),
+        "finished_at": datetime.fromtimestamp(job["finished_at"], timezone.utc).isoformat() if job["finished_at"] else None,
+        "elapsed_seconds": round(finished - job["started_at"], 1),
+    }
+
+
+def get_job(job_id: str):
+    job = _jobs.get(job_id)
+    return public_job(job) if job else None
+
+
+def list_jobs() -> list:
+    return [public_job(job) for job in reversed(_jobs.values())]
+
+
+async def _run(job: dict, work):
+    try:
+        job["result"] = await work
+        job["status"] = "succeeded"
+    except Exception as exc:
+        logging.exception(f"Dataset job {job['id']} failed")
+        job["status"] = "failed"
+        job["error"] = str(exc)
+    finally:
+        job["finished_at"] = time.time()
+        _tasks.pop(job["id"], None)
+    if job["status"] == "succeeded":
+        # This worker switches right away; the others within DATASET_POLL_SECONDS
+        try:
+            await dataset.refresh_version()
+        except Exception as exc:
+            logging.warning(f"Could not read the dataset version: {exc}")
+
+
+def start_job(kind: str, work_factory, **details) -> dict:
+    # work_factory(progress) returns the coroutine to run; progress is reported as the job's "progress"
+    if running_job():
+        raise RuntimeError("A dataset job is already running")
+    job = {
+        "id": uuid.uuid4().hex[:12], "kind": kind, "status": "running", **details,
+        "progress": {}, "result": None, "error": None, "started_at": time.time(), "finished_at": None,
+    }
+    _jobs[job["id"]] = job
+    while len(_jobs) > MAX_FINISHED_JOBS and next(iter(_jobs.values()))["status"] != "running":
+        _jobs.popitem(last=False)
+    _tasks[job["id"]] = asyncio.create_task(_run(job, work_factory(job["progress"])))
+    return public_job(job)
+
+
+def start_load(patterns: list, incremental: bool = False, data_year=None) -> dict:
+    sources = data_sources(patterns, data_year)
+    return start_job(
+        "load",
+        lambda progress: copy_load(DATABASE_URL, sources, incremental=incremental, progress=progress),
+        files=[os.path.relpath(path, ETL_DATA_DIR) for path, _ in sources],
+        incremental=incremental,
+    )
+
+
+def start_rollback() -> dict:
+    return start_job("rollback", lambda progress: rollback_load(DATABASE_URL))
+
+
+async def cancel_jobs():
+    # Shutdown: a cancelled load leaves the live tables untouched and drops its shadow schema
+    for task in list(_tasks.values()):
+        task.cancel()
+    await asyncio.gather(*_tasks.values(), return_exceptions=True)
@@ -0,0 +1,44 @@
+import csv
+import math
+import os
+from sqlalchemy import func
+
+ZIP_CENTROIDS_PATH = os.path.join(os.path.dirname(__file__), '../../resources/zip_centroids.csv')
+EARTH_RADIUS_KM = 6371.0088
+
+
+def load_zip_centroids(path: str = ZIP_CENTROIDS_PATH) -> dict:
+    # Bundled offline ZIP -> (latitude, longitude) centroid file
+    with open(path, newline='', encoding='utf-8') as f:
+        return {
+            row['zip_code']: (float(row['latitude']), float(row['longitude']))
+            for row in csv.DictReader(f)
+        }
+
+
+def bounding_box(lat: float, lon: float, radius_km: float):
+    # Lat/lon box that fully contains the circle, used as an index-friendly prefilter
+    lat_delta = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = max(lat - lat_delta, -90.0), min(lat + lat_delta, 90.0)
+    if min_lat == -90.0 or max_lat == 90.0:
+        return min_lat, max_lat, -180.0, 180.0
+    lon_delta = math.degrees(radius_km / (EARTH_RADIUS_KM * math.cos(math.radians(lat))))
+    min_lon, max_lon = lon - lon_delta, lon + lon_delta
+    if min_lon < -180.0 or max_lon > 180.0:
+        # Crosses the antimeridian: keep the latitude band only
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, min_lon, max_lon
+
+
+def haversine_km_expr(lat, lon, lat_col, lon_col, cos_lat=None):
+    # Great-circle distance in km as a SQL expression, evaluated only on prefiltered rows.
+    # Batch searches pass columns holding one center (and its precomputed cosine) per item.
+    dlat = func.radians(lat_col - lat)
+    dlon = func.radians(lon_col - lon)
+    if cos_lat is None:
+        cos_lat = math.cos(math.radians(lat))
+    a = (
+        func.power(func.sin(dlat * 0.5), 2)
+        + cos_lat * func.cos(func.radians(lat_col)) * func.power(func.sin(dlon * 0.5), 2)
+    )
+    return 2 * EARTH_RADIUS_KM * func.asin(func.sqrt(func.least(1.0, a)))
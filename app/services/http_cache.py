@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from app.services import dataset
+
+# Responses only change when the ETL records a new dataset version, so they are keyed by it
+HTTP_CACHE_MAX_AGE = int(os.getenv("HTTP_CACHE_MAX_AGE", "60"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def make_etag(version, path: str, params: dict) -> str:
+    digest = hashlib.sha1(json.dumps([path, params], sort_keys=True, default=str).encode()).hexdigest()[:16]
+    return f'"v{version}-{digest}"'
+
+
+def etag_matches(if_none_match, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Weak comparison, as If-None-Match requires
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags
+
+
+def dump(content) -> bytes:
+    return json.dumps(jsonable_encoder(content), separators=(",", ":")).encode()
+
+
+class ResponseCache:
+    """Serialized JSON bodies by ETag, least recently used evicted first once over max_bytes."""
+
+    def __init__(self, max_bytes: int = RESPONSE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, etag: str):
+        entry = self._entries.get(etag)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(etag)
+        return entry
+
+    def set(self, etag: str, body: bytes, headers: dict):
+        if len(body) > self.max_bytes:
+            return
+        if etag in self._entries:
+            self.size -= len(self._entries.pop(etag)[0])
+        self._entries[etag] = (body, headers)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    async def clear(self, version=None):
+        # Old entries can never be hit again once the version moved on; this only frees the memory
+        self._entries.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "bytes": self.size, "hits": self.hits, "misses": self.misses}
+
+
+response_cache = ResponseCache()
+
+
+async def cached_response(request: Request, params: dict, compute, vary: Optional[str] = None) -> Response:
+    # compute() returns (content, headers). Answers If-None-Match with 304, then the response cache,
+    # and only then runs the query. Without a known dataset version nothing is cached.
+    version = dataset.current_version
+    if version is None:
+        content, headers = await compute()
+        return Response(dump(content), media_type="application/json", headers=headers)
+    etag = make_etag(version, request.url.path, params)
+    cache_headers = {"ETag": etag, "Cache-Control": f"public, max-age={HTTP_CACHE_MAX_AGE}"}
+    if vary:
+        cache_headers["Vary"] = vary
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=cache_headers)
+    entry = response_cache.get(etag)
+    if entry is None:
+        content, headers = await compute()
+        entry = (dump(content), headers)
+        response_cache.set(etag, *entry)
+    body, headers = entry
+    return Response(body, media_type="application/json", headers={**headers, **cache_headers})
@@ -0,0 +1,186 @@
+import re
+from dataclasses import dataclass
+from typing import Optional
+from sqlalchemy import select, func, and_, literal, Float
+from app.db.models import Provider, Procedure, Drg, ZipCentroid
+from app.services import dataset
+from app.services.geo import bounding_box, haversine_km_expr
+
+DEFAULT_RADIUS_KM = 40
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 10
+
+STATES = {
+    "alabama": "AL", "alaska": "AK", "arizona": "AZ", "arkansas": "AR", "california": "CA",
+    "colorado": "CO", "connecticut": "CT", "delaware": "DE", "district of columbia": "DC",
+    "florida": "FL", "georgia": "GA", "hawaii": "HI", "idaho": "ID", "illinois": "IL",
+    "indiana": "IN", "iowa": "IA", "kansas": "KS", "kentucky": "KY", "louisiana": "LA",
+    "maine": "ME", "maryland": "MD", "massachusetts": "MA", "michigan": "MI", "minnesota": "MN",
+    "mississippi": "MS", "missouri": "MO", "montana": "MT", "nebraska": "NE", "nevada": "NV",
+    "new hampshire": "NH", "new jersey": "NJ", "new mexico": "NM", "new york": "NY",
+    "north carolina": "NC", "north dakota": "ND", "ohio": "OH", "oklahoma": "OK", "oregon": "OR",
+    "pennsylvania": "PA", "puerto rico": "PR", "rhode island": "RI", "south carolina": "SC",
+    "south dakota": "SD", "tennessee": "TN", "texas": "TX", "utah": "UT", "vermont": "VT",
+    "virginia": "VA", "washington": "WA", "west virginia": "WV", "wisconsin": "WI", "wyoming": "WY",
+}
+STATE_CODES = set(STATES.values())
+STATE_RE = "|".join(sorted(STATES, key=len, reverse=True)) + "|" + "|".join(code.lower() for code in STATE_CODES)
+
+# Filler words around the procedure name that never appear in DRG descriptions
+DRG_FILLER = {"a", "an", "the", "drg", "procedure", "procedures", "treatment", "surgery"}
+
+HOSPITALS = r"(?:(?P<plural>hospitals|providers|options)|(?P<single>hospital|provider|option))"
+LEAD = (
+    r"^(?:(?:what|which|where|show me|find|list)\s+)?(?:(?:hospitals|providers)\s+)?"
+    r"(?:(?:is|are|has|have|offers?)\s+)?(?:the\s+)?(?:top\s+(?P<count>\d+)\s+)?"
+)
+FOR = r"\s*(?:for|to treat|offering)\s+(?P<drg>.+?)"
+CHEAPEST = (
+    LEAD + r"(?:cheapest|least expensive|lowest[- ](?:cost|price|priced))\s+(?:(?:options?\s+)?in\s+)?"
+    + HOSPITALS + r"?" + FOR +
+    r"(?:\s+(?:(?:within\s+(?P<radius>\d+)\s*(?:km|kilometers)\s+of)|near|in|around|close to)\s+"
+    r"(?:zip(?:\s*code)?\s+)?(?P<zip>\d{5}))?$"
+)
+BEST_RATED = (
+    LEAD + r"(?:best|highest|top)[- ]rated\s+" + HOSPITALS + r"?" + FOR +
+    r"\s+in\s+(?P<state>" + STATE_RE + r")$"
+)
+AVERAGE_COST = (
+    r"^(?:what\s+is\s+|what's\s+)?(?:the\s+)?(?:average|mean|avg)\s+(?:cost|price|payment)s?\s+"
+    r"(?:of|for)\s+(?P<drg>.+?)(?:\s+in\s+(?P<state>" + STATE_RE + r"))?$"
+)
+PATTERNS = [
+    ("cheapest", re.compile(CHEAPEST)),
+    ("best_rated_in_state", re.compile(BEST_RATED)),
+    ("average_cost", re.compile(AVERAGE_COST)),
+]
+
+
+@dataclass
+class Intent:
+    name: str
+    drg_terms: list
+    limit: int = DEFAULT_LIMIT
+    zip_code: Optional[str] = None
+    radius_km: int = DEFAULT_RADIUS_KM
+    state: Optional[str] = None
+
+
+def normalize(question: str) -> str:
+    return " ".join(question.lower().replace("?", " ").split()).rstrip(".! ")
+
+
+def parse(question: str, vocabulary=None) -> Optional[Intent]:
+    # Returns None for anything that is not one of the known shapes; those go to the LLM.
+    # Every procedure word must be a known DRG term, so cities, typos or extra conditions never
+    # get answered with a wrong deterministic query; without a vocabulary (no data loaded yet) nothing matches.
+    q = normalize(question)
+    for name, pattern in PATTERNS:
+        match = pattern.match(q)
+        if not match:
+            continue
+        groups = match.groupdict()
+        drg_terms = [word for word in re.findall(r"[a-z0-9/]+", groups["drg"]) if word not in DRG_FILLER]
+        if not drg_terms or not vocabulary or not all(word in vocabulary for word in drg_terms):
+            return None
+        intent = Intent(name=name, drg_terms=drg_terms)
+        if groups.get("count"):
+            intent.limit = min(int(groups["count"]), MAX_LIMIT)
+        elif groups.get("single"):
+            # "the cheapest hospital" asks for a single result, same rule as the nl_to_sql prompt
+            intent.limit = 1
+        if groups.get("zip"):
+            intent.zip_code = groups["zip"]
+        if groups.get("radius"):
+            intent.radius_km = int(groups["radius"])
+        if groups.get("state"):
+            intent.state = STATES.get(groups["state"], groups["state"].upper())
+        return intent
+    return None
+
+
+def drg_terms_filter(terms):
+    # One ILIKE per word, ANDed, like the substring strategy in the nl_to_sql prompt
+    return and_(*(Drg.description.ilike(f"%{term}%") for term in terms))
+
+
+def build_query(intent: Intent, center=None, year=None):
+    # center is the (lat, lon) of intent.zip_code, when known; year limits procedures to one data year
+    row_filter = drg_terms_filter(intent.drg_terms)
+    if year is not None:
+        row_filter = and_(row_filter, Procedure.data_year == year)
+    if intent.name == "average_cost":
+        stmt = (
+            select(
+                Drg.description.label("ms_drg_definition"),
+                # Per discharge, so a hospital with 11 cases does not count as much as one with 500
+                (
+                    func.sum(Procedure.average_total_payments * Procedure.total_discharges)
+                    / func.nullif(func.sum(Procedure.total_discharges), 0)
+                ).label("average_total_payments"),
+                func.count(func.distinct(Procedure.provider_id)).label("provider_count"),
+            )
+            .select_from(Procedure)
+            .join(Procedure.provider)
+            .join(Procedure.drg)
+            .where(row_filter)
+            .group_by(Drg.description)
+            .order_by(Drg.description)
+        )
+        if intent.state:
+            # procedures.state (the state each year's file reported) is a partition key; providers.state is not
+            stmt = stmt.where(Procedure.state == intent.state)
+        return stmt
+    columns = [
+        Provider.name, Provider.city, Provider.state, Provider.zip_code, Provider.star_rating,
+        Drg.description.label("ms_drg_definition"), Procedure.average_total_payments,
+    ]
+    if intent.name == "cheapest":
+        if intent.zip_code is None:
+            return (
+                select(*columns)
+                .join(Provider.procedures)
+                .join(Procedure.drg)
+                .where(row_filter)
+                .order_by(Procedure.average_total_payments)
+                .limit(intent.limit)
+            )
+        if center is not None:
+            lat, lon = center
+            min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, intent.radius_km)
+            distance = haversine_km_expr(lat, lon, Provider.latitude, Provider.longitude)
+            location_filter = [
+                Provider.latitude.between(min_lat, max_lat),
+                Provider.longitude.between(min_lon, max_lon),
+                distance <= intent.radius_km,
+            ]
+        else:
+            distance = literal(None, Float)
+            location_filter = [Provider.zip_code == intent.zip_code]
+        return (
+            select(*columns, distance.label("distance_km"))
+            .join(Provider.procedures)
+            .join(Procedure.drg)
+            .where(row_filter, *location_filter)
+            .order_by(Procedure.average_total_payments)
+            .limit(intent.limit)
+        )
+    # best_rated_in_state
+    return (
+        select(*columns)
+        .join(Provider.procedures)
+        .join(Procedure.drg)
+        .where(row_filter, Procedure.state == intent.state)
+        .order_by(Provider.star_rating.desc(), Procedure.average_total_payments)
+        .limit(intent.limit)
+    )
+
+
+async def answer(session, intent: Intent) -> list:
+    center = None
+    if intent.zip_code:
+        center = (await session.execute(
+            select(ZipCentroid.latitude, ZipCentroid.longitude).where(ZipCentroid.zip_code == intent.zip_code)
+        )).first()
+    result = await session.execute(build_query(intent, center, dataset.latest_data_year))
+    return [dict(row._mapping) for row in result]
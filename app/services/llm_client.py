@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import random
+import time
+import httpx
+import openai
+from app.services import metrics
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL") or None  # point at a local OpenAI-compatible stub for tests
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_RATE_LIMIT_PER_SEC = float(os.getenv("LLM_RATE_LIMIT_PER_SEC", "20"))
+LLM_RATE_LIMIT_BURST = int(os.getenv("LLM_RATE_LIMIT_BURST", "40"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_RESET_SECONDS = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+
+
+class LLMUnavailableError(Exception):
+    pass
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class CircuitBreaker:
+    # Opens after consecutive timeouts/5xx, then lets a single trial call through after reset_seconds
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        state = self.state
+        if state == "open" or (state == "half_open" and self.trial_in_flight):
+            raise LLMUnavailableError("LLM backend circuit is open")
+        if state == "half_open":
+            self.trial_in_flight = True
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.failures >= self.failure_threshold or self.opened_at is not None:
+            if self.opened_at is None:
+                logging.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+
+class LLMClient:
+    """One AsyncOpenAI client per process, with keep-alive, bounded concurrency and fail-fast."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport = None):
+        # transport: an httpx.MockTransport (or any other) instead of the network, for tests
+        self.http_client = httpx.AsyncClient(
+            transport=transport,
+            limits=httpx.Limits(
+                max_connections=LLM_MAX_CONCURRENCY,
+                max_keepalive_connections=LLM_MAX_CONCURRENCY,
+                keepalive_expiry=60,
+            ),
+            timeout=LLM_TIMEOUT,
+        )
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            # Keep the app (and the /ask fast path) usable; LLM calls will fail with 401
+            logging.warning("OPENAI_API_KEY is not set")
+        self.client = openai.AsyncOpenAI(
+            api_key=api_key or "missing",
+            base_url=OPENAI_BASE_URL,
+            http_client=self.http_client,
+            max_retries=0,  # retries are handled below, with jitter and the breaker
+            timeout=LLM_TIMEOUT,
+        )
+        self.semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        self.bucket = TokenBucket(LLM_RATE_LIMIT_PER_SEC, LLM_RATE_LIMIT_BURST)
+        self.breaker = CircuitBreaker(LLM_BREAKER_FAILURES, LLM_BREAKER_RESET_SECONDS)
+
+    async def chat(self, messages, model: str = LLM_MODEL):
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            self.breaker.before_call()
+            await self.bucket.acquire()
+            start = time.perf_counter()
+            try:
+                async with self.semaphore:
+                    response = await asyncio.wait_for(
+                        self.client.chat.completions.create(model=model, messages=messages),
+                        LLM_TIMEOUT,
+                    )
+            except openai.RateLimitError as exc:
+                metrics.LLM_DURATION.observe(time.perf_counter() - start, outcome="rate_limited")
+                # 429 means the backend is healthy but busy: back off, do not trip the breaker
+                self.breaker.trial_in_flight = False
+                if attempt == LLM_MAX_RETRIES:
+                    raise LLMUnavailableError("LLM rate limit exceeded") from exc
+                await asyncio.sleep(self._backoff(attempt, exc.response))
+            except (asyncio.TimeoutError, openai.APITimeoutError, openai.InternalServerError) as exc:
+                metrics.LLM_DURATION.observe(time.perf_counter() - start, outcome="unavailable")
+                self.breaker.record_failure()
+                raise LLMUnavailableError(f"LLM backend unavailable: {exc!r}") from exc
+            except openai.APIConnectionError as exc:
+                metrics.LLM_DURATION.observe(time.perf_counter() - start, outcome="unavailable")
+                # Refused or dropped connections fail fast and are often transient (a restart, a stale
+                # keep-alive socket), so they are retried; each still counts against the breaker
+                self.breaker.record_failure()
+                if attempt == LLM_MAX_RETRIES:
+                    raise LLMUnavailableError(f"LLM backend unavailable: {exc!r}") from exc
+                await asyncio.sleep(self._backoff(attempt, None))
+            except Exception:
+                metrics.LLM_DURATION.observe(time.perf_counter() - start, outcome="error")
+                # The backend answered (e.g. 400/401), so it is not a health signal either way
+                self.breaker.trial_in_flight = False
+                raise
+            else:
+                metrics.LLM_DURATION.observe(time.perf_counter() - start, outcome="ok")
+                usage = getattr(response, "usage", None)
+                if usage is not None:
+                    metrics.LLM_TOKENS.inc(usage.prompt_tokens or 0, kind="prompt")
+                    metrics.LLM_TOKENS.inc(usage.completion_tokens or 0, kind="completion")
+                self.breaker.record_success()
+                return response
+
+    @staticmethod
+    def _backoff(attempt: int, response) -> float:
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), LLM_BACKOFF_MAX)
+            except ValueError:
+                pass
+        # Full jitter exponential backoff
+        return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+    async def aclose(self):
+        await self.client.close()
+        await self.http_client.aclose()
+
+
+llm_client = None
+
+
+def init_llm_client():
+    global llm_client
+    llm_client = LLMClient()
+    return llm_client
+
+
+async def close_llm_client():
+    global llm_client
+    if llm_client is not None:
+        await llm_client.aclose()
+    llm_client = None
+
+
+def get_llm_client() -> LLMClient:
+    # Scripts and benchmarks that skip the app lifespan get a lazily created client
+    return llm_client or init_llm_client()
@@ -1,9 +1,6 @@
-import os
-import openai
-import re
 import logging
-
-openai.api_key = os.getenv("OPENAI_API_KEY")
+from app.services import dataset
+from app.services.llm_client import get_llm_client
 
 IN_SCOPE_KEYWORDS = [
     "hospital", "cost", "price", "quality", "rating", "procedure", "drg", "medicare"
@@ -13,33 +10,69 @@ def is_in_scope(question: str) -> bool:
     q = question.lower()
     return any(kw in q for kw in IN_SCOPE_KEYWORDS)
 
+def data_year_rule(latest_year) -> str:
+    # The year is spelled out so the planner can skip every other year's partitions
+    default = f"otherwise {latest_year}, the latest loaded year" if latest_year is not None else "otherwise leave it out"
+    return (
+        f"procedures is partitioned by data_year and each year by state. Filter procedures.data_year = <year> "
+        f"with a literal year: the one the question asks about, {default}. When the question is about one state, "
+        f"also filter procedures.state = '<two-letter code>'. Filter data_year in the stats views the same way."
+    )
+
 async def nl_to_sql(question: str) -> str:
-    logging.info("nl_to_sql called")
+    logging.debug("nl_to_sql called")
     prompt = f"""
 You are a medical database assistant. Convert the following natural language question into a SQL query for a PostgreSQL database.
 
 The database has these tables and columns:
 
 Table: providers
-- provider_id (PK)
+- id (PK, integer)
+- provider_id (CMS CCN, text)
 - name
 - city
 - state
 - zip_code
 - star_rating
 
-Table: procedures
-- procedure_id (PK)
-- ms_drg_definition
+Table: drgs
+- id (PK)
+- code (MS-DRG code, e.g. '039')
+- description (the DRG definition text)
+- description_tsv (stored tsvector of description)
+
+Table: procedures (partitioned by data_year, then by state)
+- id (PK)
+- provider_id (FK to providers.id, integer; not providers.provider_id)
+- drg_id (FK to drgs.id)
 - total_discharges
 - average_covered_charges
 - average_total_payments
 - average_medicare_payments
-- provider_id (FK to providers.provider_id)
+- data_year (CMS data year, partition key)
+- state (the provider's two-letter state in that data year, sub-partition key)
+- zip_code (the provider's ZIP code in that data year)
+
+Join as: procedures JOIN providers ON providers.id = procedures.provider_id JOIN drgs ON drgs.id = procedures.drg_id.
+{data_year_rule(dataset.latest_data_year)}
 
-There are three matching strategies for ms_drg_definition:
-1. Fuzzy (typo-tolerant): Use similarity(ms_drg_definition, 'search_term') > 0.1 and order by similarity descending.
-2. Fulltext (advanced): Use to_tsvector('english', ms_drg_definition) @@ plainto_tsquery('english', 'search_term').
+Precomputed price statistics (materialized views, one row per DRG, area and data_year):
+
+View: drg_state_stats (area column: state)
+View: drg_zip3_stats (area column: zip3, the first three digits of the ZIP code)
+- drg_id, drg_code, ms_drg_definition, data_year
+- provider_count, total_discharges
+- mean_total_payments, mean_medicare_payments, mean_covered_charges (weighted by discharges)
+- p25_total_payments, median_total_payments, p75_total_payments, p90_total_payments
+- min_total_payments, max_total_payments
+
+For averages, medians, percentiles, ranges or provider counts of a DRG by state or ZIP area, select from these views
+instead of aggregating procedures, and match the DRG on their ms_drg_definition column with the strategies below.
+For a national figure, aggregate drg_state_stats rows (sum(mean_total_payments * total_discharges) / sum(total_discharges)).
+
+There are three matching strategies for drgs.description:
+1. Fuzzy (typo-tolerant): Use drgs.description % 'search_term' and order by similarity(drgs.description, 'search_term') descending.
+2. Fulltext (advanced): Use drgs.description_tsv @@ plainto_tsquery('english', 'search_term').
 3. Substring (case-insensitive): Use ILIKE '%search_term%'.
 
 Choose the best strategy based on the user's question:
@@ -53,16 +86,14 @@ If not specified, LIMIT 5.
 If the question asks in plurals like: hospitals, providers, procedures; return multiple results with LIMIT 5.
 If the question asks for the best or cheapest, and is explicit a single result, use LIMIT 1, otherwise LIMIT 5.
 
-Return fields based on the question and always add the whole ms_drg_definition, average_total_payments, zip_code and star_rating.
+Return fields based on the question and always add the whole drgs.description AS ms_drg_definition, average_total_payments, zip_code and star_rating.
 
 Question: {question}
 """
-    # logging.info(f"OpenAI prompt: {prompt}")
-    response = await openai.AsyncOpenAI().chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[{"role": "user", "content": prompt}]
-    )
-    # logging.info(f"OpenAI raw response: {response}")
+    logging.debug("OpenAI prompt: %s", prompt)
+    # Shared pooled client: keep-alive, concurrency/rate limits, timeouts, retries and circuit breaker
+    response = await get_llm_client().chat([{"role": "user", "content": prompt}])
+    logging.debug("OpenAI raw response: %s", response)
     sql = response.choices[0].message.content.strip()
     # Remove markdown code block markers if present
     if sql.startswith('```'):
@@ -73,6 +104,6 @@ Question: {question}
     # Remove only explanations, not the SQL query itself
     # If the response contains multiple queries, keep the first full query
     sql = sql.split(';')[0] + ';' if sql.count(';') == 1 else sql
-    logging.info(f"Sanitized SQL: {sql}")
-    logging.info("nl_to_sql finished")
+    logging.debug("Sanitized SQL: %s", sql)
+    logging.debug("nl_to_sql finished")
     return sql
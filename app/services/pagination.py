@@ -0,0 +1,35 @@
+import base64
+import hashlib
+import json
+import os
+
+PROVIDERS_PAGE_SIZE = int(os.getenv("PROVIDERS_PAGE_SIZE", "100"))
+PROVIDERS_MAX_PAGE_SIZE = int(os.getenv("PROVIDERS_MAX_PAGE_SIZE", "1000"))
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def query_fingerprint(**params) -> str:
+    # Ties a cursor to the search that produced it
+    return hashlib.sha1(json.dumps(params, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def encode_cursor(keys, fingerprint: str) -> str:
+    # keys: sort-key values of the last row on the page; floats survive json exactly (repr round-trips)
+    payload = json.dumps({"k": list(keys), "q": fingerprint}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, fingerprint: str) -> list:
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        keys, cursor_fingerprint = payload["k"], payload["q"]
+    except (ValueError, KeyError, TypeError) as exc:
+        raise InvalidCursorError("malformed cursor") from exc
+    if cursor_fingerprint != fingerprint or not isinstance(keys, list):
+        raise InvalidCursorError("cursor does not belong to this search")
+    if not all(isinstance(key, (int, float)) and not isinstance(key, bool) for key in keys):
+        raise InvalidCursorError("malformed cursor")
+    return keys
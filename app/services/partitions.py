@@ -0,0 +1,63 @@
+import re
+import asyncpg
+
+# procedures is LIST partitioned by data_year and every year again by state, so a query filtering on
+# data_year (and state) only reads those partitions. Values that are not a two-letter code land in the
+# year's DEFAULT partition. Partitions are created by the ETL before rows arrive, in the schema it writes.
+YEAR_PARTITION = "procedures_y{year}"
+STATE_PARTITION = "procedures_y{year}_{state}"
+STATE_CODE = re.compile(r"^[A-Z]{2}$")
+
+EXISTING_PARTITIONS_SQL = r"""
+SELECT tablename FROM pg_tables WHERE schemaname = current_schema() AND tablename LIKE 'procedures\_y%'
+"""
+# Every partition below schema.procedures, parents before their children
+PARTITION_TREE_SQL = """
+SELECT c.relname FROM pg_partition_tree(to_regclass($1)) t
+JOIN pg_class c ON c.oid = t.relid
+WHERE t.level > 0
+ORDER BY t.level, c.relname
+"""
+# Data years with a partition under the live procedures, newest first
+PARTITION_YEARS_SQL = r"""
+SELECT substring(pg_get_expr(c.relpartbound, c.oid) FROM '\((\d+)\)')::int AS data_year
+FROM pg_partition_tree(to_regclass('procedures')) t
+JOIN pg_class c ON c.oid = t.relid
+WHERE t.level = 1
+ORDER BY 1 DESC
+"""
+
+
+def partition_statements(pairs, existing: set) -> list:
+    # CREATE TABLE statements for the (data_year, state) pairs whose partitions are not in `existing`
+    existing = set(existing)
+    statements = []
+    for year, state in sorted(set(pairs)):
+        year = int(year)
+        year_table = YEAR_PARTITION.format(year=year)
+        if year_table not in existing:
+            statements.append(
+                f"CREATE TABLE {year_table} PARTITION OF procedures FOR VALUES IN ({year}) PARTITION BY LIST (state)"
+            )
+            statements.append(f"CREATE TABLE {year_table}_default PARTITION OF {year_table} DEFAULT")
+            existing.add(year_table)
+        if not STATE_CODE.match(state or ""):
+            continue
+        state_table = STATE_PARTITION.format(year=year, state=state.lower())
+        if state_table not in existing:
+            statements.append(f"CREATE TABLE {state_table} PARTITION OF {year_table} FOR VALUES IN ('{state}')")
+            existing.add(state_table)
+    return statements
+
+
+async def create_procedure_partitions(conn: asyncpg.Connection, pairs) -> int:
+    # Number of partitions created; indexes defined on procedures are added to them by Postgres
+    existing = {row["tablename"] for row in await conn.fetch(EXISTING_PARTITIONS_SQL)}
+    statements = partition_statements(pairs, existing)
+    for sql in statements:
+        await conn.execute(sql)
+    return len(statements)
+
+
+async def procedure_partitions(conn: asyncpg.Connection, schema: str) -> list:
+    return [row["relname"] for row in await conn.fetch(PARTITION_TREE_SQL, f"{schema}.procedures")]
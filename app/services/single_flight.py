@@ -0,0 +1,31 @@
+import asyncio
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one in-flight execution; nothing is kept afterwards."""
+
+    def __init__(self):
+        self._inflight = {}
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+        # Shielded so one caller disconnecting does not cancel the work for everyone else
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved, waiters already got it
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "executions": self.executions, "coalesced": self.coalesced}
@@ -0,0 +1,170 @@
+import json
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from app.services import dataset
+from app.services.drg_search import WORD_RE, drg_vocabulary
+
+SQL_CACHE_BACKEND = os.getenv("SQL_CACHE_BACKEND", "memory")  # memory, redis or none
+SQL_CACHE_TTL = int(os.getenv("SQL_CACHE_TTL", "3600"))
+SQL_CACHE_MAX_ENTRIES = int(os.getenv("SQL_CACHE_MAX_ENTRIES", "1024"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+ZIP_RE = re.compile(r'\b\d{5}\b')
+NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+
+
+class InMemoryCacheBackend:
+    def __init__(self, ttl: int = SQL_CACHE_TTL, max_entries: int = SQL_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: dict):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class RedisCacheBackend:
+    # Shared across workers; eviction follows the server's maxmemory-policy (use allkeys-lru)
+    def __init__(self, url: str = REDIS_URL, ttl: int = SQL_CACHE_TTL, prefix: str = "hcn:sql:"):
+        import redis.asyncio as redis
+        self.client = redis.from_url(url)
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key: str):
+        value = await self.client.get(self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: dict):
+        await self.client.set(self.prefix + key, json.dumps(value), ex=self.ttl)
+
+
+class SQLCache:
+    """Question -> SQL template cache; numbers, ZIPs and DRG terms are bound as parameters."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.uncacheable = 0
+
+    def normalize(self, question: str):
+        # Returns (key, params) where params is [(slot, value), ...] in order of appearance
+        q = " ".join(question.lower().split()).rstrip("?.! ")
+        params = []
+
+        def slot(kind):
+            def replace(match):
+                name = f"{{{kind}{sum(1 for s, _ in params if s.startswith('{' + kind))}}}"
+                params.append((name, match.group(0)))
+                return name
+            return replace
+
+        q = ZIP_RE.sub(slot("zip"), q)
+        q = NUMBER_RE.sub(slot("num"), q)
+        drg_slot = slot("drg")
+        q = WORD_RE.sub(lambda m: drg_slot(m) if m.group(0) in drg_vocabulary else m.group(0), q)
+        # Generated SQL defaults to the latest data year, so a new year starts new templates
+        return f"{dataset.latest_data_year}:{q}", params
+
+    @staticmethod
+    def _occurrences(sql: str, value: str):
+        pattern = re.compile(rf'(?<![A-Za-z0-9_.]){re.escape(value)}(?![A-Za-z0-9_])', re.IGNORECASE)
+        return list(pattern.finditer(sql))
+
+    def build_template(self, sql: str, params):
+        # Only cache SQL where every parameter appears exactly once, so rebinding is unambiguous
+        values = [value for _, value in params]
+        if len(set(values)) != len(values):
+            return None
+        spans = []
+        for slot, value in params:
+            matches = self._occurrences(sql, value)
+            if len(matches) != 1:
+                return None
+            spans.append((matches[0].start(), matches[0].end(), slot, matches[0].group(0).isupper()))
+        spans.sort()
+        segments, slots, position = [], [], 0
+        for start, end, slot, upper in spans:
+            segments.append(sql[position:start])
+            slots.append([slot, upper])
+            position = end
+        segments.append(sql[position:])
+        return {"segments": segments, "slots": slots}
+
+    @staticmethod
+    def bind(template: dict, params) -> str:
+        # Parameter values only ever contain [a-z0-9.], so they are safe to splice in
+        values = dict(params)
+        sql = template["segments"][0]
+        for (slot, upper), segment in zip(template["slots"], template["segments"][1:]):
+            value = values[slot]
+            sql += (value.upper() if upper else value) + segment
+        return sql
+
+    async def get(self, question: str):
+        key, params = self.normalize(question)
+        template = await self.backend.get(key)
+        if template is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.bind(template, params)
+
+    async def set(self, question: str, sql: str):
+        key, params = self.normalize(question)
+        template = self.build_template(sql, params)
+        if template is None:
+            self.uncacheable += 1
+            logging.debug("SQL cache: generated SQL cannot be parameterized for %r", key)
+            return
+        self.stores += 1
+        await self.backend.set(key, template)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "uncacheable": self.uncacheable,
+        }
+
+
+class NullCacheBackend:
+    async def get(self, key: str):
+        return None
+
+    async def set(self, key: str, value: dict):
+        pass
+
+
+def create_backend(name: str = SQL_CACHE_BACKEND):
+    if name == "redis":
+        return RedisCacheBackend()
+    if name == "none":
+        return NullCacheBackend()
+    return InMemoryCacheBackend()
+
+
+sql_cache = SQLCache(create_backend())
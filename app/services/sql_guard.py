@@ -0,0 +1,146 @@
+import json
+import os
+import re
+import asyncpg
+import sqlglot
+from sqlglot import exp
+from sqlalchemy import text
+
+# Generated SQL may only read these tables
+ALLOWED_TABLES = {"providers", "procedures", "drgs", "drg_state_stats", "drg_zip3_stats"}
+SQL_MAX_ROWS = int(os.getenv("SQL_MAX_ROWS", "100"))
+SQL_STREAM_MAX_ROWS = int(os.getenv("SQL_STREAM_MAX_ROWS", "100000"))  # NDJSON/CSV extracts from /ask
+SQL_MAX_PLAN_COST = float(os.getenv("SQL_MAX_PLAN_COST", "500000"))
+SQL_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", "5000"))
+# Generated SQL runs as this role (empty: as the connecting user). It can only SELECT from ALLOWED_TABLES,
+# so whatever slips past validate_sql() is still refused by Postgres.
+ASK_DB_ROLE = os.getenv("ASK_DB_ROLE", "hcn_ask")
+
+# Everything else is rejected, including catalog and admin functions that read outside ALLOWED_TABLES
+# (query_to_xml, lo_get, current_setting, ...). Typed sqlglot functions go by their sqlglot name (string_agg
+# is GROUP_CONCAT, date_trunc TIMESTAMP_TRUNC, @@ MATCH_AGAINST), the ones sqlglot does not know by their
+# Postgres name. Operators (AND, OR, ~, ...) are not function calls and are not checked.
+ALLOWED_FUNCTIONS = {
+    # aggregates and window functions
+    "count", "sum", "avg", "min", "max", "stddev", "stddev_pop", "stddev_samp", "variance", "variance_pop",
+    "corr", "percentile_cont", "percentile_disc", "mode", "array_agg", "group_concat", "logical_and",
+    "logical_or", "row_number", "rank", "dense_rank", "percent_rank", "cume_dist", "ntile", "lag", "lead",
+    "first_value", "last_value",
+    # math and conditionals
+    "abs", "round", "ceil", "floor", "trunc", "sqrt", "cbrt", "power", "exp", "ln", "log", "sign", "pi",
+    "greatest", "least", "coalesce", "nullif", "case", "if", "cast", "exists", "array",
+    # strings
+    "lower", "upper", "initcap", "length", "trim", "left", "right", "substring", "concat", "concat_ws",
+    "replace", "split_part", "str_position", "starts_with", "reverse", "pad", "regexp_replace",
+    # dates
+    "extract", "current_date", "current_timestamp", "timestamp_trunc", "time_to_str",
+    # fuzzy and full-text DRG search
+    "similarity", "word_similarity", "strict_word_similarity", "to_tsvector", "to_tsquery",
+    "plainto_tsquery", "phraseto_tsquery", "websearch_to_tsquery", "ts_rank", "ts_rank_cd", "match_against",
+}
+WRITE_NODES = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Create, exp.Drop, exp.Alter,
+    exp.Command, exp.Into, exp.Lock,
+)
+
+
+class UnsafeSQLError(ValueError):
+    pass
+
+
+def is_cte_reference(table: exp.Table) -> bool:
+    # Whether the name resolves to a CTE in scope rather than a real table. A CTE is visible in the body
+    # of its query and to the CTEs after it; with RECURSIVE to all of them, itself included.
+    name = table.name.lower()
+    child, node = table, table.parent
+    while node is not None:
+        if isinstance(node, exp.With):
+            position = next(i for i, cte in enumerate(node.expressions) if cte is child)
+            ctes = node.expressions if node.args.get("recursive") else node.expressions[:position]
+            if any(cte.alias_or_name.lower() == name for cte in ctes):
+                return True
+            # The query owning this WITH does not see its CTEs from inside them
+            child, node = node.parent, node.parent.parent
+            continue
+        with_ = node.args.get("with_") if isinstance(node, exp.Query) else None
+        if with_ is not None and any(cte.alias_or_name.lower() == name for cte in with_.expressions):
+            return True
+        child, node = node, node.parent
+    return False
+
+
+def validate_sql(sql: str, max_rows: int = SQL_MAX_ROWS) -> str:
+    # Returns the SQL to run: a single read-only SELECT over ALLOWED_TABLES, capped at max_rows
+    try:
+        statements = [stmt for stmt in sqlglot.parse(sql, read="postgres") if stmt is not None]
+    except sqlglot.errors.ParseError as exc:
+        raise UnsafeSQLError(f"could not parse SQL: {exc}") from exc
+    if len(statements) != 1:
+        raise UnsafeSQLError("exactly one statement is allowed")
+    stmt = statements[0]
+    if not isinstance(stmt, exp.Query):
+        raise UnsafeSQLError("only SELECT statements are allowed")
+    if stmt.find(*WRITE_NODES):
+        raise UnsafeSQLError("statement writes or locks data")
+    for table in stmt.find_all(exp.Table):
+        if table.catalog or (table.db and table.db.lower() != "public"):
+            raise UnsafeSQLError(f"schema {table.db} is not allowed")
+        if table.name.lower() not in ALLOWED_TABLES and (table.db or not is_cte_reference(table)):
+            raise UnsafeSQLError(f"table {table.name or table.sql()} is not allowed")
+    for func in stmt.find_all(exp.Func):
+        if isinstance(func, exp.Binary):
+            continue
+        name = func.name if isinstance(func, exp.Anonymous) else func.sql_name()
+        if name.lower() not in ALLOWED_FUNCTIONS or isinstance(func.parent, exp.Dot):
+            raise UnsafeSQLError(f"function {name} is not allowed")
+    sql = sql.strip().rstrip(";").strip()
+    limit = stmt.args.get("limit")
+    value = limit.expression if isinstance(limit, exp.Limit) else None
+    if isinstance(value, exp.Literal) and value.is_int and int(value.this) <= max_rows:
+        return sql
+    # Missing, too large or computed LIMIT: wrap rather than rewrite the generated SQL
+    # (on its own line, so a trailing -- comment cannot swallow the cap)
+    return f"SELECT * FROM ({sql}\n) AS guarded LIMIT {max_rows}"
+
+
+async def prepare_session(session, timeout_ms: int = SQL_STATEMENT_TIMEOUT_MS):
+    # Must run first in the transaction: read-only, and bounded so one question cannot hold a connection
+    await session.execute(text("SET TRANSACTION READ ONLY"))
+    await session.execute(
+        text("SELECT set_config('statement_timeout', :timeout, true)"), {"timeout": str(timeout_ms)}
+    )
+    if ASK_DB_ROLE:
+        await session.execute(text("SELECT set_config('role', :role, true)"), {"role": ASK_DB_ROLE})
+
+
+async def grant_ask_role(conn: asyncpg.Connection, schema: str = "public"):
+    # Creates ASK_DB_ROLE if needed and lets it read ALLOWED_TABLES in schema; tables swapped in by a load
+    # are new objects, so this runs again after every swap
+    if not ASK_DB_ROLE:
+        return
+    if not re.match(r"^[a-z_][a-z0-9_]*$", ASK_DB_ROLE):
+        raise ValueError(f"ASK_DB_ROLE {ASK_DB_ROLE!r} is not a plain lowercase identifier")
+    await conn.execute(f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = '{ASK_DB_ROLE}') THEN
+                CREATE ROLE {ASK_DB_ROLE} NOLOGIN;
+            END IF;
+            IF NOT pg_has_role(current_user, '{ASK_DB_ROLE}', 'MEMBER') THEN
+                GRANT {ASK_DB_ROLE} TO current_user;
+            END IF;
+        END $$
+    """)
+    await conn.execute(f"GRANT USAGE ON SCHEMA {schema} TO {ASK_DB_ROLE}")
+    tables = ", ".join(f"{schema}.{name}" for name in sorted(ALLOWED_TABLES))
+    await conn.execute(f"GRANT SELECT ON {tables} TO {ASK_DB_ROLE}")
+
+
+async def check_plan_cost(session, sql: str, max_cost: float = SQL_MAX_PLAN_COST) -> float:
+    # Planner estimate only (no ANALYZE), so this never runs the query itself
+    plan = (await session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"))).scalar()
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    cost = plan[0]["Plan"]["Total Cost"]
+    if cost > max_cost:
+        raise UnsafeSQLError(f"estimated cost {cost:,.0f} exceeds the limit of {max_cost:,.0f}")
+    return cost
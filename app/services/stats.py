@@ -0,0 +1,87 @@
+from typing import Optional
+import asyncpg
+from sqlalchemy import select, table, column
+from app.db.models import Drg
+from app.services.drg_search import drg_match, set_similarity_threshold
+
+# Precomputed price statistics, one row per (DRG, area, data year). The area is where the provider was
+# in that data year (procedures.state / zip_code), like the /ask fast path and the nl_to_sql prompt, so a
+# hospital that moved keeps its earlier years in the old area. Percentiles are over provider averages; the
+# means are weighted by discharges, so a 500-case hospital counts more than a 12-case one.
+STATS_VIEW_SQL = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS
+SELECT
+    p.drg_id,
+    d.code AS drg_code,
+    d.description AS ms_drg_definition,
+    {area} AS {area_name},
+    p.data_year,
+    count(*) AS provider_count,
+    sum(p.total_discharges) AS total_discharges,
+    sum(p.average_total_payments * p.total_discharges) / nullif(sum(p.total_discharges), 0) AS mean_total_payments,
+    percentile_cont(0.25) WITHIN GROUP (ORDER BY p.average_total_payments) AS p25_total_payments,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY p.average_total_payments) AS median_total_payments,
+    percentile_cont(0.75) WITHIN GROUP (ORDER BY p.average_total_payments) AS p75_total_payments,
+    percentile_cont(0.9) WITHIN GROUP (ORDER BY p.average_total_payments) AS p90_total_payments,
+    min(p.average_total_payments) AS min_total_payments,
+    max(p.average_total_payments) AS max_total_payments,
+    sum(p.average_medicare_payments * p.total_discharges) / nullif(sum(p.total_discharges), 0) AS mean_medicare_payments,
+    sum(p.average_covered_charges * p.total_discharges) / nullif(sum(p.total_discharges), 0) AS mean_covered_charges
+FROM procedures p
+JOIN drgs d ON d.id = p.drg_id
+GROUP BY p.drg_id, d.code, d.description, {area}, p.data_year
+"""
+# REFRESH ... CONCURRENTLY needs a unique index over every row
+STATS_INDEX_SQL = "CREATE UNIQUE INDEX IF NOT EXISTS uq_{name} ON {name} (drg_id, {area_name}, data_year)"
+
+STATS_VIEWS = {
+    "drg_state_stats": ("p.state", "state"),
+    "drg_zip3_stats": ("left(p.zip_code, 3)", "zip3"),
+}
+
+STATS_COLUMNS = [
+    "drg_code", "ms_drg_definition", "data_year", "provider_count", "total_discharges",
+    "mean_total_payments", "p25_total_payments", "median_total_payments", "p75_total_payments",
+    "p90_total_payments", "min_total_payments", "max_total_payments",
+    "mean_medicare_payments", "mean_covered_charges",
+]
+
+# Query-side handles; deliberately not in Base.metadata so create_all never makes them tables
+drg_state_stats = table("drg_state_stats", column("drg_id"), column("state"), *map(column, STATS_COLUMNS))
+drg_zip3_stats = table("drg_zip3_stats", column("drg_id"), column("zip3"), *map(column, STATS_COLUMNS))
+
+
+async def create_stats_views(conn: asyncpg.Connection):
+    # For databases built with create_all instead of migrations; a no-op once the views exist
+    for name, (area, area_name) in STATS_VIEWS.items():
+        await conn.execute(STATS_VIEW_SQL.format(name=name, area=area, area_name=area_name))
+        await conn.execute(STATS_INDEX_SQL.format(name=name, area_name=area_name))
+
+
+async def refresh_stats_views(conn: asyncpg.Connection):
+    # Readers keep seeing the previous contents until the refresh commits
+    for name in STATS_VIEWS:
+        await conn.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}")
+
+
+async def price_stats(session, drg: str, match_type: str = "substring", state: Optional[str] = None,
+                      zip3: Optional[str] = None, year: Optional[int] = None) -> list:
+    # Per ZIP3 when a ZIP prefix is given, per state otherwise
+    view, area = (drg_zip3_stats, "zip3") if zip3 else (drg_state_stats, "state")
+    drg_filter, _ = drg_match(match_type, drg)
+    if match_type == "fuzzy":
+        await set_similarity_threshold(session)
+    stmt = (
+        select(view.c[area], *(view.c[name] for name in STATS_COLUMNS))
+        .join(Drg, Drg.id == view.c.drg_id)
+        .where(drg_filter)
+        .order_by(view.c.ms_drg_definition, view.c[area], view.c.data_year)
+    )
+    if zip3:
+        stmt = stmt.where(view.c.zip3 == zip3)
+    elif state:
+        stmt = stmt.where(view.c.state == state)
+    if year is not None:
+        stmt = stmt.where(view.c.data_year == year)
+    result = await session.execute(stmt)
+    return [dict(row._mapping) for row in result]
@@ -0,0 +1,45 @@
+import csv
+import io
+import json
+from typing import Optional
+from fastapi.responses import StreamingResponse
+
+NDJSON = "application/x-ndjson"
+CSV = "text/csv"
+
+
+def requested_format(accept: Optional[str]) -> Optional[str]:
+    # Streaming is opt-in: only an explicit NDJSON or CSV Accept header switches a response to it
+    if not accept:
+        return None
+    for media_range in accept.split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+        if media_type in (NDJSON, CSV):
+            return media_type
+    return None
+
+
+async def ndjson_lines(items):
+    async for item in items:
+        yield json.dumps(item, default=str) + "\n"
+
+
+async def csv_lines(rows, columns=None):
+    # Header comes from `columns`, or from the first row when the shape is only known at run time
+    buffer = io.StringIO()
+    writer = None
+    async for row in rows:
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=columns or list(row), extrasaction="ignore")
+            writer.writeheader()
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if writer is None and columns:
+        yield ",".join(columns) + "\r\n"
+
+
+def response(items, media_type: str, columns=None) -> StreamingResponse:
+    body = ndjson_lines(items) if media_type == NDJSON else csv_lines(items, columns)
+    return StreamingResponse(body, media_type=media_type)
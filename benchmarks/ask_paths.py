@@ -0,0 +1,57 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import httpx
+
+# Questions the fast path recognizes, and questions that always need the LLM
+FAST_PATH_QUESTIONS = [
+    "Which hospitals have the lowest cost for CRANIOTOMY in 36301?",
+    "What are the cheapest options in hospitals for heart failure?",
+    "Best rated hospitals for sepsis in Texas",
+    "What is the average cost of major joint replacement in California?",
+]
+LLM_QUESTIONS = [
+    "What is the average cost for major joint replacement in Denver?",
+    "List hospitals with 9+ star ratings for cardiac procedures near 10032.",
+    "Which procedures have the biggest gap between covered charges and medicare payments?",
+]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def run(base_url: str, rounds: int):
+    latencies = {}
+    async with httpx.AsyncClient(base_url=base_url, timeout=60) as client:
+        for _ in range(rounds):
+            for question in FAST_PATH_QUESTIONS + LLM_QUESTIONS:
+                start = time.perf_counter()
+                response = await client.post("/ask", json={"question": question})
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                path = response.json().get("path", "error")
+                latencies.setdefault(path, []).append(elapsed_ms)
+    return {
+        path: {
+            "requests": len(values),
+            "mean_ms": statistics.mean(values),
+            "p50_ms": percentile(values, 50),
+            "p95_ms": percentile(values, 95),
+        }
+        for path, values in latencies.items()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare POST /ask latency per answering path")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args.base_url, args.rounds)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import json
+import sys
+
+# Metric name -> True when higher is better. Anything else in the reports, including the per-path
+# /ask breakdown (too few requests per path to be stable), is informational.
+METRICS = {
+    "p50_ms": False, "p95_ms": False, "p99_ms": False, "throughput_rps": True,
+    "total_seconds": False, "rows_per_sec": True,
+}
+# Error rates are compared in absolute terms: a handful of failures is a regression on its own
+MAX_ERROR_RATE_INCREASE = 0.01
+
+
+def flatten(values: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in values.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    # (metric, baseline, current, relative change, regressed) for every metric present in both runs
+    rows = []
+    base, cur = flatten(baseline["scenarios"]), flatten(current["scenarios"])
+    for key in sorted(base.keys() & cur.keys()):
+        name = key.rsplit(".", 1)[-1]
+        if ".paths." in key:
+            continue
+        if name == "error_rate":
+            rows.append((key, base[key], cur[key], cur[key] - base[key], cur[key] - base[key] > MAX_ERROR_RATE_INCREASE))
+            continue
+        if name not in METRICS or not base[key]:
+            continue
+        change = (cur[key] - base[key]) / base[key]
+        worse = -change if METRICS[name] else change
+        rows.append((key, base[key], cur[key], change, worse > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmarks/run.py reports; exits 1 on a regression")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Relative change that counts as a regression (0.10 = 10%% slower)")
+    args = parser.parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold)
+    regressions = [row for row in rows if row[4]]
+    width = max((len(row[0]) for row in rows), default=10)
+    for key, base, cur, change, regressed in rows:
+        print(f"{key:<{width}}  {base:>12.2f}  {cur:>12.2f}  {change:>+8.1%}{'  REGRESSION' if regressed else ''}")
+    missing = sorted(set(baseline["scenarios"]) - set(current["scenarios"]))
+    if missing:
+        print(f"Not in the current run: {', '.join(missing)}")
+    print(f"{len(regressions)} regression(s) over {args.threshold:.0%} in {len(rows)} metrics")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import argparse
+import csv
+import os
+import random
+
+ZIP_CENTROIDS_PATH = os.path.join(os.path.dirname(__file__), '../resources/zip_centroids.csv')
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+# Column names of the CMS MUP_INP_RY24_P03_V10_DY22_PrvSvc.csv file; the ETL finds its columns by header name,
+# so the order here does not have to match the real file's
+HEADER = [
+    'Rndrng_Prvdr_CCN', 'Rndrng_Prvdr_Org_Name', 'Rndrng_Prvdr_City', 'Rndrng_Prvdr_St', 'Rndrng_Prvdr_State_FIPS',
+    'Rndrng_Prvdr_Zip5', 'Rndrng_Prvdr_State_Abrvtn', 'Rndrng_Prvdr_RUCA', 'Rndrng_Prvdr_RUCA_Desc',
+    'DRG_Cd', 'DRG_Desc', 'Tot_Dschrgs', 'Avg_Submtd_Cvrd_Chrg', 'Avg_Tot_Pymt_Amt', 'Avg_Mdcr_Pymt_Amt',
+]
+
+# The real file at 1x: ~3,100 providers with ~47 DRGs each, ~146k rows
+PROVIDERS_PER_SCALE = 3100
+MIN_DRGS_PER_PROVIDER = 32  # uniform up to every DRG in the catalog, ~47 on average
+
+# (first MS-DRG code, family, typical total payment, severity suffixes in code order)
+SEVERITIES = ["with MCC", "with CC", "without CC/MCC"]
+DRG_FAMILIES = [
+    (25, "Craniotomy and Endovascular Intracranial Procedures", 38000, SEVERITIES),
+    (64, "Intracranial Hemorrhage or Cerebral Infarction", 11000, SEVERITIES),
+    (177, "Respiratory Infections and Inflammations", 12000, SEVERITIES),
+    (189, "Pulmonary Edema and Respiratory Failure", 9500, [""]),
+    (190, "Chronic Obstructive Pulmonary Disease", 8000, SEVERITIES),
+    (193, "Simple Pneumonia and Pleurisy", 8500, SEVERITIES),
+    (207, "Respiratory System Diagnosis with Ventilator Support >96 Hours", 52000, [""]),
+    (246, "Percutaneous Cardiovascular Procedures with Drug-Eluting Stent", 21000, ["with MCC or 4+ Arteries or Stents", "without MCC"]),
+    (280, "Acute Myocardial Infarction, Discharged Alive", 11000, SEVERITIES),
+    (291, "Heart Failure and Shock", 9000, SEVERITIES),
+    (308, "Cardiac Arrhythmia and Conduction Disorders", 7500, SEVERITIES),
+    (377, "G.I. Hemorrhage", 9000, SEVERITIES),
+    (391, "Esophagitis, Gastroenteritis and Miscellaneous Digestive Disorders", 6500, ["with MCC", "without MCC"]),
+    (469, "Major Hip and Knee Joint Replacement or Reattachment of Lower Extremity", 16000, ["with MCC or Total Ankle Replacement", "without MCC"]),
+    (480, "Hip and Femur Procedures Except Major Joint", 20000, SEVERITIES),
+    (637, "Diabetes", 7000, SEVERITIES),
+    (640, "Miscellaneous Disorders of Nutrition, Metabolism, Fluids and Electrolytes", 6000, ["with MCC", "without MCC"]),
+    (682, "Renal Failure", 8500, SEVERITIES),
+    (689, "Kidney and Urinary Tract Infections", 6500, ["with MCC", "without MCC"]),
+    (853, "Infectious and Parasitic Diseases with O.R. Procedure", 40000, SEVERITIES),
+    (870, "Septicemia or Severe Sepsis", 13000, ["with MV >96 Hours", "without MV >96 Hours with MCC", "without MV >96 Hours without MCC"]),
+    (885, "Psychoses", 8000, [""]),
+    (896, "Alcohol, Drug Abuse or Dependence without Rehabilitation Therapy", 7500, ["with MCC", "without MCC"]),
+    (917, "Poisoning and Toxic Effects of Drugs", 7000, ["with MCC", "without MCC"]),
+    (981, "Extensive O.R. Procedure Unrelated to Principal Diagnosis", 30000, SEVERITIES),
+]
+# Payment multiplier per suffix, by number of severity levels in the family
+SEVERITY_FACTORS = {1: [1.0], 2: [1.4, 0.8], 3: [1.6, 1.0, 0.7]}
+
+# First three ZIP digits -> state, so state level statistics look plausible
+ZIP3_STATES = [
+    (6, 9, "PR"), (10, 27, "MA"), (28, 29, "RI"), (30, 38, "NH"), (39, 49, "ME"), (50, 59, "VT"), (60, 69, "CT"),
+    (70, 89, "NJ"), (100, 149, "NY"), (150, 196, "PA"), (197, 199, "DE"), (200, 205, "DC"), (206, 219, "MD"),
+    (220, 246, "VA"), (247, 268, "WV"), (270, 289, "NC"), (290, 299, "SC"), (300, 319, "GA"), (320, 349, "FL"),
+    (350, 369, "AL"), (370, 385, "TN"), (386, 397, "MS"), (398, 399, "GA"), (400, 427, "KY"), (430, 459, "OH"),
+    (460, 479, "IN"), (480, 499, "MI"), (500, 528, "IA"), (530, 549, "WI"), (550, 567, "MN"), (570, 577, "SD"),
+    (580, 588, "ND"), (590, 599, "MT"), (600, 629, "IL"), (630, 658, "MO"), (660, 679, "KS"), (680, 693, "NE"),
+    (700, 714, "LA"), (716, 729, "AR"), (730, 749, "OK"), (750, 799, "TX"), (800, 816, "CO"), (820, 831, "WY"),
+    (832, 838, "ID"), (840, 847, "UT"), (850, 865, "AZ"), (870, 884, "NM"), (889, 898, "NV"), (900, 961, "CA"),
+    (967, 968, "HI"), (970, 979, "OR"), (980, 994, "WA"), (995, 999, "AK"),
+]
+NAME_PREFIXES = ["St. Mary", "Memorial", "Regional", "University", "Community", "General", "Mercy", "Baptist", "Valley", "County"]
+NAME_SUFFIXES = ["Hospital", "Medical Center", "Health System", "Regional Medical Center"]
+
+
+def drg_catalog() -> list:
+    # (DRG_Cd, DRG_Desc, typical payment)
+    drgs = []
+    for first_code, family, payment, suffixes in DRG_FAMILIES:
+        for i, (suffix, factor) in enumerate(zip(suffixes, SEVERITY_FACTORS[len(suffixes)])):
+            drgs.append((f"{first_code + i:03d}", f"{family} {suffix}".strip(), payment * factor))
+    return drgs
+
+
+def located_zips() -> list:
+    # (zip, state) for every bundled centroid inside a known ZIP3 range
+    with open(ZIP_CENTROIDS_PATH, newline='', encoding='utf-8') as f:
+        zips = [row['zip_code'] for row in csv.DictReader(f)]
+    located = []
+    for zip_code in zips:
+        prefix = int(zip_code[:3])
+        for low, high, state in ZIP3_STATES:
+            if low <= prefix <= high:
+                located.append((zip_code, state))
+                break
+    return located
+
+
+def generate(path: str, scale: float, seed: int) -> int:
+    rng = random.Random(seed)
+    drgs = drg_catalog()
+    zips = located_zips()
+    state_factors = {state: rng.lognormvariate(0, 0.15) for _, _, state in ZIP3_STATES}
+    rows = 0
+    with open(path, 'w', newline='', encoding='latin1') as f:
+        writer = csv.writer(f)
+        writer.writerow(HEADER)
+        for i in range(max(1, int(PROVIDERS_PER_SCALE * scale))):
+            zip_code, state = rng.choice(zips)
+            provider = [
+                f"{i:06d}", f"{rng.choice(NAME_PREFIXES)} {rng.choice(NAME_SUFFIXES)} {i}", f"City {zip_code[:3]}",
+                f"{rng.randint(1, 9999)} Main St", "00", zip_code, state, "1", "Metropolitan area core",
+            ]
+            cost_factor = rng.lognormvariate(0, 0.25) * state_factors[state]
+            for code, description, payment in rng.sample(drgs, rng.randint(MIN_DRGS_PER_PROVIDER, len(drgs))):
+                total = payment * cost_factor * rng.lognormvariate(0, 0.1)
+                writer.writerow(provider + [
+                    code, description,
+                    11 + int(rng.expovariate(1 / 40)),  # CMS suppresses rows under 11 discharges
+                    round(total * rng.uniform(2.5, 6.0), 2),
+                    round(total, 2),
+                    round(total * rng.uniform(0.78, 0.92), 2),
+                ])
+                rows += 1
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic CSV shaped like the CMS inpatient provider/service file")
+    parser.add_argument("--scale", type=float, default=1.0, help="1 is about the size of the real file (~146k rows), up to 50")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="CSV path (default benchmarks/data/MUP_INP_RY24_P03_V10_DY22_PrvSvc_x<scale>.csv)")
+    args = parser.parse_args()
+    if not 0 < args.scale <= 50:
+        raise SystemExit("--scale must be between 0 and 50")
+    path = args.output or os.path.join(DATA_DIR, f"MUP_INP_RY24_P03_V10_DY22_PrvSvc_x{args.scale:g}.csv")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    rows = generate(path, args.scale, args.seed)
+    print(f"Wrote {rows} rows to {path}")
+
+
+if __name__ == "__main__":
+    main()
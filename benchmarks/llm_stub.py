@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import random
+import re
+import time
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# OpenAI-compatible /v1/chat/completions that answers with canned SQL after a configurable delay,
+# so /ask can be benchmarked offline. Run the API with OPENAI_BASE_URL=http://localhost:8765/v1.
+DRG_TERMS = [
+    "craniotomy", "hemorrhage", "infarction", "respiratory", "pulmonary", "pneumonia", "ventilator", "stent",
+    "myocardial", "heart", "arrhythmia", "esophagitis", "joint", "hip", "femur", "diabetes", "nutrition",
+    "renal", "kidney", "septicemia", "sepsis", "psychoses", "alcohol", "poisoning",
+]
+DEFAULT_TERM = "failure"
+
+AVERAGE_SQL = (
+    "SELECT ms_drg_definition, state, mean_total_payments AS average_total_payments, provider_count "
+    "FROM drg_state_stats WHERE ms_drg_definition ILIKE '%{term}%' "
+    "ORDER BY mean_total_payments LIMIT 5;"
+)
+PROVIDERS_SQL = (
+    "SELECT pr.name, pr.city, pr.zip_code, pr.star_rating, d.description AS ms_drg_definition, "
+    "p.average_total_payments FROM procedures p "
+    "JOIN providers pr ON pr.id = p.provider_id JOIN drgs d ON d.id = p.drg_id "
+    "WHERE d.description ILIKE '%{term}%' ORDER BY p.average_total_payments LIMIT 5;"
+)
+
+app = FastAPI()
+settings = {"latency_ms": 800.0, "jitter_ms": 200.0, "error_rate": 0.0, "rate_limit_rate": 0.0, "retry_after": 1.0}
+
+
+def canned_sql(question: str) -> str:
+    words = re.findall(r"[a-z]+", question.lower())
+    term = next((word for word in words if word in DRG_TERMS), DEFAULT_TERM)
+    template = AVERAGE_SQL if "average" in words or "mean" in words else PROVIDERS_SQL
+    return template.format(term=term)
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    if random.random() < settings["rate_limit_rate"]:
+        # Like the real API: rejected up front, with the seconds to wait
+        return JSONResponse(
+            {"error": {"message": "stub rate limit", "type": "rate_limit_error"}}, status_code=429,
+            headers={"retry-after": str(settings["retry_after"])},
+        )
+    delay = max(0.0, settings["latency_ms"] + random.uniform(-1, 1) * settings["jitter_ms"]) / 1000
+    await asyncio.sleep(delay)
+    if random.random() < settings["error_rate"]:
+        return JSONResponse({"error": {"message": "stub overloaded", "type": "server_error"}}, status_code=503)
+    sql = canned_sql(prompt.rsplit("Question:", 1)[-1])
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "stub"),
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": sql}}],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(sql) // 4,
+                  "total_tokens": (len(prompt) + len(sql)) // 4},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stub for benchmarking /ask")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=800.0, help="Mean completion latency")
+    parser.add_argument("--jitter-ms", type=float, default=200.0, help="Uniform +/- jitter around the mean")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of calls answered with a 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of calls answered with a 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with each 429")
+    args = parser.parse_args()
+    settings.update(
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+    )
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
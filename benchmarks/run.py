@@ -0,0 +1,205 @@
+import sys
+import os
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+import httpx
+from dotenv import load_dotenv
+from ask_paths import FAST_PATH_QUESTIONS, LLM_QUESTIONS, percentile
+from generate_data import located_zips
+
+load_dotenv()
+
+SCENARIOS = ["etl", "providers_substring", "providers_fuzzy", "providers_fulltext", "ask"]
+# Search terms per match_type that all hit DRGs in the synthetic catalog (and in the real file)
+PROVIDER_TERMS = {
+    "substring": ["heart failure", "sepsis", "pneumonia", "renal failure", "joint", "diabetes", "291"],
+    "fuzzy": ["hart failure", "septicemia or severe sepsis", "pnuemonia", "renal failur", "diabtes"],
+    "fulltext": ["heart failure shock", "severe sepsis", "simple pneumonia", "kidney infections", "hip replacement"],
+}
+ASK_TEMPLATES = [
+    "Which hospitals have the lowest cost for {term} in {zip}?",
+    "What is the average cost of {term} in {state}?",
+    "Which {term} providers near {zip} have the biggest gap between covered charges and medicare payments?",
+]
+ASK_TERMS = ["heart failure", "sepsis", "pneumonia", "renal failure", "diabetes", "kidney infections"]
+
+
+def summarize(latencies: list, errors: int, elapsed: float) -> dict:
+    if not latencies:
+        return {"requests": 0, "errors": errors}
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": errors / len(latencies),
+        "throughput_rps": len(latencies) / elapsed,
+        "mean_ms": statistics.mean(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "max_ms": max(latencies),
+    }
+
+
+async def load(client: httpx.AsyncClient, requests: list, concurrency: int, by_path: bool = False) -> dict:
+    # requests are (method, url, kwargs); a fixed pool of workers keeps `concurrency` in flight
+    queue = asyncio.Queue()
+    for request in requests:
+        queue.put_nowait(request)
+    latencies, errors, paths = [], 0, {}
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            method, url, kwargs = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                body = response.json() if by_path and response.status_code < 400 else None
+                # /ask answers refusals and LLM or query failures with a 200 and {"error": ...}
+                failed = response.status_code >= 400 or (isinstance(body, dict) and "error" in body)
+            except (httpx.HTTPError, ValueError):
+                body, failed = None, True
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            latencies.append(elapsed_ms)
+            errors += failed
+            if by_path:
+                path = body.get("path", "error") if not failed else "error"
+                paths.setdefault(path, []).append(elapsed_ms)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    result = summarize(latencies, errors, time.perf_counter() - start)
+    if by_path:
+        result["paths"] = {
+            path: {"requests": len(values), "p50_ms": percentile(values, 50), "p95_ms": percentile(values, 95)}
+            for path, values in paths.items()
+        }
+    return result
+
+
+async def run_etl(csv_path: str, data_year: int) -> dict:
+    # Same schema preparation as scripts/etl.py, then a full load and an incremental reload of the same file
+    from sqlalchemy import text
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from app.db.models import Base
+    from app.services.etl import copy_load
+    from app.services.stats import create_stats_views
+
+    database_url = os.getenv("DATABASE_URL")
+    engine = create_async_engine(database_url)
+    async with engine.begin() as conn:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        await conn.run_sync(Base.metadata.create_all)
+        raw = await conn.get_raw_connection()
+        await create_stats_views(raw.driver_connection)
+    await engine.dispose()
+    full = await copy_load(database_url, [(csv_path, data_year)])
+    incremental = await copy_load(database_url, [(csv_path, data_year)], incremental=True)
+    keys = ("copy_seconds", "merge_seconds", "index_seconds", "total_seconds", "rows_per_sec")
+    return {
+        "rows": full["rows"],
+        "providers": full["providers"],
+        "full": {key: full[key] for key in keys},
+        "incremental": {key: incremental[key] for key in keys},
+    }
+
+
+def provider_requests(rng: random.Random, zips: list, match_type: str, count: int) -> list:
+    return [
+        ("GET", "/providers", {"params": {
+            "drg": rng.choice(PROVIDER_TERMS[match_type]), "zip": rng.choice(zips)[0],
+            "radius_km": rng.choice([10, 40, 100]), "match_type": match_type,
+        }})
+        for _ in range(count)
+    ]
+
+
+def ask_requests(rng: random.Random, zips: list, count: int) -> list:
+    # Fixed questions from ask_paths plus generated variations, so the fast path, the SQL cache and the LLM all show up
+    questions = []
+    for _ in range(count):
+        if rng.random() < 0.3:
+            questions.append(rng.choice(FAST_PATH_QUESTIONS + LLM_QUESTIONS))
+        else:
+            zip_code, state = rng.choice(zips)
+            questions.append(rng.choice(ASK_TEMPLATES).format(term=rng.choice(ASK_TERMS), zip=zip_code, state=state))
+    return [("POST", "/ask", {"json": {"question": question}}) for question in questions]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    zips = located_zips()
+    results = {}
+    if "etl" in args.scenarios:
+        if not args.csv:
+            raise SystemExit("The etl scenario needs --csv (see benchmarks/generate_data.py)")
+        print(f"etl: loading {args.csv}", file=sys.stderr)
+        results["etl"] = await run_etl(args.csv, args.year)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        for match_type in PROVIDER_TERMS:
+            name = f"providers_{match_type}"
+            if name in args.scenarios:
+                print(f"{name}: {args.requests} requests at concurrency {args.concurrency}", file=sys.stderr)
+                await load(client, provider_requests(rng, zips, match_type, args.warmup), args.concurrency)
+                results[name] = await load(
+                    client, provider_requests(rng, zips, match_type, args.requests), args.concurrency
+                )
+        if "ask" in args.scenarios:
+            print(f"ask: {args.ask_requests} requests at concurrency {args.ask_concurrency}", file=sys.stderr)
+            results["ask"] = await load(
+                client, ask_requests(rng, zips, args.ask_requests), args.ask_concurrency, by_path=True
+            )
+    return {
+        "meta": {
+            "git_revision": git_revision(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "args": vars(args),
+        },
+        "scenarios": results,
+    }
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark ETL, GET /providers and POST /ask; prints JSON")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"Comma separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--csv", help="CSV for the etl scenario, loaded into DATABASE_URL")
+    parser.add_argument("--year", type=int, default=2022, help="Data year for the etl scenario")
+    parser.add_argument("--requests", type=int, default=500, help="Requests per /providers scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed /providers requests before each scenario")
+    parser.add_argument("--ask-requests", type=int, default=200)
+    parser.add_argument("--ask-concurrency", type=int, default=32)
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Also write the JSON report here")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    report = json.dumps(asyncio.run(main(args)), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    print(report)
@@ -1,10 +1,46 @@
 import logging
 logging.basicConfig(level=logging.INFO)
+from dotenv import load_dotenv
+load_dotenv()
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.api import providers, ask
+from app.api import providers, ask, drgs, stats, admin, metrics as metrics_api
+from app.db import session as db_session
+from app.services.drg_search import reload_drg_vocabulary
+from app.services import columnar, dataset, drg_suggest, etl_jobs, http_cache, metrics
+from app.services.llm_client import init_llm_client, close_llm_client
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    db_session.init_engine()
+    await db_session.start_replica_checks()
+    init_llm_client()
+    dataset.on_version_change(drg_suggest.rebuild)
+    # DRG terms drive the /ask fast path and the SQL cache parameters
+    dataset.on_version_change(reload_drg_vocabulary)
+    if columnar.SERVING_MODE == "columnar":
+        dataset.on_version_change(columnar.reload)
+    # Last, so entries computed from the old in-memory data are dropped once everything has reloaded
+    dataset.on_version_change(http_cache.response_cache.clear)
+    # Listeners load on the first poll (with or without a version), then reload whenever the ETL records a new one
+    try:
+        await dataset.refresh_version()
+    except Exception as exc:
+        logging.warning(f"Could not read the dataset version: {exc}")
+    dataset.start_watcher()
+    yield
+    await etl_jobs.cancel_jobs()
+    await dataset.stop_watcher()
+    await close_llm_client()
+    await db_session.dispose_engine()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.include_router(providers.router)
 app.include_router(ask.router)
+app.include_router(drgs.router)
+app.include_router(stats.router)
+app.include_router(admin.router)
+app.include_router(metrics_api.router)
@@ -0,0 +1,47 @@
+"""Add a read-only role for SQL generated by /ask
+
+Revision ID: 1d7f3b9e5c28
+Revises: 9b6d4e2f1a37
+Create Date: 2025-10-14 09:41:07.335128
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1d7f3b9e5c28'
+down_revision: Union[str, None] = '9b6d4e2f1a37'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Same default as the app; an empty ASK_DB_ROLE leaves generated SQL running as the connecting user
+ASK_DB_ROLE = os.getenv("ASK_DB_ROLE", "hcn_ask")
+READABLE_TABLES = "providers, procedures, drgs, drg_state_stats, drg_zip3_stats"
+
+
+def upgrade():
+    if not ASK_DB_ROLE:
+        return
+    op.execute(f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT FROM pg_roles WHERE rolname = '{ASK_DB_ROLE}') THEN
+                CREATE ROLE {ASK_DB_ROLE} NOLOGIN;
+            END IF;
+            IF NOT pg_has_role(current_user, '{ASK_DB_ROLE}', 'MEMBER') THEN
+                GRANT {ASK_DB_ROLE} TO current_user;
+            END IF;
+        END $$
+    """)
+    op.execute(f"GRANT USAGE ON SCHEMA public TO {ASK_DB_ROLE}")
+    op.execute(f"GRANT SELECT ON {READABLE_TABLES} TO {ASK_DB_ROLE}")
+
+def downgrade():
+    if not ASK_DB_ROLE:
+        return
+    # Revokes what the role was granted in this database; the role itself is shared by the cluster
+    op.execute(f"REVOKE SELECT ON {READABLE_TABLES} FROM {ASK_DB_ROLE}")
+    op.execute(f"REVOKE USAGE ON SCHEMA public FROM {ASK_DB_ROLE}")
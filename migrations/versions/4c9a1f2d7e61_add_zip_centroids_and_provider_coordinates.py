@@ -0,0 +1,62 @@
+"""Add zip_centroids and provider coordinates
+
+Revision ID: 4c9a1f2d7e61
+Revises: 3e34439fece5
+Create Date: 2025-09-20 10:12:31.204518
+
+"""
+import csv
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4c9a1f2d7e61'
+down_revision: Union[str, None] = '3e34439fece5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+ZIP_CENTROIDS_PATH = os.path.join(os.path.dirname(__file__), '../../resources/zip_centroids.csv')
+
+
+def load_zip_centroids():
+    # Frozen copy of the reader in app/services/geo.py as of this revision
+    with open(ZIP_CENTROIDS_PATH, newline='', encoding='utf-8') as f:
+        return {
+            row['zip_code']: (float(row['latitude']), float(row['longitude']))
+            for row in csv.DictReader(f)
+        }
+
+
+def upgrade():
+    zip_centroids = op.create_table('zip_centroids',
+        sa.Column('zip_code', sa.String(), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.PrimaryKeyConstraint('zip_code')
+    )
+    op.bulk_insert(zip_centroids, [
+        {'zip_code': zip_code, 'latitude': lat, 'longitude': lon}
+        for zip_code, (lat, lon) in load_zip_centroids().items()
+    ])
+    op.add_column('providers', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('providers', sa.Column('longitude', sa.Float(), nullable=True))
+    # Backfill coordinates for providers that are already loaded
+    op.execute("""
+        UPDATE providers p
+        SET latitude = z.latitude, longitude = z.longitude
+        FROM zip_centroids z
+        WHERE z.zip_code = p.zip_code
+    """)
+    op.create_index('ix_providers_lat_lon', 'providers', ['latitude', 'longitude'], unique=False)
+    op.create_index(op.f('ix_procedures_provider_id'), 'procedures', ['provider_id'], unique=False)
+
+def downgrade():
+    op.drop_index(op.f('ix_procedures_provider_id'), table_name='procedures')
+    op.drop_index('ix_providers_lat_lon', table_name='providers')
+    op.drop_column('providers', 'longitude')
+    op.drop_column('providers', 'latitude')
+    op.drop_table('zip_centroids')
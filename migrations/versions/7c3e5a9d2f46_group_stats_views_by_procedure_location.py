@@ -0,0 +1,89 @@
+"""Group the price statistics by the location each procedure row was reported under
+
+Revision ID: 7c3e5a9d2f46
+Revises: 1d7f3b9e5c28
+Create Date: 2025-10-19 11:02:45.571204
+
+"""
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c3e5a9d2f46'
+down_revision: Union[str, None] = '1d7f3b9e5c28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PREVIOUS_SCHEMA = "etl_previous"
+ASK_DB_ROLE = os.getenv("ASK_DB_ROLE", "hcn_ask")
+# Frozen copy of the view definitions as of this revision; later changes to app/services must not
+# change what this migration does
+STATS_VIEW_SQL = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS
+SELECT
+    p.drg_id,
+    d.code AS drg_code,
+    d.description AS ms_drg_definition,
+    {area} AS {area_name},
+    p.data_year,
+    count(*) AS provider_count,
+    sum(p.total_discharges) AS total_discharges,
+    sum(p.average_total_payments * p.total_discharges) / nullif(sum(p.total_discharges), 0) AS mean_total_payments,
+    percentile_cont(0.25) WITHIN GROUP (ORDER BY p.average_total_payments) AS p25_total_payments,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY p.average_total_payments) AS median_total_payments,
+    percentile_cont(0.75) WITHIN GROUP (ORDER BY p.average_total_payments) AS p75_total_payments,
+    percentile_cont(0.9) WITHIN GROUP (ORDER BY p.average_total_payments) AS p90_total_payments,
+    min(p.average_total_payments) AS min_total_payments,
+    max(p.average_total_payments) AS max_total_payments,
+    sum(p.average_medicare_payments * p.total_discharges) / nullif(sum(p.total_discharges), 0) AS mean_medicare_payments,
+    sum(p.average_covered_charges * p.total_discharges) / nullif(sum(p.total_discharges), 0) AS mean_covered_charges
+FROM procedures p
+JOIN drgs d ON d.id = p.drg_id
+GROUP BY p.drg_id, d.code, d.description, {area}, p.data_year
+"""
+STATS_INDEX_SQL = "CREATE UNIQUE INDEX IF NOT EXISTS uq_{name} ON {name} (drg_id, {area_name}, data_year)"
+STATS_VIEWS = {
+    "drg_state_stats": ("p.state", "state"),
+    "drg_zip3_stats": ("left(p.zip_code, 3)", "zip3"),
+}
+# Before this revision the views grouped by the provider's current location
+PROVIDER_STATS_VIEW_SQL = STATS_VIEW_SQL.replace(
+    "FROM procedures p\n", "FROM procedures p\nJOIN providers pr ON pr.id = p.provider_id\n"
+)
+PROVIDER_STATS_VIEWS = {
+    "drg_state_stats": ("pr.state", "state"),
+    "drg_zip3_stats": ("left(pr.zip_code, 3)", "zip3"),
+}
+
+
+def replace_stats_views(view_sql, views):
+    for name in views:
+        op.execute(f"DROP MATERIALIZED VIEW IF EXISTS {name}")
+    for name, (area, area_name) in views.items():
+        op.execute(view_sql.format(name=name, area=area, area_name=area_name))
+        op.execute(STATS_INDEX_SQL.format(name=name, area_name=area_name))
+    # Dropping the views dropped their grants too
+    if ASK_DB_ROLE:
+        op.execute(f"GRANT SELECT ON {', '.join(views)} TO {ASK_DB_ROLE}")
+
+
+def upgrade():
+    # Tables kept for rollback_load() have no zip_code and must not be swapped back in
+    op.execute(f"DROP SCHEMA IF EXISTS {PREVIOUS_SCHEMA} CASCADE")
+    # Added to every partition as well
+    op.add_column('procedures', sa.Column('zip_code', sa.String(), nullable=True))
+    # Rows loaded before this revision take their provider's current ZIP. Their fingerprints do not
+    # include the ZIP, so the next incremental load of a year rewrites them with the ZIPs from its file.
+    op.execute("UPDATE procedures p SET zip_code = pr.zip_code FROM providers pr WHERE pr.id = p.provider_id")
+    replace_stats_views(STATS_VIEW_SQL, STATS_VIEWS)
+
+def downgrade():
+    for name in STATS_VIEWS:
+        op.execute(f"DROP MATERIALIZED VIEW IF EXISTS {name}")
+    op.execute(f"DROP SCHEMA IF EXISTS {PREVIOUS_SCHEMA} CASCADE")
+    op.drop_column('procedures', 'zip_code')
+    replace_stats_views(PROVIDER_STATS_VIEW_SQL, PROVIDER_STATS_VIEWS)
@@ -0,0 +1,38 @@
+"""Add DRG trigram and tsvector indexes
+
+Revision ID: 8d2e5b7a9c14
+Revises: 4c9a1f2d7e61
+Create Date: 2025-09-21 09:03:47.662190
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2e5b7a9c14'
+down_revision: Union[str, None] = '4c9a1f2d7e61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    # Trigram index serves both ILIKE '%x%' (substring) and the `%` operator (fuzzy)
+    op.create_index(
+        'ix_procedures_ms_drg_definition_trgm', 'procedures', ['ms_drg_definition'],
+        postgresql_using='gin', postgresql_ops={'ms_drg_definition': 'gin_trgm_ops'}
+    )
+    # Stored tsvector so fulltext no longer recomputes to_tsvector per row per request
+    op.add_column('procedures', sa.Column(
+        'ms_drg_tsv', postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('english', coalesce(ms_drg_definition, ''))", persisted=True)
+    ))
+    op.create_index('ix_procedures_ms_drg_tsv', 'procedures', ['ms_drg_tsv'], postgresql_using='gin')
+
+def downgrade():
+    op.drop_index('ix_procedures_ms_drg_tsv', table_name='procedures')
+    op.drop_column('procedures', 'ms_drg_tsv')
+    op.drop_index('ix_procedures_ms_drg_definition_trgm', table_name='procedures')
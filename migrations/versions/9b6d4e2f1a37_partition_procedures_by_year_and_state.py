@@ -0,0 +1,161 @@
+"""Partition procedures by data_year and state
+
+Revision ID: 9b6d4e2f1a37
+Revises: f3a9c5d1b284
+Create Date: 2025-10-06 10:14:32.418907
+
+"""
+import re
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b6d4e2f1a37'
+down_revision: Union[str, None] = 'f3a9c5d1b284'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PREVIOUS_SCHEMA = "etl_previous"
+STATE_CODE = re.compile(r"^[A-Z]{2}$")
+# Frozen copies of the ETL's schema, partition naming and view definitions as of this revision;
+# later changes to app/services must not change what this migration does
+STATS_VIEW_SQL = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS
+SELECT
+    p.drg_id,
+    d.code AS drg_code,
+    d.description AS ms_drg_definition,
+    {area} AS {area_name},
+    p.data_year,
+    count(*) AS provider_count,
+    sum(p.total_discharges) AS total_discharges,
+    sum(p.average_total_payments * p.total_discharges) / nullif(sum(p.total_discharges), 0) AS mean_total_payments,
+    percentile_cont(0.25) WITHIN GROUP (ORDER BY p.average_total_payments) AS p25_total_payments,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY p.average_total_payments) AS median_total_payments,
+    percentile_cont(0.75) WITHIN GROUP (ORDER BY p.average_total_payments) AS p75_total_payments,
+    percentile_cont(0.9) WITHIN GROUP (ORDER BY p.average_total_payments) AS p90_total_payments,
+    min(p.average_total_payments) AS min_total_payments,
+    max(p.average_total_payments) AS max_total_payments,
+    sum(p.average_medicare_payments * p.total_discharges) / nullif(sum(p.total_discharges), 0) AS mean_medicare_payments,
+    sum(p.average_covered_charges * p.total_discharges) / nullif(sum(p.total_discharges), 0) AS mean_covered_charges
+FROM procedures p
+JOIN providers pr ON pr.id = p.provider_id
+JOIN drgs d ON d.id = p.drg_id
+GROUP BY p.drg_id, d.code, d.description, {area}, p.data_year
+"""
+STATS_INDEX_SQL = "CREATE UNIQUE INDEX IF NOT EXISTS uq_{name} ON {name} (drg_id, {area_name}, data_year)"
+STATS_VIEWS = {
+    "drg_state_stats": ("pr.state", "state"),
+    "drg_zip3_stats": ("left(pr.zip_code, 3)", "zip3"),
+}
+
+VALUE_COLUMNS = """
+    id, provider_id, drg_id, total_discharges, average_covered_charges,
+    average_total_payments, average_medicare_payments, data_year, row_hash
+"""
+
+
+def partition_statements(pairs):
+    # procedures_y{year} by state, with a DEFAULT partition for values that are not a two-letter code
+    existing = set()
+    statements = []
+    for year, state in sorted(set(pairs)):
+        year = int(year)
+        year_table = f"procedures_y{year}"
+        if year_table not in existing:
+            statements.append(
+                f"CREATE TABLE {year_table} PARTITION OF procedures FOR VALUES IN ({year}) PARTITION BY LIST (state)"
+            )
+            statements.append(f"CREATE TABLE {year_table}_default PARTITION OF {year_table} DEFAULT")
+            existing.add(year_table)
+        if STATE_CODE.match(state or ""):
+            statements.append(f"CREATE TABLE {year_table}_{state.lower()} PARTITION OF {year_table} FOR VALUES IN ('{state}')")
+    return statements
+
+
+def rename_procedures(new_name):
+    # Index, constraint and sequence names are per schema, so the old table gives up its own
+    op.rename_table('procedures', new_name)
+    op.execute(f"ALTER TABLE {new_name} RENAME CONSTRAINT procedures_pkey TO {new_name}_pkey")
+    op.execute(f"ALTER TABLE {new_name} RENAME CONSTRAINT uq_procedures_provider_drg_year TO uq_{new_name}")
+    op.execute(f"ALTER INDEX ix_procedures_provider_id RENAME TO ix_{new_name}_provider_id")
+    op.execute(f"ALTER INDEX ix_procedures_drg_id RENAME TO ix_{new_name}_drg_id")
+    op.execute(f"ALTER SEQUENCE procedures_id_seq RENAME TO {new_name}_id_seq")
+
+
+def procedure_columns(partitioned):
+    columns = [
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('provider_id', sa.Integer(), sa.ForeignKey('providers.id', name='procedures_provider_id_fkey'), nullable=False),
+        sa.Column('drg_id', sa.Integer(), sa.ForeignKey('drgs.id', name='procedures_drg_id_fkey'), nullable=False),
+        sa.Column('total_discharges', sa.Integer(), nullable=True),
+        sa.Column('average_covered_charges', sa.Float(), nullable=True),
+        sa.Column('average_total_payments', sa.Float(), nullable=True),
+        sa.Column('average_medicare_payments', sa.Float(), nullable=True),
+        sa.Column('data_year', sa.Integer(), primary_key=partitioned, nullable=False),
+        sa.Column('row_hash', sa.String(), nullable=True),
+    ]
+    if partitioned:
+        columns.insert(8, sa.Column('state', sa.String(), primary_key=True))
+    return columns
+
+
+def finish_procedures():
+    op.execute(
+        "SELECT setval(pg_get_serial_sequence('procedures', 'id'), coalesce(max(id), 0) + 1, false) FROM procedures"
+    )
+    op.create_index(op.f('ix_procedures_provider_id'), 'procedures', ['provider_id'], unique=False)
+    op.create_index(op.f('ix_procedures_drg_id'), 'procedures', ['drg_id'], unique=False)
+    op.execute("ANALYZE procedures")
+
+
+def upgrade():
+    # The price statistics read procedures; they are rebuilt over the new table at the end
+    for name in STATS_VIEWS:
+        op.execute(f"DROP MATERIALIZED VIEW IF EXISTS {name}")
+    # Tables kept for rollback_load() have the old layout and must not be swapped back in
+    op.execute(f"DROP SCHEMA IF EXISTS {PREVIOUS_SCHEMA} CASCADE")
+    rename_procedures('procedures_unpartitioned')
+    op.create_table(
+        'procedures',
+        *procedure_columns(partitioned=True),
+        sa.UniqueConstraint('provider_id', 'drg_id', 'data_year', 'state', name='uq_procedures_provider_drg_year'),
+        postgresql_partition_by='LIST (data_year)',
+    )
+    # Existing rows take their provider's current state
+    pairs = op.get_bind().execute(sa.text("""
+        SELECT DISTINCT p.data_year, coalesce(pr.state, '')
+        FROM procedures_unpartitioned p JOIN providers pr ON pr.id = p.provider_id
+    """)).all()
+    for sql in partition_statements(pairs):
+        op.execute(sql)
+    op.execute(f"""
+        INSERT INTO procedures ({VALUE_COLUMNS}, state)
+        SELECT {', '.join(f'p.{name.strip()}' for name in VALUE_COLUMNS.split(','))}, coalesce(pr.state, '')
+        FROM procedures_unpartitioned p JOIN providers pr ON pr.id = p.provider_id
+    """)
+    op.drop_table('procedures_unpartitioned')
+    finish_procedures()
+    for name, (area, area_name) in STATS_VIEWS.items():
+        op.execute(STATS_VIEW_SQL.format(name=name, area=area, area_name=area_name))
+        op.execute(STATS_INDEX_SQL.format(name=name, area_name=area_name))
+
+def downgrade():
+    for name in STATS_VIEWS:
+        op.execute(f"DROP MATERIALIZED VIEW IF EXISTS {name}")
+    rename_procedures('procedures_partitioned')
+    op.create_table(
+        'procedures',
+        *procedure_columns(partitioned=False),
+        sa.UniqueConstraint('provider_id', 'drg_id', 'data_year', name='uq_procedures_provider_drg_year'),
+    )
+    op.execute(f"INSERT INTO procedures ({VALUE_COLUMNS}) SELECT {VALUE_COLUMNS} FROM procedures_partitioned")
+    # Drops every partition with it
+    op.drop_table('procedures_partitioned')
+    finish_procedures()
+    for name, (area, area_name) in STATS_VIEWS.items():
+        op.execute(STATS_VIEW_SQL.format(name=name, area=area, area_name=area_name))
+        op.execute(STATS_INDEX_SQL.format(name=name, area_name=area_name))
@@ -0,0 +1,45 @@
+"""Add procedure data_year and row_hash
+
+Revision ID: b51f0c3e8a27
+Revises: 8d2e5b7a9c14
+Create Date: 2025-09-22 14:37:05.918342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b51f0c3e8a27'
+down_revision: Union[str, None] = '8d2e5b7a9c14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Rows loaded before this revision all come from MUP_INP_RY24_P03_V10_DY22_PrvSvc.csv
+EXISTING_DATA_YEAR = 2022
+
+
+def upgrade():
+    op.add_column('procedures', sa.Column('data_year', sa.Integer(), nullable=True))
+    op.add_column('procedures', sa.Column('row_hash', sa.String(), nullable=True))
+    op.execute(f"UPDATE procedures SET data_year = {EXISTING_DATA_YEAR}")
+    op.alter_column('procedures', 'data_year', existing_type=sa.Integer(), nullable=False)
+    # Earlier ETL re-runs inserted duplicates; keep the first copy of each row
+    op.execute("""
+        DELETE FROM procedures p
+        USING procedures keep
+        WHERE keep.provider_id = p.provider_id
+          AND keep.ms_drg_definition = p.ms_drg_definition
+          AND keep.data_year = p.data_year
+          AND keep.id < p.id
+    """)
+    op.create_unique_constraint(
+        'uq_procedures_provider_drg_year', 'procedures', ['provider_id', 'ms_drg_definition', 'data_year']
+    )
+
+def downgrade():
+    op.drop_constraint('uq_procedures_provider_drg_year', 'procedures', type_='unique')
+    op.drop_column('procedures', 'row_hash')
+    op.drop_column('procedures', 'data_year')
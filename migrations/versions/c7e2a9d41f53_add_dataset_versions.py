@@ -0,0 +1,32 @@
+"""Add dataset_versions
+
+Revision ID: c7e2a9d41f53
+Revises: b51f0c3e8a27
+Create Date: 2025-09-24 10:12:48.204917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e2a9d41f53'
+down_revision: Union[str, None] = 'b51f0c3e8a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table(
+        'dataset_versions',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('source', sa.String(), nullable=True),
+        sa.Column('loaded_at', sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    # Data loaded before this revision counts as version 1
+    op.execute("INSERT INTO dataset_versions (source) SELECT 'initial' WHERE EXISTS (SELECT 1 FROM procedures)")
+
+def downgrade():
+    op.drop_table('dataset_versions')
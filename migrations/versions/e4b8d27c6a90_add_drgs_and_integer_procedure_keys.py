@@ -0,0 +1,105 @@
+"""Add drgs dimension and integer procedure keys
+
+Revision ID: e4b8d27c6a90
+Revises: c7e2a9d41f53
+Create Date: 2025-09-25 09:41:17.530264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e4b8d27c6a90'
+down_revision: Union[str, None] = 'c7e2a9d41f53'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade():
+    op.create_table(
+        'drgs',
+        sa.Column('id', sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column('code', sa.String(), nullable=True),
+        sa.Column('description', sa.String(), nullable=False),
+        sa.Column(
+            'description_tsv', postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('english', coalesce(description, ''))", persisted=True)
+        ),
+        sa.UniqueConstraint('code', name='uq_drgs_code'),
+    )
+    op.create_index(
+        'ix_drgs_description_trgm', 'drgs', ['description'],
+        postgresql_using='gin', postgresql_ops={'description': 'gin_trgm_ops'}
+    )
+    op.create_index('ix_drgs_description_tsv', 'drgs', ['description_tsv'], postgresql_using='gin')
+    # Older loads kept no DRG_Cd; take it from a "039 - ..." prefix when there is one, the ETL fills the rest
+    op.execute("""
+        INSERT INTO drgs (code, description)
+        SELECT DISTINCT substring(ms_drg_definition from '^(\\d{3}) - '), ms_drg_definition
+        FROM procedures
+        WHERE ms_drg_definition IS NOT NULL
+    """)
+
+    op.add_column('procedures', sa.Column('drg_id', sa.Integer(), nullable=True))
+    op.add_column('procedures', sa.Column('provider_ref', sa.Integer(), nullable=True))
+    op.execute("UPDATE procedures p SET drg_id = d.id FROM drgs d WHERE d.description = p.ms_drg_definition")
+    op.execute("UPDATE procedures p SET provider_ref = pr.id FROM providers pr WHERE pr.provider_id = p.provider_id")
+    op.execute("DELETE FROM procedures WHERE drg_id IS NULL OR provider_ref IS NULL")
+
+    op.drop_constraint('uq_procedures_provider_drg_year', 'procedures', type_='unique')
+    op.drop_constraint('procedures_provider_id_fkey', 'procedures', type_='foreignkey')
+    op.drop_index('ix_procedures_ms_drg_tsv', table_name='procedures')
+    op.drop_index('ix_procedures_ms_drg_definition_trgm', table_name='procedures')
+    op.drop_index(op.f('ix_procedures_ms_drg_definition'), table_name='procedures')
+    op.drop_index(op.f('ix_procedures_provider_id'), table_name='procedures')
+    op.drop_column('procedures', 'ms_drg_tsv')
+    op.drop_column('procedures', 'ms_drg_definition')
+    op.drop_column('procedures', 'provider_id')
+    op.alter_column('procedures', 'provider_ref', new_column_name='provider_id', nullable=False)
+    op.alter_column('procedures', 'drg_id', existing_type=sa.Integer(), nullable=False)
+
+    op.create_foreign_key('procedures_provider_id_fkey', 'procedures', 'providers', ['provider_id'], ['id'])
+    op.create_foreign_key('procedures_drg_id_fkey', 'procedures', 'drgs', ['drg_id'], ['id'])
+    op.create_index(op.f('ix_procedures_provider_id'), 'procedures', ['provider_id'], unique=False)
+    op.create_index(op.f('ix_procedures_drg_id'), 'procedures', ['drg_id'], unique=False)
+    op.create_unique_constraint(
+        'uq_procedures_provider_drg_year', 'procedures', ['provider_id', 'drg_id', 'data_year']
+    )
+
+def downgrade():
+    op.drop_constraint('uq_procedures_provider_drg_year', 'procedures', type_='unique')
+    op.drop_constraint('procedures_drg_id_fkey', 'procedures', type_='foreignkey')
+    op.drop_constraint('procedures_provider_id_fkey', 'procedures', type_='foreignkey')
+    op.drop_index(op.f('ix_procedures_drg_id'), table_name='procedures')
+    op.drop_index(op.f('ix_procedures_provider_id'), table_name='procedures')
+    op.alter_column('procedures', 'provider_id', new_column_name='provider_ref')
+    op.add_column('procedures', sa.Column('provider_id', sa.String(), nullable=True))
+    op.add_column('procedures', sa.Column('ms_drg_definition', sa.String(), nullable=True))
+    op.execute("UPDATE procedures p SET provider_id = pr.provider_id FROM providers pr WHERE pr.id = p.provider_ref")
+    op.execute("UPDATE procedures p SET ms_drg_definition = d.description FROM drgs d WHERE d.id = p.drg_id")
+    op.drop_column('procedures', 'provider_ref')
+    op.drop_column('procedures', 'drg_id')
+    op.add_column('procedures', sa.Column(
+        'ms_drg_tsv', postgresql.TSVECTOR(),
+        sa.Computed("to_tsvector('english', coalesce(ms_drg_definition, ''))", persisted=True)
+    ))
+    op.create_foreign_key(
+        'procedures_provider_id_fkey', 'procedures', 'providers', ['provider_id'], ['provider_id']
+    )
+    op.create_index(op.f('ix_procedures_provider_id'), 'procedures', ['provider_id'], unique=False)
+    op.create_index(op.f('ix_procedures_ms_drg_definition'), 'procedures', ['ms_drg_definition'], unique=False)
+    op.create_index(
+        'ix_procedures_ms_drg_definition_trgm', 'procedures', ['ms_drg_definition'],
+        postgresql_using='gin', postgresql_ops={'ms_drg_definition': 'gin_trgm_ops'}
+    )
+    op.create_index('ix_procedures_ms_drg_tsv', 'procedures', ['ms_drg_tsv'], postgresql_using='gin')
+    op.create_unique_constraint(
+        'uq_procedures_provider_drg_year', 'procedures', ['provider_id', 'ms_drg_definition', 'data_year']
+    )
+    op.drop_index('ix_drgs_description_tsv', table_name='drgs')
+    op.drop_index('ix_drgs_description_trgm', table_name='drgs')
+    op.drop_table('drgs')
@@ -0,0 +1,60 @@
+"""Add drg_state_stats and drg_zip3_stats materialized views
+
+Revision ID: f3a9c5d1b284
+Revises: e4b8d27c6a90
+Create Date: 2025-09-29 09:41:17.530264
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3a9c5d1b284'
+down_revision: Union[str, None] = 'e4b8d27c6a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Frozen copy of the view definitions as of this revision; later changes to app/services/stats.py
+# must not change what this migration creates
+STATS_VIEW_SQL = """
+CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS
+SELECT
+    p.drg_id,
+    d.code AS drg_code,
+    d.description AS ms_drg_definition,
+    {area} AS {area_name},
+    p.data_year,
+    count(*) AS provider_count,
+    sum(p.total_discharges) AS total_discharges,
+    sum(p.average_total_payments * p.total_discharges) / nullif(sum(p.total_discharges), 0) AS mean_total_payments,
+    percentile_cont(0.25) WITHIN GROUP (ORDER BY p.average_total_payments) AS p25_total_payments,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY p.average_total_payments) AS median_total_payments,
+    percentile_cont(0.75) WITHIN GROUP (ORDER BY p.average_total_payments) AS p75_total_payments,
+    percentile_cont(0.9) WITHIN GROUP (ORDER BY p.average_total_payments) AS p90_total_payments,
+    min(p.average_total_payments) AS min_total_payments,
+    max(p.average_total_payments) AS max_total_payments,
+    sum(p.average_medicare_payments * p.total_discharges) / nullif(sum(p.total_discharges), 0) AS mean_medicare_payments,
+    sum(p.average_covered_charges * p.total_discharges) / nullif(sum(p.total_discharges), 0) AS mean_covered_charges
+FROM procedures p
+JOIN providers pr ON pr.id = p.provider_id
+JOIN drgs d ON d.id = p.drg_id
+GROUP BY p.drg_id, d.code, d.description, {area}, p.data_year
+"""
+STATS_INDEX_SQL = "CREATE UNIQUE INDEX IF NOT EXISTS uq_{name} ON {name} (drg_id, {area_name}, data_year)"
+STATS_VIEWS = {
+    "drg_state_stats": ("pr.state", "state"),
+    "drg_zip3_stats": ("left(pr.zip_code, 3)", "zip3"),
+}
+
+
+def upgrade():
+    # Created WITH DATA, so the first REFRESH ... CONCURRENTLY after an ETL run is allowed
+    for name, (area, area_name) in STATS_VIEWS.items():
+        op.execute(STATS_VIEW_SQL.format(name=name, area=area, area_name=area_name))
+        op.execute(STATS_INDEX_SQL.format(name=name, area_name=area_name))
+
+def downgrade():
+    for name in STATS_VIEWS:
+        op.execute(f"DROP MATERIALIZED VIEW IF EXISTS {name}")
@@ -1,74 +1,70 @@
 import sys
 import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-import csv
-import random
+import argparse
 import asyncio
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
-from sqlalchemy.orm import sessionmaker
-from app.db.models import Base, Provider, Procedure
+import logging
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy import text
+from app.db.models import Base
+from app.services.etl import copy_load, resolve_sources, rollback_load
+from app.services.stats import create_stats_views
+from app.services.sql_guard import grant_ask_role
 from dotenv import load_dotenv
 
 load_dotenv()
+logging.basicConfig(level=logging.INFO)
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 CSV_PATH = os.path.join(os.path.dirname(__file__), '../resources/MUP_INP_RY24_P03_V10_DY22_PrvSvc.csv')
-BATCH_SIZE = 1000
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load CMS inpatient CSVs (by provider and service, by provider, by DRG)")
+    parser.add_argument("csv_paths", nargs="*", default=[CSV_PATH],
+                        help="CSV files or quoted glob patterns, e.g. 'resources/MUP_INP_*_DY2?_*.csv'")
+    parser.add_argument("--year", type=int, help="CMS data year for every file (defaults to the DYxx in each file name)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only upsert/delete rows whose fingerprint changed for these data years")
+    parser.add_argument("--rollback", action="store_true",
+                        help="Swap back the tables replaced by the last full load, instead of loading")
+    return parser.parse_args()
 
 async def main():
-    engine = create_async_engine(DATABASE_URL, echo=True)
+    args = parse_args()
+    if args.rollback:
+        try:
+            version = await rollback_load(DATABASE_URL)
+        except ValueError as e:
+            raise SystemExit(str(e))
+        print(f"Rolled back to the previous dataset (version {version})")
+        return
+    try:
+        sources = resolve_sources(args.csv_paths, args.year)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    engine = create_async_engine(DATABASE_URL, echo=False)
     async with engine.begin() as conn:
+        # Trigram indexes on procedures need the extension before create_all
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
-    async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
-
-    providers = {}
-    procedures_batch = []
-    total_procedures = 0
-    with open(CSV_PATH, newline='', encoding='latin1') as csvfile:
-        reader = csv.DictReader(csvfile)
-        # print(f"CSV columns: {reader.fieldnames}")
-        required_columns = [
-            'Rndrng_Prvdr_CCN', 'Rndrng_Prvdr_Org_Name', 'Rndrng_Prvdr_City', 'Rndrng_Prvdr_St', 'Rndrng_Prvdr_Zip5',
-            'DRG_Desc', 'Tot_Dschrgs', 'Avg_Submtd_Cvrd_Chrg', 'Avg_Tot_Pymt_Amt', 'Avg_Mdcr_Pymt_Amt'
-        ]
-        missing = [col for col in required_columns if col not in reader.fieldnames]
-        if missing:
-            raise ValueError(f"Missing columns in CSV: {missing}")
-        async with async_session() as session:
-            for i, row in enumerate(reader):
-                pid = row['Rndrng_Prvdr_CCN']
-                if pid not in providers:
-                    providers[pid] = Provider(
-                        provider_id=pid,
-                        name=row['Rndrng_Prvdr_Org_Name'],
-                        city=row['Rndrng_Prvdr_City'],
-                        state=row['Rndrng_Prvdr_St'],
-                        zip_code=row['Rndrng_Prvdr_Zip5'],
-                        star_rating=random.uniform(1, 10)
-                    )
-                procedures_batch.append(Procedure(
-                    ms_drg_definition=row['DRG_Desc'],
-                    total_discharges=int(row['Tot_Dschrgs']),
-                    average_covered_charges=float(row['Avg_Submtd_Cvrd_Chrg']),
-                    average_total_payments=float(row['Avg_Tot_Pymt_Amt']),
-                    average_medicare_payments=float(row['Avg_Mdcr_Pymt_Amt']),
-                    provider=providers[pid]
-                ))
-                total_procedures += 1
-                # Batch insert every BATCH_SIZE records
-                if len(procedures_batch) >= BATCH_SIZE:
-                    session.add_all(procedures_batch)
-                    await session.flush()
-                    procedures_batch.clear()
-            # Insert any remaining procedures
-            if procedures_batch:
-                session.add_all(procedures_batch)
-                await session.flush()
-            # Insert all providers (if not already added)
-            session.add_all(providers.values())
-            await session.commit()
-    print(f"Inserted {len(providers)} providers and {total_procedures} procedures into the database.")
+        # Materialized views are not part of the metadata
+        raw = await conn.get_raw_connection()
+        await create_stats_views(raw.driver_connection)
+        await grant_ask_role(raw.driver_connection)
     await engine.dispose()
 
+    stats = await copy_load(DATABASE_URL, sources, incremental=args.incremental)
+    years = ", ".join(map(str, stats['data_years']))
+    if args.incremental:
+        print(
+            f"Data years {years}: {stats['inserted']} inserted, {stats['updated']} updated, "
+            f"{stats['deleted']} deleted out of {stats['rows']} rows"
+        )
+    print(
+        f"Loaded {stats['rows']} rows from {stats['files']} files ({stats['providers']} providers) in {stats['total_seconds']:.1f}s "
+        f"({stats['rows_per_sec']:,.0f} rows/sec; copy {stats['copy_seconds']:.1f}s, "
+        f"merge {stats['merge_seconds']:.1f}s, indexes {stats['index_seconds']:.1f}s, swap {stats['swap_seconds']:.1f}s)"
+    )
+
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,11 @@
+import os
+import pytest
+
+
+@pytest.fixture
+def database_url():
+    # Tests that need Postgres run against DATABASE_URL (loaded with the CMS data) and are skipped without it
+    url = os.getenv("DATABASE_URL")
+    if not url:
+        pytest.skip("DATABASE_URL is not set")
+    return url
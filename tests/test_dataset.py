@@ -0,0 +1,48 @@
+import asyncio
+import contextlib
+import pytest
+from app.services import dataset
+
+
+@pytest.fixture
+def database(monkeypatch):
+    # The versions and latest years the next polls read; listeners record the versions they were called with
+    state = {"version": None, "year": None, "calls": []}
+
+    async def fetch_version(session):
+        return state["version"]
+
+    async def fetch_latest_year(session):
+        return state["year"]
+
+    async def listener(version):
+        state["calls"].append(version)
+
+    monkeypatch.setattr(dataset, "get_sessionmaker", lambda: contextlib.nullcontext)
+    monkeypatch.setattr(dataset, "fetch_version", fetch_version)
+    monkeypatch.setattr(dataset, "fetch_latest_year", fetch_latest_year)
+    monkeypatch.setattr(dataset, "current_version", None)
+    monkeypatch.setattr(dataset, "latest_data_year", None)
+    monkeypatch.setattr(dataset, "_polled", False)
+    monkeypatch.setattr(dataset, "_listeners", [listener])
+    return state
+
+
+def test_first_poll_runs_the_listeners_without_a_version(database):
+    # A database loaded before dataset_versions existed: no version, but rows to serve
+    database["year"] = 2022
+    assert asyncio.run(dataset.refresh_version())
+    assert database["calls"] == [None]
+    assert dataset.latest_data_year == 2022
+    assert not asyncio.run(dataset.refresh_version())
+    assert database["calls"] == [None]
+
+
+def test_listeners_run_again_only_when_the_version_changes(database):
+    database["version"], database["year"] = 3, 2021
+    asyncio.run(dataset.refresh_version())
+    asyncio.run(dataset.refresh_version())
+    database["version"], database["year"] = 4, 2022
+    asyncio.run(dataset.refresh_version())
+    assert database["calls"] == [3, 4]
+    assert (dataset.current_version, dataset.latest_data_year) == (4, 2022)
@@ -0,0 +1,40 @@
+import asyncio
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.db.models import Drg
+from app.services.drg_search import drg_match, SIMILARITY_THRESHOLD
+
+# The planner must be able to answer each match_type from its index on drgs
+EXPECTED_INDEXES = {
+    "substring": ("CRANIOTOMY", "ix_drgs_description_trgm"),
+    "fuzzy": ("KRANIOTOMY", "ix_drgs_description_trgm"),
+    "fulltext": ("major joint", "ix_drgs_description_tsv"),
+}
+
+
+async def explain(database_url: str, match_type: str, drg: str):
+    drg_filter, _ = drg_match(match_type, drg)
+    engine = create_async_engine(database_url)
+    # Bound parameters, as the app sends them
+    compiled = select(Drg.id).where(drg_filter).compile(dialect=engine.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    try:
+        async with engine.connect() as conn:
+            trgm = await conn.scalar(text("SELECT count(*) FROM pg_extension WHERE extname = 'pg_trgm'"))
+            # drgs has a few hundred rows, which the planner would otherwise just scan
+            await conn.execute(text("SET LOCAL enable_seqscan = off"))
+            await conn.execute(text(f"SET LOCAL pg_trgm.similarity_threshold = {SIMILARITY_THRESHOLD}"))
+            plan = "\n".join((await conn.exec_driver_sql(f"EXPLAIN {compiled}", params)).scalars())
+    finally:
+        await engine.dispose()
+    return bool(trgm), plan
+
+
+@pytest.mark.parametrize("match_type", EXPECTED_INDEXES)
+def test_drg_match_uses_its_index(database_url, match_type):
+    drg, index = EXPECTED_INDEXES[match_type]
+    has_trgm, plan = asyncio.run(explain(database_url, match_type, drg))
+    if index.endswith("_trgm") and not has_trgm:
+        pytest.skip("pg_trgm is not installed")
+    assert f"Bitmap Index Scan on {index}" in plan, plan
@@ -0,0 +1,352 @@
+import asyncio
+import socket
+import threading
+import time
+import httpx
+import pytest
+import uvicorn
+from app.services import llm_client
+from benchmarks import llm_stub
+from app.services.llm_client import CircuitBreaker, LLMClient, LLMUnavailableError, TokenBucket
+
+MESSAGES = [{"role": "user", "content": "SELECT 1"}]
+
+
+def completion(content: str = "SELECT 1") -> httpx.Response:
+    return httpx.Response(200, json={
+        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "stub",
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": 3, "completion_tokens": 2, "total_tokens": 5},
+    })
+
+
+class StubBackend:
+    # Answers chat completions from a list of responses (the last one repeats) and records the calls
+    def __init__(self, *responses, delay: float = 0):
+        self.responses = list(responses) or [completion()]
+        self.delay = delay
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            return self.responses[min(self.calls, len(self.responses)) - 1]
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def settings(monkeypatch):
+    # Small limits so the tests run in milliseconds; LLMClient reads them when it is created or called
+    values = {
+        "OPENAI_BASE_URL": "http://llm.test/v1", "LLM_TIMEOUT": 1.0, "LLM_MAX_RETRIES": 3,
+        "LLM_BACKOFF_BASE": 0.01, "LLM_BACKOFF_MAX": 0.05, "LLM_MAX_CONCURRENCY": 16,
+        "LLM_RATE_LIMIT_PER_SEC": 1000.0, "LLM_RATE_LIMIT_BURST": 1000,
+        "LLM_BREAKER_FAILURES": 2, "LLM_BREAKER_RESET_SECONDS": 0.2,
+    }
+    for name, value in values.items():
+        monkeypatch.setattr(llm_client, name, value)
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    return values
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Backoff delays chosen by the client; the event loop still gets to run
+    recorded = []
+    real_sleep = asyncio.sleep
+
+    async def sleep(delay, *args):
+        recorded.append(delay)
+        await real_sleep(0)
+
+    monkeypatch.setattr(llm_client.asyncio, "sleep", sleep)
+    return recorded
+
+
+def run_with_client(backend, work):
+    async def main():
+        client = LLMClient(transport=httpx.MockTransport(backend))
+        try:
+            return await work(client)
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+def test_429_retry_after_is_honoured(settings, sleeps):
+    backend = StubBackend(httpx.Response(429, headers={"retry-after": "0.03"}, json={"error": {}}), completion())
+    response = run_with_client(backend, lambda client: client.chat(MESSAGES))
+    assert response.choices[0].message.content == "SELECT 1"
+    assert backend.calls == 2
+    assert sleeps == [0.03]
+
+
+def test_429_without_retry_after_backs_off_with_jitter(settings, sleeps, monkeypatch):
+    bounds = []
+    monkeypatch.setattr(llm_client.random, "uniform", lambda low, high: bounds.append((low, high)) or high / 2)
+    backend = StubBackend(*[httpx.Response(429, json={"error": {}})] * 3, completion())
+    run_with_client(backend, lambda client: client.chat(MESSAGES))
+    assert backend.calls == 4
+    # Full jitter: uniform between 0 and an exponentially growing cap, limited by LLM_BACKOFF_MAX
+    assert bounds == [(0, 0.01), (0, 0.02), (0, 0.04)]
+    assert sleeps == [0.005, 0.01, 0.02]
+
+
+def test_429_gives_up_after_the_retries_without_opening_the_breaker(settings, sleeps):
+    backend = StubBackend(httpx.Response(429, json={"error": {}}))
+
+    async def work(client):
+        with pytest.raises(LLMUnavailableError, match="rate limit"):
+            await client.chat(MESSAGES)
+        return client.breaker.state
+
+    assert run_with_client(backend, work) == "closed"
+    assert backend.calls == settings["LLM_MAX_RETRIES"] + 1
+
+
+def test_timeout_fails_fast_and_counts_against_the_breaker(settings, monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_TIMEOUT", 0.05)
+    backend = StubBackend(delay=1)
+
+    async def work(client):
+        start = time.perf_counter()
+        with pytest.raises(LLMUnavailableError, match="unavailable"):
+            await client.chat(MESSAGES)
+        return time.perf_counter() - start, client.breaker.failures
+
+    elapsed, failures = run_with_client(backend, work)
+    assert elapsed < 0.5
+    assert failures == 1
+    assert backend.calls == 1
+
+
+def test_breaker_opens_probes_and_recovers(settings):
+    backend = StubBackend(httpx.Response(500, json={"error": {}}), httpx.Response(500, json={"error": {}}), completion())
+
+    async def work(client):
+        for _ in range(2):
+            with pytest.raises(LLMUnavailableError):
+                await client.chat(MESSAGES)
+        assert client.breaker.state == "open"
+        # Open: rejected without reaching the backend
+        with pytest.raises(LLMUnavailableError, match="circuit is open"):
+            await client.chat(MESSAGES)
+        assert backend.calls == 2
+        await asyncio.sleep(settings["LLM_BREAKER_RESET_SECONDS"])
+        assert client.breaker.state == "half_open"
+        # Half open: one trial call goes through, concurrent ones are still rejected
+        backend.delay = 0.05
+        probe = asyncio.ensure_future(client.chat(MESSAGES))
+        await asyncio.sleep(0.01)
+        with pytest.raises(LLMUnavailableError, match="circuit is open"):
+            await client.chat(MESSAGES)
+        await probe
+        assert client.breaker.state == "closed"
+        await client.chat(MESSAGES)
+        return backend.calls
+
+    assert run_with_client(backend, work) == 4
+
+
+def test_failed_probe_reopens_the_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    time.sleep(0.05)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert not breaker.trial_in_flight
+
+
+def test_token_bucket_throttles_after_the_burst():
+    async def main():
+        bucket = TokenBucket(rate=50, capacity=3)
+        start = time.perf_counter()
+        for _ in range(3):
+            await bucket.acquire()
+        burst = time.perf_counter() - start
+        for _ in range(5):
+            await bucket.acquire()
+        return burst, time.perf_counter() - start
+
+    burst, total = asyncio.run(main())
+    assert burst < 0.02
+    # Five more tokens at 50 per second
+    assert 0.09 <= total < 0.5
+
+
+def test_client_calls_are_rate_limited(settings, monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_RATE_LIMIT_PER_SEC", 40.0)
+    monkeypatch.setattr(llm_client, "LLM_RATE_LIMIT_BURST", 2)
+    backend = StubBackend()
+
+    async def work(client):
+        start = time.perf_counter()
+        await asyncio.gather(*(client.chat(MESSAGES) for _ in range(6)))
+        return time.perf_counter() - start
+
+    assert run_with_client(backend, work) >= 0.09
+    assert backend.calls == 6
+
+
+def test_semaphore_bounds_concurrent_calls(settings, monkeypatch):
+    monkeypatch.setattr(llm_client, "LLM_MAX_CONCURRENCY", 3)
+    backend = StubBackend(delay=0.02)
+    run_with_client(backend, lambda client: asyncio.gather(*(client.chat(MESSAGES) for _ in range(12))))
+    assert backend.calls == 12
+    assert backend.max_in_flight == 3
+
+
+class StubServer:
+    # benchmarks/llm_stub.py served by uvicorn on an ephemeral port, in a thread with its own event loop
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.port = sock.getsockname()[1]
+        self.server = uvicorn.Server(uvicorn.Config(llm_stub.app, ws="none", log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, kwargs={"sockets": [sock]}, daemon=True)
+
+    def start(self):
+        self.thread.start()
+        deadline = time.monotonic() + 5
+        while not self.server.started:
+            assert time.monotonic() < deadline, "stub server did not start"
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(5)
+        self.sock.close()
+
+
+def bound_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+@pytest.fixture
+def stub_settings(settings, monkeypatch):
+    # An answer at once, unless a test asks for latency, 503s or 429s
+    for name, value in {"latency_ms": 0.0, "jitter_ms": 0.0, "error_rate": 0.0, "rate_limit_rate": 0.0}.items():
+        monkeypatch.setitem(llm_stub.settings, name, value)
+    return llm_stub.settings
+
+
+@pytest.fixture
+def stub_server(stub_settings, monkeypatch):
+    server = StubServer(bound_socket()).start()
+    monkeypatch.setattr(llm_client, "OPENAI_BASE_URL", f"http://127.0.0.1:{server.port}/v1")
+    yield server
+    server.stop()
+
+
+def run_against_server(work):
+    async def main():
+        client = LLMClient()
+        try:
+            return await work(client)
+        finally:
+            await client.aclose()
+    return asyncio.run(main())
+
+
+def test_stub_server_answers(stub_server):
+    question = [{"role": "user", "content": "Question: average cost of sepsis"}]
+    response = run_against_server(lambda client: client.chat(question))
+    assert "drg_state_stats" in response.choices[0].message.content
+
+
+def test_stub_server_429s_are_retried_after_retry_after(stub_server, stub_settings, monkeypatch):
+    monkeypatch.setitem(stub_settings, "rate_limit_rate", 1.0)
+    monkeypatch.setitem(stub_settings, "retry_after", 0.05)
+
+    async def work(client):
+        start = time.perf_counter()
+        with pytest.raises(LLMUnavailableError, match="rate limit"):
+            await client.chat(MESSAGES)
+        return time.perf_counter() - start, client.breaker.state
+
+    elapsed, state = run_against_server(work)
+    # Three waits of the server's Retry-After between the four attempts, and a healthy breaker
+    assert elapsed >= 0.15
+    assert state == "closed"
+
+
+def test_stub_server_timeout_fails_fast(stub_server, stub_settings, monkeypatch):
+    monkeypatch.setitem(stub_settings, "latency_ms", 1000.0)
+    monkeypatch.setattr(llm_client, "LLM_TIMEOUT", 0.1)
+
+    async def work(client):
+        start = time.perf_counter()
+        with pytest.raises(LLMUnavailableError, match="unavailable"):
+            await client.chat(MESSAGES)
+        return time.perf_counter() - start, client.breaker.failures
+
+    elapsed, failures = run_against_server(work)
+    # Not retried: a slow backend would only get slower
+    assert elapsed < 0.5
+    assert failures == 1
+
+
+def test_stub_server_503s_open_the_breaker_until_it_recovers(stub_server, stub_settings, monkeypatch, settings):
+    monkeypatch.setitem(stub_settings, "error_rate", 1.0)
+
+    async def work(client):
+        for _ in range(2):
+            with pytest.raises(LLMUnavailableError, match="unavailable"):
+                await client.chat(MESSAGES)
+        with pytest.raises(LLMUnavailableError, match="circuit is open"):
+            await client.chat(MESSAGES)
+        stub_settings["error_rate"] = 0.0
+        await asyncio.sleep(settings["LLM_BREAKER_RESET_SECONDS"])
+        await client.chat(MESSAGES)
+        return client.breaker.state
+
+    assert run_against_server(work) == "closed"
+
+
+def test_refused_connections_are_retried_until_the_server_is_up(stub_settings, monkeypatch):
+    # Nothing listens on the port until the client's first backoff, which starts the stub there
+    sock = bound_socket()
+    monkeypatch.setattr(llm_client, "OPENAI_BASE_URL", f"http://127.0.0.1:{sock.getsockname()[1]}/v1")
+    server = StubServer(sock)
+    real_sleep = llm_client.asyncio.sleep
+
+    async def start_server_then_sleep(delay, *args):
+        if not server.thread.is_alive():
+            server.start()
+        await real_sleep(delay)
+
+    monkeypatch.setattr(llm_client.asyncio, "sleep", start_server_then_sleep)
+    try:
+        response = run_against_server(lambda client: client.chat(MESSAGES))
+    finally:
+        server.stop()
+    assert response.choices[0].message.content
+
+
+def test_refused_connections_give_up_after_the_retries(stub_settings, settings, sleeps, monkeypatch):
+    sock = bound_socket()
+    port = sock.getsockname()[1]
+    sock.close()
+    monkeypatch.setattr(llm_client, "OPENAI_BASE_URL", f"http://127.0.0.1:{port}/v1")
+    monkeypatch.setattr(llm_client, "LLM_BREAKER_FAILURES", 10)
+
+    async def work(client):
+        with pytest.raises(LLMUnavailableError, match="unavailable"):
+            await client.chat(MESSAGES)
+        return client.breaker.failures
+
+    assert run_against_server(work) == settings["LLM_MAX_RETRIES"] + 1
+    assert len(sleeps) == settings["LLM_MAX_RETRIES"]
@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from app.api.providers import resolve_year, search_batch, search_providers
+from app.db.models import Procedure, Provider
+from app.services import dataset
+
+
+def search(zip_code: str, year=None, **overrides):
+    params = dict(
+        drg="heart failure", zip=zip_code, radius_km=200, match_type="substring", sort="price", year=year, limit=5,
+    )
+    return {**params, **overrides}
+
+
+async def compare(database_url: str, make_searches):
+    # (batch page, GET /providers page) per search
+    engine = create_async_engine(database_url)
+    try:
+        async with async_sessionmaker(engine)() as session:
+            zip_code, year = (await session.execute(
+                select(Provider.zip_code, Procedure.data_year).join(Provider.procedures).limit(1)
+            )).one()
+            searches = make_searches(zip_code, year)
+            batch = await search_batch(session, searches)
+            # GET /providers resolves a missing year before searching
+            single = [
+                await search_providers(session, **{**params, "year": resolve_year(params["year"])}) for params in searches
+            ]
+    finally:
+        await engine.dispose()
+    return batch, single
+
+
+def test_batch_without_a_latest_year_searches_every_year(database_url, monkeypatch):
+    # No dataset_versions row yet, or before the first poll: like GET /providers, no year filter
+    monkeypatch.setattr(dataset, "latest_data_year", None)
+    batch, single = asyncio.run(compare(database_url, lambda zip_code, year: [
+        search(zip_code), search(zip_code, sort="distance"),
+    ]))
+    assert all(providers for providers, _ in batch)
+    assert batch == single
+
+
+def test_batch_mixes_items_with_and_without_a_year(database_url, monkeypatch):
+    monkeypatch.setattr(dataset, "latest_data_year", None)
+    batch, single = asyncio.run(compare(database_url, lambda zip_code, year: [
+        search(zip_code), search(zip_code, year=year), search(zip_code, year=1900),
+    ]))
+    assert batch[0][0] and batch[1][0]
+    assert batch[2] == ([], None)
+    assert batch == single
+
+
+def test_batch_with_the_latest_year(database_url, monkeypatch):
+    monkeypatch.setattr(dataset, "latest_data_year", None)
+
+    def searches(zip_code, year):
+        dataset.latest_data_year = year
+        return [search(zip_code), search(zip_code, year=year, match_type="fulltext")]
+
+    batch, single = asyncio.run(compare(database_url, searches))
+    assert all(providers for providers, _ in batch)
+    assert batch == single
@@ -0,0 +1,166 @@
+import asyncio
+import itertools
+import os
+import pytest
+from sqlalchemy import text
+from app.db import session
+from app.db.session import Replica, get_read_sessionmaker
+
+PRIMARY = object()
+
+
+def replica(name: str, available: bool = True, version: int = 1, lag: float = 0):
+    # No server behind the URL: the engine only connects on first use, and status() is stubbed
+    stub = Replica(f"postgresql+asyncpg://hcn@{name}/hcn")
+    stub.available, stub.version, stub.lag_seconds = available, version, lag
+    stub.checkedout = 0
+    stub.engine.pool.checkedout = lambda: stub.checkedout
+    return stub
+
+
+@pytest.fixture
+def routing(monkeypatch):
+    # Installs stub replicas in front of a stand-in primary sessionmaker
+    def install(*stubs, selection: str = "round_robin"):
+        monkeypatch.setattr(session, "async_session", PRIMARY)
+        monkeypatch.setattr(session, "replicas", list(stubs))
+        monkeypatch.setattr(session, "_round_robin", itertools.count())
+        monkeypatch.setattr(session, "DB_REPLICA_SELECTION", selection)
+        return stubs
+    return install
+
+
+def targets(count: int, min_version=None):
+    names = {id(stub.sessionmaker): stub.name for stub in session.replicas}
+    picked = [get_read_sessionmaker(min_version) for _ in range(count)]
+    return ["primary" if maker is PRIMARY else names[id(maker)] for maker in picked]
+
+
+def test_round_robin_rotates_over_the_replicas(routing):
+    a, b, c = routing(replica("a"), replica("b"), replica("c"))
+    assert targets(6) == [a.name, b.name, c.name] * 2
+
+
+def test_least_connections_picks_the_least_busy_replica(routing):
+    a, b, c = routing(replica("a"), replica("b"), replica("c"), selection="least_connections")
+    a.checkedout, b.checkedout, c.checkedout = 4, 1, 3
+    assert targets(3) == [b.name] * 3
+    # Ties are spread instead of always landing on the first replica
+    b.checkedout = 3
+    assert set(targets(6)) == {b.name, c.name}
+
+
+def test_unavailable_replicas_are_skipped(routing):
+    a, b = routing(replica("a"), replica("b", available=False))
+    assert targets(3) == [a.name] * 3
+
+
+def test_falls_back_to_the_primary_without_a_healthy_replica(routing):
+    routing(replica("a", available=False), replica("b", available=False))
+    assert targets(2) == ["primary", "primary"]
+    routing()
+    assert targets(1) == ["primary"]
+
+
+def test_min_version_skips_replicas_that_have_not_loaded_it(routing):
+    a, b = routing(replica("a", version=3), replica("b", version=4))
+    assert targets(2, min_version=4) == [b.name, b.name]
+    assert targets(1, min_version=5) == ["primary"]
+    # A replica that has not reported a version yet only serves unversioned reads
+    b.version = None
+    assert targets(1, min_version=1) == [a.name]
+    assert set(targets(2)) == {a.name, b.name}
+
+
+def test_get_read_sessionmaker_requires_an_engine(monkeypatch):
+    monkeypatch.setattr(session, "async_session", None)
+    monkeypatch.setattr(session, "replicas", [])
+    with pytest.raises(RuntimeError, match="not initialized"):
+        get_read_sessionmaker()
+
+
+@pytest.fixture
+def health(monkeypatch):
+    # Answers Replica.status() from a queue of (lag_seconds, version) rows or exceptions
+    monkeypatch.setattr(session, "DB_REPLICA_MAX_LAG_SECONDS", 30.0)
+    monkeypatch.setattr(session, "DB_REPLICA_CHECK_TIMEOUT", 0.05)
+
+    def stub(target: Replica, *results):
+        queue = list(results)
+
+        async def status():
+            result = queue.pop(0)
+            if isinstance(result, BaseException):
+                raise result
+            if result == "hang":
+                await asyncio.sleep(1)
+            return result
+
+        target.status = status
+        return target
+    return stub
+
+
+def test_lagging_replica_is_ejected_until_it_catches_up(routing, health):
+    a, b = routing(replica("a"), replica("b"))
+    health(b, (2.0, 1), (45.0, 1), (None, 1), (5.0, 2))
+    asyncio.run(b.check())
+    assert b.available and b.lag_seconds == 2.0
+    asyncio.run(b.check())
+    assert not b.available and b.lag_seconds == 45.0
+    assert targets(2) == [a.name, a.name]
+    # Unknown lag (nothing replayed yet) is not trusted either
+    asyncio.run(b.check())
+    assert not b.available
+    asyncio.run(b.check())
+    assert b.available and b.version == 2
+    assert set(targets(2)) == {a.name, b.name}
+
+
+def test_unreachable_replica_is_ejected_until_it_answers(routing, health):
+    (a,) = routing(replica("a"))
+    health(a, ConnectionRefusedError("connection refused"), "hang", (0.0, 1))
+    asyncio.run(a.check())
+    assert not a.available and a.version is None
+    assert targets(1) == ["primary"]
+    # A check that outlasts DB_REPLICA_CHECK_TIMEOUT counts as a failure
+    a.available = True
+    asyncio.run(a.check())
+    assert not a.available
+    asyncio.run(a.check())
+    assert a.available
+    assert targets(1) == [a.name]
+
+
+def test_new_replicas_wait_for_their_first_check():
+    stub = Replica("postgresql+asyncpg://hcn@a/hcn")
+    assert not stub.available
+
+
+def test_routes_reads_between_a_primary_and_a_replica(database_url):
+    # Optional: DATABASE_REPLICA_URLS names a streaming replica of DATABASE_URL, e.g. one cloned with pg_basebackup -R
+    replica_urls = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+    if not replica_urls:
+        pytest.skip("DATABASE_REPLICA_URLS is not set")
+
+    async def in_recovery(maker):
+        async with maker() as db:
+            return await db.scalar(text("SELECT pg_is_in_recovery()"))
+
+    async def main():
+        session.init_engine(database_url, replica_urls)
+        try:
+            await session.check_replicas()
+            assert all(stub.available for stub in session.replicas)
+            for _ in replica_urls:
+                assert await in_recovery(get_read_sessionmaker())
+            # Reads that need a newer dataset than any replica has loaded stay on the primary
+            newest = max(stub.version or 0 for stub in session.replicas)
+            assert not await in_recovery(get_read_sessionmaker(min_version=newest + 1))
+            for stub in session.replicas:
+                stub.available = False
+            assert not await in_recovery(get_read_sessionmaker())
+        finally:
+            await session.dispose_engine()
+
+    asyncio.run(main())
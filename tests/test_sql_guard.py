@@ -0,0 +1,164 @@
+import asyncio
+import asyncpg
+import pytest
+import sqlglot
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+from app.services import sql_guard
+from app.services.sql_guard import UnsafeSQLError, validate_sql
+
+
+def row_cap(sql: str):
+    limit = sqlglot.parse_one(sql, read="postgres").args.get("limit")
+    return int(limit.expression.this)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT query_to_xml('select * from pg_authid', true, false, '')",
+    "SELECT table_to_xml('dataset_versions', true, false, '')",
+    "SELECT lo_get(1234)",
+    "SELECT current_setting('data_directory')",
+    "SELECT pg_read_file('/etc/passwd')",
+    "SELECT pg_sleep(10)",
+    "SELECT set_config('role', 'postgres', false)",
+    "SELECT pg_catalog.current_setting('data_directory')",
+    "SELECT pg_catalog.lower(name) FROM providers",
+    "SELECT name FROM providers WHERE id = (SELECT length(current_setting('data_directory')))",
+    "SELECT current_user",
+])
+def test_rejects_functions_outside_the_allowlist(sql):
+    with pytest.raises(UnsafeSQLError, match="function"):
+        validate_sql(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT 1; SELECT 2",
+    "SELECT * FROM providers; DROP TABLE providers",
+    "SELECT * FROM providers LIMIT 5; DELETE FROM procedures",
+])
+def test_rejects_multiple_statements(sql):
+    with pytest.raises(UnsafeSQLError, match="one statement"):
+        validate_sql(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "INSERT INTO providers (id) VALUES (1)",
+    "UPDATE procedures SET average_total_payments = 0",
+    "DELETE FROM drgs",
+    "DROP TABLE providers",
+    "CREATE TABLE x (id int)",
+    "ALTER TABLE providers ADD COLUMN x int",
+    "TRUNCATE procedures",
+    "COPY providers TO '/tmp/providers.csv'",
+    "GRANT SELECT ON providers TO public",
+    "SET ROLE postgres",
+    "SELECT * INTO stolen FROM providers",
+    "SELECT * FROM providers FOR UPDATE",
+    "WITH gone AS (DELETE FROM procedures RETURNING *) SELECT * FROM gone",
+])
+def test_rejects_writes_and_ddl(sql):
+    with pytest.raises(UnsafeSQLError):
+        validate_sql(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM dataset_versions",
+    "SELECT * FROM pg_authid",
+    "SELECT * FROM pg_catalog.pg_authid",
+    "SELECT * FROM information_schema.tables",
+    "SELECT * FROM etl_previous.providers",
+    "SELECT * FROM hcn.public.providers",
+    "SELECT * FROM zip_centroids",
+    "SELECT * FROM query_to_xml('select 1', true, false, '')",
+    "SELECT (SELECT max(id) FROM dataset_versions) AS version",
+    "SELECT name FROM providers WHERE id IN (SELECT id FROM dataset_versions)",
+    "SELECT * FROM providers p JOIN LATERAL (SELECT * FROM pg_roles) r ON true",
+    "WITH v AS (SELECT * FROM dataset_versions) SELECT * FROM v",
+    "WITH p AS (SELECT * FROM providers) SELECT * FROM p UNION ALL SELECT 1, 'x' FROM pg_shadow",
+    # A CTE is not a table of the same name outside its scope, nor inside its own definition
+    "WITH dataset_versions AS (SELECT * FROM dataset_versions) SELECT * FROM dataset_versions",
+    "SELECT * FROM dataset_versions, (WITH dataset_versions AS (SELECT 1) SELECT * FROM dataset_versions) s",
+    "WITH a AS (SELECT * FROM b), b AS (SELECT * FROM providers) SELECT * FROM a",
+    "WITH x AS (SELECT 1) SELECT * FROM public.x",
+])
+def test_rejects_tables_outside_the_whitelist(sql):
+    with pytest.raises(UnsafeSQLError, match="table|schema"):
+        validate_sql(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT pr.name, p.average_total_payments FROM procedures p JOIN providers pr ON pr.id = p.provider_id "
+    "JOIN drgs d ON d.id = p.drg_id WHERE d.description % 'hart failure' "
+    "ORDER BY similarity(d.description, 'hart failure') DESC LIMIT 5",
+    "SELECT d.description AS ms_drg_definition, round(avg(p.average_total_payments)::numeric, 2) "
+    "FROM procedures p JOIN drgs d ON d.id = p.drg_id "
+    "WHERE d.description_tsv @@ plainto_tsquery('english', 'heart failure') GROUP BY d.description LIMIT 10",
+    "SELECT state, median_total_payments FROM drg_state_stats WHERE data_year = 2022 LIMIT 5",
+    "WITH ranked AS (SELECT provider_id, rank() OVER (ORDER BY average_total_payments) AS r FROM procedures) "
+    "SELECT * FROM ranked WHERE r <= 3 LIMIT 3",
+    "WITH a AS (SELECT id FROM providers), b AS (SELECT * FROM a) SELECT * FROM b LIMIT 5",
+    "WITH RECURSIVE n AS (SELECT 1 AS i UNION ALL SELECT i + 1 FROM n WHERE i < 5) SELECT * FROM n",
+    "SELECT sum(mean_total_payments * total_discharges) / sum(total_discharges) FROM drg_state_stats LIMIT 1",
+    "SELECT * FROM public.providers WHERE lower(city) LIKE '%york%' AND upper(state) = 'NY' LIMIT 5",
+])
+def test_accepts_generated_queries(sql):
+    assert validate_sql(sql)
+
+
+def test_keeps_a_limit_within_the_cap():
+    sql = "SELECT * FROM providers LIMIT 5"
+    assert validate_sql(sql, max_rows=100) == sql
+    assert validate_sql(sql + ";", max_rows=100) == sql
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM providers",
+    "SELECT * FROM providers LIMIT 100000",
+    "SELECT * FROM providers LIMIT ALL",
+    "SELECT * FROM providers LIMIT (SELECT 100000)",
+    "SELECT * FROM providers LIMIT 5 + 100000",
+    "SELECT * FROM providers FETCH FIRST 100000 ROWS ONLY",
+    "SELECT * FROM providers WHERE id IN (SELECT provider_id FROM procedures LIMIT 5)",
+    "(SELECT * FROM providers LIMIT 5) UNION ALL (SELECT * FROM providers)",
+    "SELECT * FROM providers -- LIMIT 5",
+    "SELECT * FROM providers /* LIMIT 5 */",
+])
+def test_caps_rows(sql):
+    guarded = validate_sql(sql, max_rows=100)
+    assert guarded.startswith("SELECT * FROM (")
+    assert row_cap(guarded) == 100
+
+
+def test_line_comment_cannot_swallow_the_cap():
+    guarded = validate_sql("SELECT * FROM providers --", max_rows=100)
+    assert guarded.splitlines()[-1] == ") AS guarded LIMIT 100"
+
+
+def test_rejects_unparsable_sql():
+    with pytest.raises(UnsafeSQLError):
+        validate_sql("SELECT * FROM (providers")
+
+
+def test_ask_role_only_reads_the_whitelist(database_url):
+    # Second line of defence: what validate_sql lets through runs as ASK_DB_ROLE
+    if not sql_guard.ASK_DB_ROLE:
+        pytest.skip("ASK_DB_ROLE is empty")
+
+    async def run(sql):
+        engine = create_async_engine(database_url)
+        try:
+            async with engine.connect() as conn:
+                await sql_guard.prepare_session(conn)
+                return (await conn.execute(text(sql))).scalar()
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(run("SELECT current_user")) == sql_guard.ASK_DB_ROLE
+    assert asyncio.run(run("SELECT count(*) FROM drgs")) >= 0
+    for sql in ("SELECT count(*) FROM dataset_versions", "SELECT current_setting('data_directory')"):
+        # SQLSTATE 42501 rather than the message, whose wording differs between Postgres versions
+        with pytest.raises(DBAPIError) as denied:
+            asyncio.run(run(sql))
+        assert isinstance(denied.value.orig.__cause__, asyncpg.exceptions.InsufficientPrivilegeError)
+        assert denied.value.orig.__cause__.sqlstate == "42501"